@@ -1,14 +1,22 @@
 import streamlit as st
-from code_editor import code_editor
 
 from argparse import ArgumentParser
 
-from util.invoke import Bedrock, BedrockAgent, KnowledgeBase
-from util.assets import download_button, read_image, download_cfn
+from util.invoke import (
+    Bedrock,
+    BedrockAgent,
+    DirectPipeline,
+    KnowledgeBase,
+    client_stats,
+    parameter_stats,
+    refresh_parameters,
+)
+from util.assets import download_cfn, preprocess_upload, read_thumbnails, render_history
 
 parser = ArgumentParser()
 parser.add_argument("--environmentName", type=str, default=None)
 parser.add_argument("--GitURL", type=str, default=None)
+parser.add_argument("--pipeline", type=str, choices=("agent", "direct"), default="agent")
 
 args = parser.parse_args()
 
@@ -29,14 +37,31 @@ Top_P = st.sidebar.slider("Top P", min_value=0.0, max_value=1.0, step=0.001, val
 Top_K = st.sidebar.slider("Top K", min_value=0, max_value=500, step=1, value=250)
 
 bedrock = Bedrock(
-    inference_params={"temperature": Temperature, "top_p": Top_P, "top_k": Top_K}
+    inference_params={"temperature": Temperature, "top_p": Top_P, "top_k": Top_K},
+    environmentName=environmentName,
 )
-agent = BedrockAgent(environmentName=environmentName)
 knowledgebase = KnowledgeBase(environmentName=environmentName)
+if args.pipeline == "direct":
+    # Runs the agent actions in-process, without Bedrock Agent orchestration.
+    agent = DirectPipeline(environmentName=environmentName, knowledgebase=knowledgebase)
+else:
+    agent = BedrockAgent(environmentName=environmentName)
 
 st.sidebar.subheader("Session ID")
 st.sidebar.code(agent.get_session_id())    
 
+with st.sidebar.expander("AWS client pool"):
+    st.json(client_stats())
+
+with st.sidebar.expander("SSM parameters"):
+    if st.button("Reload", key="reload-parameters"):
+        # Picks up updated stack parameters without waiting for the TTL.
+        refresh_parameters(environmentName)
+    st.json(parameter_stats())
+
+with st.sidebar.expander("Model routes"):
+    st.json(bedrock.router.stats())
+
 
 warning = st.container()
 
@@ -57,6 +82,8 @@ with heading_button_left:
 
         if "metadata_uri" in st.session_state:
             del st.session_state["metadata_uri"]
+        if "metadata_session" in st.session_state:
+            del st.session_state["metadata_session"]
 
         if "user_edit_done" in st.session_state:
             del st.session_state["user_edit_done"]
@@ -123,7 +150,7 @@ if st.session_state["uploaded_file"] is not None:
     image_col, explain_col = st.columns((5, 5))
 
     with image_col:
-        st.image(st.session_state["uploaded_file"].getvalue())
+        st.image(preprocess_upload(st.session_state["uploaded_file"])[0])
 
     with explain_col:
         explain_placeholder = st.empty()
@@ -161,124 +188,12 @@ if st.session_state["uploaded_file"] is not None:
 if "user_edit_done" in st.session_state and "explain" in st.session_state:
     if "chat_history" in st.session_state:
 
-        for index, chat in enumerate(st.session_state["chat_history"]):
-            with st.chat_message(chat["role"]):
-                if chat["role"] == "assistant":
-                    
-                    for trace in chat["trace"]:
-                        with st.expander(trace["heading"]):
-                            if (
-                                "rationale" in trace["category"]
-                                or "failureTrace" in trace["category"]
-                            ):
-                                st.write(trace["content"])
-                            else:
-                                st.code(trace["content"])
-                                
-                                
-                    if index == len(st.session_state["chat_history"]) - 1:
-
-                        # with col1:
-                        custom_btns = [
-                            {
-                                "name": "Copy",
-                                "feather": "Copy",
-                                "hasText": True,
-                                "alwaysOn": True,
-                                "commands": [
-                                    "copyAll",
-                                    [
-                                        "infoMessage",
-                                        {
-                                            "text": "Copied to clipboard!",
-                                            "timeout": 2500,
-                                            "classToggle": "show",
-                                        },
-                                    ],
-                                ],
-                                "style": {"top": "0.46rem", "right": "0.4rem"},
-                            },
-                            {
-                                "name": "Submit",
-                                "feather": "Play",
-                                "primary": True,
-                                "hasText": True,
-                                "showWithIcon": True,
-                                "commands": ["submit"],
-                                "style": {"bottom": "0.44rem", "right": "0.4rem"},
-                            },
-                        ]
-
-                        response_dict = code_editor(
-                            chat["prompt"].replace("```yaml", ""),
-                            # focus=True,
-                            theme="dark",
-                            buttons=custom_btns,
-                            key=index,
-                            options={"wrap": False},
-                        )
-
-                        if (
-                            response_dict["type"] == "submit"
-                            and response_dict["text"]
-                        ):
-                            
-                            st.session_state["chat_history"][index]["prompt"] = (
-                                "```yaml" + response_dict["text"]
-                            )
-
-                            st.session_state["chat_history"][index]["is_valid"] = None
-                            
-                            knowledgebase.put_generated_cloudformation(
-                                sessionId=agent.get_session_id(), template=response_dict["text"]
-                            )
-    
-                    else:
-                        # with col1:
-                        custom_btns = [
-                            {
-                                "name": "Copy",
-                                "feather": "Copy",
-                                "hasText": True,
-                                "alwaysOn": True,
-                                "commands": [
-                                    "copyAll",
-                                    [
-                                        "infoMessage",
-                                        {
-                                            "text": "Copied to clipboard!",
-                                            "timeout": 2500,
-                                            "classToggle": "show",
-                                        },
-                                    ],
-                                ],
-                                # "style": {"top": "0.46rem", "right": "0.4rem"},
-                            }
-                        ]
-
-                        response_dict = code_editor(
-                            chat["prompt"].replace("```yaml", ""),
-                            # focus=True,
-                            theme="light",
-                            buttons=custom_btns,
-                            key=index,
-                            options={"wrap": False},
-                        )
-
-                        # col1.markdown(chat["prompt"], unsafe_allow_html=True)
-                    
-                    if chat["is_valid"]:
-                        st.success("CloudFormation template is valid!")
-                    elif chat["is_valid"] is False:
-                        st.error("CloudFormation template is not valid!")
-                    else:
-                        st.warning(
-                            "Unable to determine if CloudFormation template is valid or not!"
-                        )
-                    
-
-                else:
-                    st.markdown(chat["prompt"])
+        def submit_template(template):
+            knowledgebase.put_generated_cloudformation(
+                sessionId=agent.get_session_id(), template=template
+            )
+
+        render_history(st.session_state["chat_history"], on_submit=submit_template)
 
     if "chat_history" not in st.session_state or not st.session_state["chat_history"]:
 
@@ -341,17 +256,29 @@ if "user_edit_done" in st.session_state and "explain" in st.session_state:
 
                 st.rerun()
 
-    st.session_state["metadata_uri"] = knowledgebase.retrieve_metadata(
-        query=st.session_state["explain"], sessionId=agent.get_session_id()
-    )
+    # The documents retrieved for a session do not change, they are read once per session instead of every rerun.
+    if st.session_state.get("metadata_session") != agent.get_session_id():
+        st.session_state["metadata_uri"] = knowledgebase.retrieve_metadata(
+            query=st.session_state["explain"], sessionId=agent.get_session_id()
+        )
+        st.session_state["metadata_session"] = agent.get_session_id()
     with st.sidebar:
         st.header("Knowledge Base")
-        for uri in st.session_state["metadata_uri"]:
+        thumbnails = read_thumbnails(
+            [uri["architecture_image"] for uri in st.session_state["metadata_uri"]]
+        )
+        for index, (uri, thumbnail) in enumerate(
+            zip(st.session_state["metadata_uri"], thumbnails)
+        ):
             with st.container(border=True):
-                st.image(read_image(uri["architecture_image"]), width=300)
-                download_button_str = download_button(
-                    button_text="Download",
-                    object_to_download=download_cfn(uri["cfn_stack"]),
-                    download_filename="data.yaml",
+                if thumbnail is not None:
+                    st.image(thumbnail, width=300)
+                # The template is only downloaded from S3 when the button is clicked.
+                st.download_button(
+                    label="Download",
+                    data=lambda s3_path=uri["cfn_stack"]: download_cfn(s3_path) or b"",
+                    file_name="data.yaml",
+                    mime="text/yaml",
+                    key=f"knowledge-base-download-{index}",
+                    on_click="ignore",
                 )
-                st.markdown(download_button_str, unsafe_allow_html=True)
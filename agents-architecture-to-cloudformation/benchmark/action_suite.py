@@ -0,0 +1,342 @@
+"""
+Benchmarks every apiPath of the action group Lambda through lambda_handler, offline.
+
+Each run is a new session of a warm container driving the actions in the order of the agent: generate, reiterate,
+validate, update and resolve. The Lambda (util/agent/lambda.py, imported as in the Lambda zip) runs against the
+in-memory stand-ins of Bedrock, the knowledge base, S3, CloudFormation and DynamoDB, with injected round-trip
+latencies and payload sizes:
+
+- the model answers with a synthetic template of --template-resources resources, or the --template-file recorded
+  from a real session, a different Description every run so validation results are not reused across sessions;
+- the knowledge base returns --examples example templates of --example-resources resources each from S3, the
+  example cache of the warm container serves them from memory after the first session;
+- the architecture explanation is --explain-chars characters long.
+
+Every stand-in call is timed into its stage (bedrock-runtime, bedrock-agent-runtime, s3, cloudformation, dynamodb),
+"local" is the rest of the action: prompts, local validation, compression. Stages overlap when the example
+downloads run concurrently. Allocated memory is the tracemalloc peak of one extra run per action, so tracing does
+not slow down the timed runs. The client-side Bedrock rate limit is raised to --requests-per-minute, the runs are
+back to back and would otherwise measure the wait for the quota.
+
+The results are written with --json; --compare reads the results of a previous release and reports the p50
+change per action, exiting with status 1 if an action is slower than --threshold percent.
+
+Run from agents-architecture-to-cloudformation/:
+
+    python -m benchmark.action_suite --runs 20 --model-ms 40 --storage-ms 5 --json results.json
+    python -m benchmark.action_suite --runs 20 --model-ms 40 --storage-ms 5 --compare results.json
+"""
+
+from argparse import ArgumentParser
+from collections import Counter
+import importlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path[:0] = [os.path.join(APP_DIR, "util", "agent"), os.path.join(APP_DIR, "util", "prompt_templates")]
+os.environ.setdefault("KnowledgeBaseId", "benchmark")
+os.environ.setdefault("EnvironmentName", "bench")
+os.environ.setdefault("BedrockModelId", "anthropic.claude-3-sonnet-20240229-v1:0")
+
+from benchmark.standins import (
+    LocalAgentRuntime,
+    LocalBedrockRuntime,
+    LocalCloudFormation,
+    LocalS3,
+    LocalTable,
+    synthetic_template,
+)
+from util.agent.example_cache import ExampleCache
+
+SENTENCE = (
+    "A static website is served by Amazon CloudFront from an S3 bucket. An API Gateway REST API invokes Lambda "
+    "functions that store orders in a DynamoDB table and publish them to an SQS queue. "
+)
+ACTIONS = [
+    ("/generateCloudFormation", "architectureExplanation"),
+    ("/reiterateCloudFormation", None),
+    ("/validateCloudFormation", None),
+    ("/updateCloudFormation", "updateInstruction"),
+    ("/resolveCloudFormation", "cloudformationInstruction"),
+]
+PARAMETERS = {
+    "updateInstruction": "Add a dead-letter queue to the SQS queue.",
+    "cloudformationInstruction": "Template format error: Unresolved resource dependencies [Bucket] in the Outputs block",
+}
+STAGES = ("bedrock-runtime", "bedrock-agent-runtime", "s3", "cloudformation", "dynamodb", "local")
+
+parser = ArgumentParser()
+parser.add_argument("--runs", type=int, default=20)
+parser.add_argument("--model-ms", type=float, default=40.0)
+parser.add_argument("--retrieve-ms", type=float, default=20.0)
+parser.add_argument("--s3-ms", type=float, default=10.0)
+parser.add_argument("--validate-ms", type=float, default=150.0)
+parser.add_argument("--storage-ms", type=float, default=5.0)
+parser.add_argument("--template-resources", type=int, default=20)
+parser.add_argument("--template-file", type=str, default=None)
+parser.add_argument("--examples", type=int, default=3)
+parser.add_argument("--example-resources", type=int, default=20)
+parser.add_argument("--explain-chars", type=int, default=1500)
+parser.add_argument("--json", type=str, default=None)
+parser.add_argument("--compare", type=str, default=None)
+parser.add_argument("--threshold", type=float, default=10.0)
+parser.add_argument("--requests-per-minute", type=int, default=100000)
+
+
+class Timed:
+    """Proxy of a stand-in adding the wall time of every call, and of the streams it returns, to its stage."""
+
+    def __init__(self, target, stage, timings):
+        self._target = target
+        self._stage = stage
+        self._timings = timings
+
+    @property
+    def meta(self):
+        # TemplateStore writes its transactions through table.meta.client, the table itself for the stand-in.
+        return _TimedMeta(self)
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr) or name == "exceptions":
+            return attr
+
+        def call(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = attr(*args, **kwargs)
+            finally:
+                self._timings.add(self._stage, time.perf_counter() - start)
+            if isinstance(result, dict) and "stream" in result:
+                result = dict(result, stream=_TimedStream(result["stream"], self._stage, self._timings))
+            return result
+
+        return call
+
+
+class _TimedMeta:
+    def __init__(self, client):
+        self.client = client
+
+
+class _TimedStream:
+    def __init__(self, stream, stage, timings):
+        self._stream = stream
+        self._stage = stage
+        self._timings = timings
+
+    def __iter__(self):
+        events = iter(self._stream)
+        while True:
+            start = time.perf_counter()
+            try:
+                event = next(events)
+            except StopIteration:
+                return
+            finally:
+                self._timings.add(self._stage, time.perf_counter() - start)
+            yield event
+
+    def close(self):
+        self._stream.close()
+
+
+class Timings:
+    """Seconds spent per stage, added from the threads of the example downloads too."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.seconds = Counter()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.seconds[stage] += seconds
+
+    def pop(self):
+        with self._lock:
+            seconds, self.seconds = self.seconds, Counter()
+        return seconds
+
+
+def setup(action_group, args, template):
+    timings = Timings()
+    uris = [f"s3://datasource/data/example{idx}.yaml" for idx in range(args.examples)]
+    services = {
+        "bedrock-runtime": LocalBedrockRuntime(latency=args.model_ms / 1000, template=template),
+        "bedrock-agent-runtime": LocalAgentRuntime(latency=args.retrieve_ms / 1000, uris=uris),
+        "s3": LocalS3(
+            latency=args.s3_ms / 1000,
+            objects={uri: synthetic_template(args.example_resources, f"Example {uri}") for uri in uris},
+        ),
+        "cloudformation": LocalCloudFormation(latency=args.validate_ms / 1000),
+        "dynamodb": LocalTable(latency=args.storage_ms / 1000),
+    }
+    action_group._clients.clear()
+    action_group._clients.update(
+        {name: Timed(client, name, timings) for name, client in services.items() if name != "dynamodb"}
+    )
+    action_group._table = Timed(services["dynamodb"], "dynamodb", timings)
+    action_group._template_store = None
+    action_group._validation_cache = None
+    action_group.example_cache = ExampleCache()
+    return services, timings
+
+
+def event(api_path, parameter, sessionId, explain):
+    value = explain if parameter == "architectureExplanation" else PARAMETERS.get(parameter)
+    return {
+        "actionGroup": "benchmark",
+        "apiPath": api_path,
+        "httpMethod": "POST",
+        "sessionId": sessionId,
+        "parameters": [{"name": parameter, "type": "string", "value": value}] if parameter else [],
+        "sessionAttributes": {"validate_counter": "0"},
+    }
+
+
+def run_session(action_group, services, timings, template, sessionId, explain):
+    samples = dict()
+    for api_path, parameter in ACTIONS:
+        # A new template every session, so the validation cache only serves the repeats of a session.
+        services["bedrock-runtime"].template = template.replace("Description: ", f"Description: {sessionId} ", 1)
+        calls = {name: sum(services[name].calls.values()) for name in ("dynamodb", "s3")}
+        timings.pop()
+        start = time.perf_counter()
+        response = action_group.lambda_handler(event(api_path, parameter, sessionId, explain), None)["response"]
+        elapsed = time.perf_counter() - start
+        assert response["httpStatusCode"] == 200, response
+
+        stages = {stage: seconds * 1000 for stage, seconds in timings.pop().items()}
+        stages["local"] = max(0.0, elapsed * 1000 - sum(stages.values()))
+        samples[api_path] = {
+            "ms": elapsed * 1000,
+            "stages": stages,
+            "dynamodb_calls": sum(services["dynamodb"].calls.values()) - calls["dynamodb"],
+            "s3_calls": sum(services["s3"].calls.values()) - calls["s3"],
+        }
+    return samples
+
+
+def measure_memory(action_group, services, timings, template, explain):
+    memory = dict()
+    sessionId = "benchmark-memory"
+    tracemalloc.start()
+    try:
+        for api_path, parameter in ACTIONS:
+            services["bedrock-runtime"].template = template
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            action_group.lambda_handler(event(api_path, parameter, sessionId, explain), None)
+            memory[api_path] = (tracemalloc.get_traced_memory()[1] - baseline) / 1024
+    finally:
+        tracemalloc.stop()
+    timings.pop()
+    return memory
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))]
+
+
+def summary(samples, memory):
+    results = dict()
+    for api_path, _ in ACTIONS:
+        runs = [sample[api_path] for sample in samples]
+        stages = {
+            stage: [run["stages"].get(stage, 0.0) for run in runs]
+            for stage in STAGES
+            if any(stage in run["stages"] for run in runs)
+        }
+        results[api_path] = {
+            "p50_ms": statistics.median(run["ms"] for run in runs),
+            "p95_ms": percentile([run["ms"] for run in runs], 95),
+            "stages": {
+                stage: {"p50_ms": statistics.median(values), "p95_ms": percentile(values, 95)}
+                for stage, values in stages.items()
+            },
+            "dynamodb_calls": statistics.mean(run["dynamodb_calls"] for run in runs),
+            "s3_calls": statistics.mean(run["s3_calls"] for run in runs),
+            "peak_alloc_kb": memory[api_path],
+        }
+    return results
+
+
+def revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=APP_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold):
+    print(f"\n{'action':<26} {'baseline p50':>13} {'p50':>10} {'change':>8}")
+    regressions = list()
+    for api_path, result in results.items():
+        previous = baseline["results"].get(api_path)
+        if previous is None:
+            continue
+        change = (result["p50_ms"] - previous["p50_ms"]) / previous["p50_ms"] * 100
+        flag = " slower" if change > threshold else ""
+        if flag:
+            regressions.append(api_path)
+        print(f"{api_path:<26} {previous['p50_ms']:>10.1f} ms {result['p50_ms']:>7.1f} ms {change:>+7.1f}%{flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    os.environ["BedrockRequestsPerMinute"] = str(args.requests_per_minute)
+    action_group = importlib.import_module("lambda")
+
+    if args.template_file:
+        with open(args.template_file) as template_file:
+            template = template_file.read()
+    else:
+        template = synthetic_template(args.template_resources)
+    explain = (SENTENCE * (args.explain_chars // len(SENTENCE) + 1))[: args.explain_chars]
+
+    services, timings = setup(action_group, args, template)
+    samples = [
+        run_session(action_group, services, timings, template, f"benchmark-{run}", explain) for run in range(args.runs)
+    ]
+    memory = measure_memory(action_group, services, timings, template, explain)
+    results = summary(samples, memory)
+
+    print(f"{'action':<26} {'p50':>10} {'p95':>10} {'dynamodb':>9} {'s3':>5} {'alloc':>10}  stages p50")
+    for api_path, result in results.items():
+        stages = ", ".join(f"{stage} {values['p50_ms']:.1f}" for stage, values in result["stages"].items())
+        print(
+            f"{api_path:<26} {result['p50_ms']:>7.1f} ms {result['p95_ms']:>7.1f} ms {result['dynamodb_calls']:>9.1f} "
+            f"{result['s3_calls']:>5.1f} {result['peak_alloc_kb']:>7.0f} KB  {stages}"
+        )
+
+    regressions = list()
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.threshold)
+
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump(
+                {
+                    "revision": revision(),
+                    "python": platform.python_version(),
+                    "args": vars(args),
+                    "results": results,
+                },
+                json_file,
+                indent=2,
+            )
+
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,101 @@
+"""
+Benchmarks the configuration reads of the agents app on startup and on every rerun.
+
+Streamlit re-runs app.py for every interaction, and app.py constructs Bedrock, KnowledgeBase and BedrockAgent each
+time, which read their configuration from SSM Parameter Store:
+
+- legacy: one GetParameter round trip per parameter and construction, the behaviour before the parameter store.
+- store: util.invoke.parameters reads every /streamlitapp/{environmentName}/ parameter with one
+  GetParametersByPath call and serves them from memory until the TTL expires.
+
+SSM and DynamoDB are in-memory stand-ins with injected round-trip latencies. "startup" is the first rerun of a
+fresh process, "rerun" the median of the following ones.
+
+Run from agents-architecture-to-cloudformation/:
+
+    python -m benchmark.app_startup --reruns 20 --ssm-ms 25
+"""
+
+from argparse import ArgumentParser
+import json
+import statistics
+import time
+
+from benchmark.standins import LocalDynamoDB, LocalSSM
+from util.invoke import Bedrock, BedrockAgent, KnowledgeBase, clients, parameters, routing
+from util.invoke.knowledgebase import _template_stores, _validation_caches
+
+parser = ArgumentParser()
+parser.add_argument("--reruns", type=int, default=20)
+parser.add_argument("--ssm-ms", type=float, default=25.0)
+parser.add_argument("--json", type=str, default=None)
+
+
+class GetParameterStore:
+    """The legacy reads: one GetParameter call per parameter, nothing kept."""
+
+    def get(self, environmentName, name, default=parameters._MISSING):
+        ssm = clients.get_client("ssm")
+        try:
+            return ssm.get_parameter(Name=f"/streamlitapp/{environmentName}/{name}", WithDecryption=False)["Parameter"]["Value"]
+        except ssm.exceptions.ParameterNotFound:
+            if default is parameters._MISSING:
+                raise
+            return default
+
+
+def rerun():
+    # The construction block of app.py.
+    Bedrock(inference_params={"temperature": 0.0, "top_p": 1.0, "top_k": 250}, environmentName="bench")
+    KnowledgeBase(environmentName="bench")
+    BedrockAgent(environmentName="bench")
+
+
+def measure(args, store):
+    ssm = LocalSSM(latency=args.ssm_ms / 1000, parameters={"/streamlitapp/bench/MODEL_ROUTES": "{}"})
+    clients._registry._clients.clear()
+    clients._registry._clients["ssm"] = ssm
+    clients._registry._resources.clear()
+    clients._registry._resources["dynamodb"] = LocalDynamoDB()
+    _template_stores.clear()
+    _validation_caches.clear()
+    routing._routers.clear()
+    parameters._store._environments.clear()
+
+    legacy_store, parameters._store = parameters._store, store
+    try:
+        runs = list()
+        for _ in range(args.reruns):
+            calls = sum(ssm.calls.values())
+            start = time.perf_counter()
+            rerun()
+            runs.append({"ms": (time.perf_counter() - start) * 1000, "ssm_calls": sum(ssm.calls.values()) - calls})
+    finally:
+        parameters._store = legacy_store
+    return {
+        "startup_ms": runs[0]["ms"],
+        "startup_ssm_calls": runs[0]["ssm_calls"],
+        "rerun_p50_ms": statistics.median(run["ms"] for run in runs[1:]),
+        "rerun_ssm_calls": statistics.median(run["ssm_calls"] for run in runs[1:]),
+    }
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    results = {
+        "legacy": measure(args, GetParameterStore()),
+        "store": measure(args, parameters._store),
+    }
+
+    print(f"{'config':<7} {'startup':>10} {'ssm':>4} {'rerun p50':>10} {'ssm':>4}")
+    for name, result in results.items():
+        print(
+            f"{name:<7} {result['startup_ms']:>7.1f} ms {result['startup_ssm_calls']:>4} "
+            f"{result['rerun_p50_ms']:>7.1f} ms {result['rerun_ssm_calls']:>4.0f}"
+        )
+    print(f"SSM parameters {parameters.parameter_stats()}")
+
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump({"args": vars(args), "results": results}, json_file, indent=2)
@@ -0,0 +1,131 @@
+"""
+Checks the local CloudFormation validator for false positives and measures its latency.
+
+A template the local checks reject is sent back to resolve without the remote cfn.validate_template call, so a
+false positive makes the model "fix" a valid template. The validator runs on:
+
+- the shipped examples of data/ingest and the stacks of cfn_stack, which must pass;
+- a SAM template, whose outputs reference the resources created by the transform (ServerlessRestApi,
+  <Function>Role), which must pass and be left to the remote check;
+- templates with an unresolved reference or a resource without a Type, which must be rejected.
+
+The resource specification index is used when it was built next to cfn_validator.py, see its module docstring.
+Exits 1 on a false positive or a missed error.
+
+Run from agents-architecture-to-cloudformation/:
+
+    python -m benchmark.cfn_validator --repeat 20
+"""
+
+from argparse import ArgumentParser
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+
+from util.agent.cfn_validator import load_spec_index, validate_template
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+SAM_TEMPLATE = """AWSTemplateFormatVersion: '2010-09-09'
+Transform: AWS::Serverless-2016-10-31
+Description: sam-app hello world
+Globals:
+  Function:
+    Timeout: 3
+Resources:
+  HelloWorldFunction:
+    Type: AWS::Serverless::Function
+    Properties:
+      CodeUri: hello_world/
+      Handler: app.lambda_handler
+      Runtime: python3.12
+      Events:
+        HelloWorld:
+          Type: Api
+          Properties:
+            Path: /hello
+            Method: get
+Outputs:
+  HelloWorldApi:
+    Value: !Sub "https://${ServerlessRestApi}.execute-api.${AWS::Region}.amazonaws.com/Prod/hello/"
+  HelloWorldFunction:
+    Value: !GetAtt HelloWorldFunction.Arn
+  HelloWorldFunctionIamRole:
+    Value: !GetAtt HelloWorldFunctionRole.Arn
+"""
+
+INVALID_TEMPLATES = {
+    "unresolved Ref": """Resources:
+  Queue:
+    Type: AWS::SQS::Queue
+Outputs:
+  Topic:
+    Value: !Ref Topic
+""",
+    "unresolved GetAtt": """Resources:
+  Queue:
+    Type: AWS::SQS::Queue
+Outputs:
+  Arn:
+    Value: !GetAtt Bucket.Arn
+""",
+    "missing Type": """Resources:
+  Queue:
+    Properties:
+      DelaySeconds: 5
+""",
+}
+
+parser = ArgumentParser()
+parser.add_argument("--repeat", type=int, default=20)
+parser.add_argument("--json", type=str, default=None)
+
+
+def valid_templates():
+    paths = sorted(glob.glob(os.path.join(APP_DIR, "data", "ingest", "*", "*.yaml")))
+    paths += sorted(glob.glob(os.path.join(APP_DIR, "cfn_stack", "*.yaml")))
+    templates = {os.path.relpath(path, APP_DIR): open(path).read() for path in paths}
+    templates["SAM hello world"] = SAM_TEMPLATE
+    return templates
+
+
+def measure(template, repeat):
+    runs = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        errors = validate_template(template)
+        runs.append((time.perf_counter() - start) * 1000)
+    return errors, statistics.median(runs)
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    print(f"Resource specification index: {'loaded' if load_spec_index() else 'not built, reference checks only'}")
+
+    results = {"false_positives": dict(), "missed": list(), "ms": dict()}
+    for name, template in valid_templates().items():
+        errors, ms = measure(template, args.repeat)
+        results["ms"][name] = ms
+        if errors:
+            results["false_positives"][name] = errors
+    for name, template in INVALID_TEMPLATES.items():
+        errors, ms = measure(template, args.repeat)
+        results["ms"][name] = ms
+        if not errors:
+            results["missed"].append(name)
+
+    print(f"{len(results['ms'])} templates, p50 {statistics.median(results['ms'].values()):.2f} ms, "
+          f"max {max(results['ms'].values()):.2f} ms")
+    for name, errors in results["false_positives"].items():
+        print(f"False positive {name}: {errors}")
+    for name in results["missed"]:
+        print(f"Missed error: {name}")
+
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump({"args": vars(args), "results": results}, json_file, indent=2)
+    if results["false_positives"] or results["missed"]:
+        sys.exit(1)
@@ -0,0 +1,113 @@
+"""
+Benchmarks the reruns of the chat history of the agents app as the session grows.
+
+Every Streamlit rerun (a click, an edit, a chat message) renders the chat history of the session:
+
+- full: every assistant turn is rendered with one expander per trace record and a code editor holding its template,
+  the behaviour before the history was virtualized.
+- virtualized: util.assets.chat_history renders the latest HISTORY_TURNS assistant turns in full and the older
+  turns as one-line summaries.
+
+The history is rendered by streamlit.testing.v1.AppTest, so the element tree is built as for a browser session.
+"sent" is the size of the elements of a rerun and "elements" their number. Each turn is one update instruction
+and its assistant answer: a --resources template and --trace-steps trace records.
+
+Run from agents-architecture-to-cloudformation/:
+
+    python -m benchmark.chat_history --turns 10 50 200 --reruns 5
+"""
+
+from argparse import ArgumentParser
+import json
+import statistics
+import time
+
+from streamlit.testing.v1 import AppTest
+
+from benchmark.standins import synthetic_template
+from util.assets.chat_history import HISTORY_TURNS
+from util.invoke.trace import TraceParser
+
+SCRIPT = """
+import streamlit as st
+from util.assets.chat_history import render_history
+
+render_history(st.session_state["chat_history"], on_submit=lambda template: None, turns=st.session_state["turns"])
+"""
+
+parser = ArgumentParser()
+parser.add_argument("--turns", type=int, nargs="+", default=[10, 50, 200])
+parser.add_argument("--reruns", type=int, default=5)
+parser.add_argument("--resources", type=int, default=40)
+parser.add_argument("--trace-steps", type=int, default=8)
+parser.add_argument("--json", type=str, default=None)
+
+
+def chat_history(args, turns):
+    template = synthetic_template(args.resources)
+    trace = TraceParser()
+    for step in range(args.trace_steps):
+        if step % 2:
+            trace.add("rationale", "I will validate the template. " * 10)
+        else:
+            payload = {"invocationInput": {"actionGroupInvocationInput": {"apiPath": "/validateCloudFormation", "requestBody": template[:1500]}}}
+            trace.add("invocationInput", payload, tool="/validateCloudFormation")
+
+    history = list()
+    for turn in range(turns):
+        history.append({"role": "human", "prompt": f"Update instruction {turn}: add an SQS queue."})
+        history.append({"role": "assistant", "prompt": "```yaml" + template, "trace": list(trace.records), "is_valid": turn % 3 != 0})
+    return history
+
+
+def elements(node):
+    # Sizes of the protobuf messages of the element tree, the payload sent to the browser.
+    proto = getattr(node, "proto", None)
+    size, count = (proto.ByteSize(), 1) if proto is not None else (0, 0)
+    for child in getattr(node, "children", dict()).values():
+        child_size, child_count = elements(child)
+        size, count = size + child_size, count + child_count
+    return size, count
+
+
+def measure(args, turns, history_turns):
+    app = AppTest.from_string(SCRIPT, default_timeout=600)
+    app.session_state["chat_history"] = chat_history(args, turns)
+    app.session_state["turns"] = history_turns
+
+    runs = list()
+    for _ in range(args.reruns + 1):
+        start = time.perf_counter()
+        app.run()
+        runs.append((time.perf_counter() - start) * 1000)
+        assert not app.exception, app.exception
+    sent, count = elements(app._tree)
+    return {
+        "first_ms": runs[0],
+        "rerun_p50_ms": statistics.median(runs[1:]),
+        "sent_kb": sent / 1024,
+        "elements": count,
+    }
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    results = dict()
+    for turns in args.turns:
+        results[turns] = {
+            "full": measure(args, turns, None),
+            "virtualized": measure(args, turns, HISTORY_TURNS),
+        }
+
+    print(f"{'turns':>5} {'history':<12} {'first':>10} {'rerun p50':>10} {'sent':>10} {'elements':>9}")
+    for turns, modes in results.items():
+        for name, result in modes.items():
+            print(
+                f"{turns:>5} {name:<12} {result['first_ms']:>7.1f} ms {result['rerun_p50_ms']:>7.1f} ms "
+                f"{result['sent_kb']:>7.0f} KB {result['elements']:>9}"
+            )
+
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump({"args": vars(args), "results": results}, json_file, indent=2)
@@ -0,0 +1,148 @@
+"""
+Benchmarks template model calls of the action group Lambda reading the whole stream against stopping at the end of
+the YAML code block.
+
+The model stand-in streams the template in a ```yaml code block followed by --trailer-tokens tokens of prose, one
+delta of 4 tokens every 4 x --token-ms milliseconds. "full" reads every event like a non-streaming converse call
+waits for the whole output, "early stop" is invoke_model_template of util/agent/lambda.py.
+
+The template holds inline Lambda code whose docstring contains an indented ``` line, which must not close the
+block: "template only" is False if the template was cut there. The extractor is also fed the output in deltas of
+1 to 32 characters, and the run exits 1 if any split cuts the template. "feed" is the time the extractor takes
+for a --large-kb output fed in deltas of 16 characters, which grows linearly with the output.
+
+Run from agents-architecture-to-cloudformation/:
+
+    python -m benchmark.code_fence --token-ms 2 --trailer-tokens 150 --runs 5
+"""
+
+from argparse import ArgumentParser
+import importlib
+import json
+import os
+import statistics
+import sys
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path[:0] = [os.path.join(APP_DIR, "util", "agent"), os.path.join(APP_DIR, "util", "prompt_templates")]
+os.environ.setdefault("KnowledgeBaseId", "benchmark")
+os.environ.setdefault("EnvironmentName", "bench")
+os.environ.setdefault("BedrockModelId", "anthropic.claude-3-sonnet-20240229-v1:0")
+
+from benchmark.standins import TEMPLATE, LocalBedrockRuntime, synthetic_template
+from util.agent.code_fence import CodeFenceExtractor
+
+# A fence inside a block scalar is indented deeper than the opening fence, it is content of the template.
+INLINE_CODE_TEMPLATE = TEMPLATE.replace(
+    "Outputs:",
+    """  Function:
+    Type: AWS::Lambda::Function
+    Properties:
+      Runtime: python3.12
+      Handler: index.handler
+      Role: !GetAtt Bucket.Arn
+      Code:
+        ZipFile: |
+          def handler(event, context):
+              \"\"\"
+              Returns the event, for example:
+              ```
+              {"key": "value"}
+              ```
+              \"\"\"
+              return event
+Outputs:""",
+)
+
+TRAILER = (
+    "This CloudFormation template creates an Amazon S3 bucket and an Amazon SQS queue. The bucket can be used to "
+    "store objects and the queue decouples the producers from the consumers. Outputs expose the ARN of the bucket. "
+)
+MESSAGES = [{"role": "user", "content": [{"text": "Generate the template."}]}]
+
+parser = ArgumentParser()
+parser.add_argument("--token-ms", type=float, default=2.0)
+parser.add_argument("--trailer-tokens", type=int, default=150)
+parser.add_argument("--runs", type=int, default=5)
+parser.add_argument("--large-kb", type=int, nargs="+", default=[16, 200])
+parser.add_argument("--json", type=str, default=None)
+
+
+def full(bedrock):
+    chunks = list()
+    for event in bedrock.converse_stream(modelId="benchmark", messages=MESSAGES)["stream"]:
+        if "contentBlockDelta" in event:
+            chunks.append(event["contentBlockDelta"]["delta"]["text"])
+    return "".join(chunks)
+
+
+def early_stop(action_group):
+    return action_group.invoke_model_template(modelId="benchmark", system_prompt="", messages=MESSAGES)
+
+
+def split_outputs(output, template):
+    # The delta sizes whose extraction does not return the template.
+    failures = list()
+    for size in range(1, 33):
+        extractor = CodeFenceExtractor()
+        for idx in range(0, len(output), size):
+            if extractor.feed(output[idx : idx + size]):
+                break
+        if extractor.template().strip() != template.strip():
+            failures.append(size)
+    return failures
+
+
+def feed_ms(kb):
+    # About 80 characters per resource and its output.
+    output = "```yaml\n" + synthetic_template(kb * 1024 // 80) + "```\n"
+    extractor = CodeFenceExtractor()
+    start = time.perf_counter()
+    for idx in range(0, len(output), 16):
+        if extractor.feed(output[idx : idx + 16]):
+            break
+    extractor.template()
+    return (time.perf_counter() - start) * 1000
+
+
+def measure(bedrock, call):
+    streamed = bedrock.streamed_chars
+    start = time.perf_counter()
+    output = call()
+    return {"ms": (time.perf_counter() - start) * 1000, "tokens": (bedrock.streamed_chars - streamed) // 4, "output": output}
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    action_group = importlib.import_module("lambda")
+
+    trailer = (TRAILER * (args.trailer_tokens * 4 // len(TRAILER) + 1))[: args.trailer_tokens * 4]
+    bedrock = LocalBedrockRuntime(
+        template=INLINE_CODE_TEMPLATE, trailer=trailer, delta_chars=16, delta_latency=4 * args.token_ms / 1000
+    )
+    action_group._clients["bedrock-runtime"] = bedrock
+
+    results = dict()
+    for name, call in (("full", lambda: full(bedrock)), ("early stop", lambda: early_stop(action_group))):
+        runs = [measure(bedrock, call) for _ in range(args.runs)]
+        results[name] = {"p50_ms": statistics.median(run["ms"] for run in runs), "output_tokens": runs[-1]["tokens"]}
+        results[name]["template"] = runs[-1]["output"].strip() == bedrock.template.strip()
+    results["metrics"] = dict(action_group.metrics)
+    results["feed_ms"] = {kb: feed_ms(kb) for kb in args.large_kb}
+    results["split_failures"] = split_outputs("```yaml\n" + bedrock.template + "```\n" + trailer, bedrock.template)
+
+    print(f"{'read':<12} {'p50':>9} {'output tokens':>14} {'template only':>14}")
+    for name in ("full", "early stop"):
+        result = results[name]
+        print(f"{name:<12} {result['p50_ms']:>6.1f} ms {result['output_tokens']:>14} {str(result['template']):>14}")
+    print(f"Lambda metrics {results['metrics']}")
+    for kb, ms in results["feed_ms"].items():
+        print(f"feed {kb} KB output: {ms:.1f} ms")
+    print(f"Delta sizes cutting the template: {results['split_failures'] or 'none'}")
+
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump({"args": vars(args), "results": results}, json_file, indent=2)
+    if results["split_failures"] or not results["early stop"]["template"]:
+        sys.exit(1)
@@ -0,0 +1,64 @@
+"""
+Benchmarks the image preprocessing stage over the architecture diagrams in data/ingest.
+
+Run from agents-architecture-to-cloudformation/:
+
+    python -m benchmark.image_preprocessing --max-edge 1568 --json results.json
+"""
+
+from util.assets.image_util import MAX_EDGE, preprocess_image
+
+from argparse import ArgumentParser
+import json
+import os
+
+INGEST_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "data", "ingest"
+)
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+parser = ArgumentParser()
+parser.add_argument("--max-edge", type=int, default=MAX_EDGE)
+parser.add_argument("--json", type=str, default=None)
+
+
+def benchmark(max_edge):
+    results = list()
+    for domain in sorted(os.listdir(INGEST_DIR)):
+        domain_path = os.path.join(INGEST_DIR, domain)
+        if not os.path.isdir(domain_path):
+            continue
+
+        for domain_file in sorted(os.listdir(domain_path)):
+            if not domain_file.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+
+            with open(os.path.join(domain_path, domain_file), "rb") as image_file:
+                image_bytes = image_file.read()
+
+            _, image_format, stats = preprocess_image(image_bytes, max_edge=max_edge)
+            results.append(
+                {"image": f"{domain}/{domain_file}", "format": image_format, **stats}
+            )
+    return results
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    results = benchmark(args.max_edge)
+
+    print(f"{'image':<40} {'format':<6} {'before':>10} {'after':>10} {'ratio':>6} {'ms':>8}")
+    for result in results:
+        print(
+            f"{result['image']:<40} {result['format']:<6} {result['before_bytes']:>10} "
+            f"{result['after_bytes']:>10} {result['after_bytes'] / result['before_bytes']:>6.2f} "
+            f"{result['seconds'] * 1000:>8.1f}"
+        )
+
+    before = sum(result["before_bytes"] for result in results)
+    after = sum(result["after_bytes"] for result in results)
+    print(f"total {before} -> {after} bytes ({after / before:.2f})")
+
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump({"max_edge": args.max_edge, "results": results}, json_file, indent=2)
@@ -0,0 +1,150 @@
+"""
+Benchmarks the reruns of the knowledge base sidebar of the agents app.
+
+Every Streamlit rerun (a click, an edit, a chat message) renders the sidebar of the retrieved examples:
+
+- legacy: the METADATA item is read from DynamoDB, then every diagram and every template is downloaded in full
+  from S3 and each template is base64-encoded into an HTML download anchor.
+- cached: the retrieved documents are read once per session, the diagrams are served as downscaled thumbnails
+  from the process-wide cache, and a template is only downloaded when its button is clicked (never here).
+
+S3 and DynamoDB are in-memory stand-ins with injected round-trip latencies, the diagrams are --image-px PNGs.
+"sent" is the payload handed to the browser per rerun: the images and the download anchors.
+
+Run from agents-architecture-to-cloudformation/:
+
+    python -m benchmark.kb_panel --reruns 20 --examples 3 --image-px 2400 --s3-ms 20 --storage-ms 5
+"""
+
+from argparse import ArgumentParser
+import io
+import json
+import statistics
+import time
+
+from PIL import Image, ImageDraw
+
+from benchmark.standins import LocalDynamoDB, LocalS3, LocalSSM, synthetic_template
+from util.agent.cfn_actions import metadata_item
+from util.assets import kb_util
+from util.assets.streamlit_download_button import download_button
+from util.invoke import clients, parameters
+from util.invoke.knowledgebase import KnowledgeBase, _template_stores, _validation_caches
+
+parser = ArgumentParser()
+parser.add_argument("--reruns", type=int, default=20)
+parser.add_argument("--examples", type=int, default=3)
+parser.add_argument("--image-px", type=int, default=2400)
+parser.add_argument("--example-resources", type=int, default=40)
+parser.add_argument("--s3-ms", type=float, default=20.0)
+parser.add_argument("--storage-ms", type=float, default=5.0)
+parser.add_argument("--json", type=str, default=None)
+
+
+def diagram(px, seed):
+    # A line drawing with labels compresses like an architecture diagram, unlike noise or a flat image.
+    image = Image.new("RGB", (px, px * 3 // 4), "white")
+    draw = ImageDraw.Draw(image)
+    for idx in range(40):
+        x, y = (idx * 97 + seed * 31) % (px - 200), (idx * 53 + seed * 17) % (px * 3 // 4 - 120)
+        draw.rectangle((x, y, x + 180, y + 100), outline=(35, 47, 62), width=4)
+        draw.text((x + 10, y + 40), f"Service {idx}", fill=(255, 153, 0))
+        draw.line((x + 180, y + 50, x + 280, y + 90), fill=(35, 47, 62), width=3)
+    output = io.BytesIO()
+    image.save(output, format="PNG")
+    return output.getvalue()
+
+
+def setup(args):
+    uris = [
+        {"cfn_stack": f"s3://datasource/data/example{idx}.yaml", "architecture_image": f"s3://datasource/data/example{idx}.png"}
+        for idx in range(args.examples)
+    ]
+    objects = dict()
+    for idx, uri in enumerate(uris):
+        objects[uri["cfn_stack"]] = synthetic_template(args.example_resources, f"Example {idx}")
+        objects[uri["architecture_image"]] = diagram(args.image_px, idx)
+    s3 = LocalS3(latency=args.s3_ms / 1000, objects=objects)
+    dynamodb = LocalDynamoDB(latency=args.storage_ms / 1000)
+
+    clients._registry._clients.clear()
+    clients._registry._clients.update({"s3": s3, "ssm": LocalSSM()})
+    clients._registry._resources.clear()
+    clients._registry._resources["dynamodb"] = dynamodb
+    _template_stores.clear()
+    _validation_caches.clear()
+    parameters._store._environments.clear()
+    kb_util._thumbnails = kb_util.ThumbnailCache()
+
+    knowledgebase = KnowledgeBase(environmentName="bench")
+    knowledgebase.template_store.put(
+        sessionId="benchmark",
+        template=synthetic_template(5),
+        items=[metadata_item("benchmark", [{"metadata": uri} for uri in uris])],
+    )
+    return knowledgebase, s3, dynamodb.Table("templatestorage-atc-bench")
+
+
+def legacy_rerun(knowledgebase):
+    sent = 0
+    for uri in knowledgebase.retrieve_metadata(sessionId="benchmark"):
+        sent += len(kb_util.read_image(uri["architecture_image"]))
+        sent += len(download_button(
+            button_text="Download",
+            object_to_download=kb_util.download_cfn(uri["cfn_stack"]),
+            download_filename="data.yaml",
+        ))
+    return sent
+
+
+def cached_rerun(knowledgebase, session_state):
+    if "metadata_uri" not in session_state:
+        session_state["metadata_uri"] = knowledgebase.retrieve_metadata(sessionId="benchmark")
+    thumbnails = kb_util.read_thumbnails([uri["architecture_image"] for uri in session_state["metadata_uri"]])
+    return sum(len(thumbnail) for thumbnail in thumbnails if thumbnail)
+
+
+def measure(args, rerun):
+    knowledgebase, s3, table = setup(args)
+    runs = list()
+    for _ in range(args.reruns):
+        s3_calls, table_calls = sum(s3.calls.values()), sum(table.calls.values())
+        start = time.perf_counter()
+        sent = rerun(knowledgebase)
+        runs.append(
+            {
+                "ms": (time.perf_counter() - start) * 1000,
+                "s3_calls": sum(s3.calls.values()) - s3_calls,
+                "dynamodb_calls": sum(table.calls.values()) - table_calls,
+                "sent_kb": sent / 1024,
+            }
+        )
+    return {
+        "first_ms": runs[0]["ms"],
+        "rerun_p50_ms": statistics.median(run["ms"] for run in runs[1:]),
+        "s3_calls": sum(run["s3_calls"] for run in runs),
+        "dynamodb_calls": sum(run["dynamodb_calls"] for run in runs),
+        "sent_kb_per_rerun": statistics.median(run["sent_kb"] for run in runs),
+    }
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    session_state = dict()
+    results = {
+        "legacy": measure(args, legacy_rerun),
+        "cached": measure(args, lambda knowledgebase: cached_rerun(knowledgebase, session_state)),
+    }
+
+    print(f"{'sidebar':<8} {'first':>10} {'rerun p50':>10} {'s3':>5} {'dynamodb':>9} {'sent/rerun':>11}")
+    for name, result in results.items():
+        print(
+            f"{name:<8} {result['first_ms']:>7.1f} ms {result['rerun_p50_ms']:>7.1f} ms {result['s3_calls']:>5} "
+            f"{result['dynamodb_calls']:>9} {result['sent_kb_per_rerun']:>8.0f} KB"
+        )
+    print(f"Thumbnail cache {kb_util.thumbnail_stats()}")
+
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump({"args": vars(args), "results": results}, json_file, indent=2)
@@ -0,0 +1,131 @@
+"""
+Benchmarks the cold start of the agent action group Lambda with stubbed AWS clients.
+
+Every run starts a fresh interpreter laid out like the Lambda zip (util/agent and util/prompt_templates on the
+path), measures the import and init of lambda.py, the lazy creation of the clients the action needs, then the
+first /validateCloudFormation action against botocore Stubbers, so no AWS call leaves the machine.
+
+Run from agents-architecture-to-cloudformation/:
+
+    python -m benchmark.lambda_cold_start --runs 10 --max-init-ms 500
+"""
+
+from argparse import ArgumentParser
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+parser = ArgumentParser()
+parser.add_argument("--runs", type=int, default=10)
+parser.add_argument("--max-init-ms", type=float, default=None)
+parser.add_argument("--json", type=str, default=None)
+
+COLD_START = """
+import time
+
+start = time.perf_counter()
+import importlib
+
+action_group = importlib.import_module("lambda")
+init = time.perf_counter() - start
+
+from botocore.stub import Stubber
+import zlib
+
+start = time.perf_counter()
+template = "AWSTemplateFormatVersion: 2010-09-09\\nResources:\\n  Bucket:\\n    Type: AWS::S3::Bucket\\n"
+table = Stubber(action_group.get_table().meta.client)
+body = zlib.compress(template.encode("utf-8"))
+table.add_response(
+    "get_item", {"Item": {"body": {"B": body}, "encoding": {"S": "zlib"}, "Latest": {"N": "1"}}}
+)
+table.add_response("get_item", {})
+table.add_response("put_item", {})
+table.add_response("update_item", {})
+table.activate()
+cfn = Stubber(action_group.get_client("cloudformation"))
+cfn.add_response("validate_template", {"Parameters": []})
+cfn.activate()
+clients = time.perf_counter() - start
+
+start = time.perf_counter()
+response = action_group.lambda_handler(
+    {
+        "actionGroup": "benchmark",
+        "apiPath": "/validateCloudFormation",
+        "httpMethod": "POST",
+        "sessionId": "benchmark",
+        "sessionAttributes": {"validate_counter": "0"},
+    },
+    None,
+)
+first_action = time.perf_counter() - start
+assert response["response"]["httpStatusCode"] == 200, response
+table.assert_no_pending_responses()
+cfn.assert_no_pending_responses()
+
+print(
+    json.dumps(
+        {
+            "init_ms": init * 1000,
+            "clients_ms": clients * 1000,
+            "first_action_ms": first_action * 1000,
+        }
+    )
+)
+"""
+
+
+def cold_start():
+    env = dict(
+        os.environ,
+        PYTHONPATH=os.pathsep.join(
+            [
+                os.path.join(APP_DIR, "util", "agent"),
+                os.path.join(APP_DIR, "util", "prompt_templates"),
+            ]
+        ),
+        PYTHONDONTWRITEBYTECODE="1",
+        KnowledgeBaseId="benchmark",
+        EnvironmentName="bench",
+        BedrockModelId="anthropic.claude-3-sonnet-20240229-v1:0",
+        AWS_DEFAULT_REGION="us-east-1",
+        AWS_ACCESS_KEY_ID="benchmark",
+        AWS_SECRET_ACCESS_KEY="benchmark",
+        AWS_EC2_METADATA_DISABLED="true",
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", "import json\n" + COLD_START],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    runs = [cold_start() for _ in range(args.runs)]
+
+    results = {
+        metric: {
+            "p50": statistics.median(run[metric] for run in runs),
+            "max": max(run[metric] for run in runs),
+        }
+        for metric in ("init_ms", "clients_ms", "first_action_ms")
+    }
+    for metric, result in results.items():
+        print(f"{metric:<16} p50 {result['p50']:>8.1f} ms   max {result['max']:>8.1f} ms")
+
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump({"runs": args.runs, "results": results}, json_file, indent=2)
+
+    if args.max_init_ms is not None and results["init_ms"]["p50"] > args.max_init_ms:
+        print(f"init p50 above {args.max_init_ms} ms")
+        sys.exit(1)
@@ -0,0 +1,123 @@
+"""
+Benchmarks an /updateCloudFormation action of the action group Lambda against a model slower than the Lambda timeout.
+
+The Lambda runs against in-memory stand-ins of Bedrock, S3 and DynamoDB, the session already holds a template and
+the documents retrieved when it was generated. The context reports --budget-ms of remaining time and the model
+streams the template slowly enough to outlast it:
+
+- fits: a fast model, the action completes within its budget.
+- no deadline: the slow model without the deadline (context None), the action runs past the budget, where the
+  Lambda would be killed and the agent would get no response at all.
+- deadline: the slow model under the deadline, the stream is closed and a 408 timeout response is returned
+  RESPONSE_MARGIN before the budget ends.
+
+The seconds of RESPONSE_MARGIN, MIN_MODEL_SECONDS and MIN_RETRIEVAL_SECONDS are multiplied by --scale so the run
+stays short. The deadline is checked between deltas, the scaled margin must outlast one --delta-ms.
+
+Run from agents-architecture-to-cloudformation/:
+
+    python -m benchmark.lambda_deadline --budget-ms 2000 --delta-ms 200 --scale 0.1
+"""
+
+from argparse import ArgumentParser
+import importlib
+import json
+import os
+import sys
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path[:0] = [os.path.join(APP_DIR, "util", "agent"), os.path.join(APP_DIR, "util", "prompt_templates")]
+os.environ.setdefault("KnowledgeBaseId", "benchmark")
+os.environ.setdefault("EnvironmentName", "bench")
+os.environ.setdefault("BedrockModelId", "anthropic.claude-3-sonnet-20240229-v1:0")
+
+from benchmark.standins import TEMPLATE, LocalBedrockRuntime, LocalS3, LocalTable
+from util.agent.cfn_actions import metadata_item
+from util.agent.example_cache import ExampleCache
+
+URIS = [f"s3://datasource/data/example{idx}.yaml" for idx in range(3)]
+
+parser = ArgumentParser()
+parser.add_argument("--budget-ms", type=float, default=2000.0)
+parser.add_argument("--delta-ms", type=float, default=200.0)
+parser.add_argument("--storage-ms", type=float, default=5.0)
+parser.add_argument("--scale", type=float, default=0.1)
+parser.add_argument("--json", type=str, default=None)
+
+
+class LambdaContext:
+    """Stand-in of the Lambda context, its remaining time counts down from the budget."""
+
+    def __init__(self, budget_ms):
+        self._end = time.monotonic() + budget_ms / 1000
+
+    def get_remaining_time_in_millis(self):
+        return int((self._end - time.monotonic()) * 1000)
+
+
+def setup(action_group, args, delta_latency):
+    latency = args.storage_ms / 1000
+    bedrock = LocalBedrockRuntime(delta_latency=delta_latency)
+    action_group._clients.clear()
+    action_group._clients["s3"] = LocalS3(latency=latency, objects={uri: TEMPLATE for uri in URIS})
+    # One client per read timeout, as get_client creates them under a deadline.
+    for read_timeout in (None,) + action_group.READ_TIMEOUTS:
+        action_group._clients["bedrock-runtime" if read_timeout is None else f"bedrock-runtime:{read_timeout}"] = bedrock
+    action_group._table = LocalTable(latency=latency)
+    action_group._template_store = None
+    action_group._validation_cache = None
+    action_group.example_cache = ExampleCache()
+    metadata = metadata_item("benchmark", [{"metadata": {"cfn_stack": uri}} for uri in URIS])
+    action_group.get_template_store().put(sessionId="benchmark", template=TEMPLATE, items=[metadata])
+    return bedrock
+
+
+def run(action_group, args, delta_latency, context):
+    bedrock = setup(action_group, args, delta_latency)
+    start = time.perf_counter()
+    response = action_group.lambda_handler(
+        {
+            "actionGroup": "benchmark",
+            "apiPath": "/updateCloudFormation",
+            "httpMethod": "POST",
+            "sessionId": "benchmark",
+            "parameters": [{"name": "updateInstruction", "value": "Add a DynamoDB table."}],
+            "sessionAttributes": {"validate_counter": "0"},
+        },
+        context,
+    )["response"]
+    elapsed = (time.perf_counter() - start) * 1000
+    return {
+        "wall_ms": elapsed,
+        "status": response["httpStatusCode"],
+        "within_budget": elapsed < args.budget_ms,
+        "streamed_chars": bedrock.streamed_chars,
+        "body": response["responseBody"]["application/json"]["body"],
+    }
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    action_group = importlib.import_module("lambda")
+    action_group.RESPONSE_MARGIN *= args.scale
+    action_group.MIN_MODEL_SECONDS *= args.scale
+    action_group.MIN_RETRIEVAL_SECONDS *= args.scale
+    delta_latency = args.delta_ms / 1000
+
+    results = {
+        "fits": run(action_group, args, 0.0, LambdaContext(args.budget_ms)),
+        "no deadline": run(action_group, args, delta_latency, None),
+        "deadline": run(action_group, args, delta_latency, LambdaContext(args.budget_ms)),
+    }
+
+    print(f"{'action':<12} {'wall':>10} {'status':>7} {'within budget':>14} {'streamed chars':>15}")
+    for name, result in results.items():
+        print(
+            f"{name:<12} {result['wall_ms']:>7.1f} ms {result['status']:>7} {str(result['within_budget']):>14} "
+            f"{result['streamed_chars']:>15}"
+        )
+
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump({"args": vars(args), "results": results}, json_file, indent=2, default=str)
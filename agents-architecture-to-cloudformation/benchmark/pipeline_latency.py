@@ -0,0 +1,151 @@
+"""
+Benchmarks one "generate" turn of the Bedrock Agent pipeline against the direct in-process pipeline.
+
+Both pipelines run against in-memory stand-ins of Bedrock, the knowledge base, S3, CloudFormation and DynamoDB
+with injected round-trip latencies, so no AWS call leaves the machine:
+
+- agent: every step is one orchestration model call of the agent followed by one invocation of the action group
+  Lambda (util/agent/lambda.py, imported as in the Lambda zip), and a final orchestration call writes the answer.
+- direct: util/invoke/pipeline.DirectPipeline runs the same steps in-process and persists the template once.
+
+Run from agents-architecture-to-cloudformation/:
+
+    python -m benchmark.pipeline_latency --model-ms 40 --orchestration-ms 40 --storage-ms 5 --runs 5
+"""
+
+from argparse import ArgumentParser
+import importlib
+import json
+import os
+import statistics
+import sys
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path[:0] = [os.path.join(APP_DIR, "util", "agent"), os.path.join(APP_DIR, "util", "prompt_templates")]
+os.environ.setdefault("KnowledgeBaseId", "benchmark")
+os.environ.setdefault("EnvironmentName", "bench")
+os.environ.setdefault("BedrockModelId", "anthropic.claude-3-sonnet-20240229-v1:0")
+
+from benchmark.standins import LocalAgentRuntime, LocalBedrockRuntime, LocalCloudFormation, LocalDynamoDB, LocalS3, LocalSSM
+from util.agent.example_cache import ExampleCache
+from util.invoke import clients, parameters, pipeline, routing
+from util.invoke.knowledgebase import KnowledgeBase, _template_stores, _validation_caches
+
+EXPLAIN = (
+    "A static website is served by Amazon CloudFront from an S3 bucket. An API Gateway REST API invokes Lambda "
+    "functions that store orders in a DynamoDB table and publish them to an SQS queue."
+)
+AGENT_STEPS = [
+    ("/generateCloudFormation", [{"name": "architectureExplanation", "type": "string", "value": EXPLAIN}]),
+    ("/reiterateCloudFormation", []),
+    ("/validateCloudFormation", []),
+]
+URIS = [f"s3://datasource/data/example{idx}.yaml" for idx in range(3)]
+
+parser = ArgumentParser()
+parser.add_argument("--model-ms", type=float, default=40.0)
+parser.add_argument("--orchestration-ms", type=float, default=40.0)
+parser.add_argument("--storage-ms", type=float, default=5.0)
+parser.add_argument("--runs", type=int, default=5)
+parser.add_argument("--json", type=str, default=None)
+
+
+def standins(args):
+    latency = args.storage_ms / 1000
+    return {
+        "bedrock-runtime": LocalBedrockRuntime(latency=args.model_ms / 1000),
+        "bedrock-agent-runtime": LocalAgentRuntime(latency=latency, uris=URIS),
+        "s3": LocalS3(latency=latency, objects={uri: open(os.path.join(APP_DIR, "cfn_stack", "development.yaml")).read() for uri in URIS}),
+        "cloudformation": LocalCloudFormation(latency=latency),
+        "ssm": LocalSSM(parameters={"/streamlitapp/bench/MODEL_ROUTES": "{}"}),
+        "dynamodb": LocalDynamoDB(latency=latency),
+    }
+
+
+def counts(services, orchestration_calls):
+    table = services["dynamodb"].Table("templatestorage-atc-bench")
+    return {
+        "model_calls": services["bedrock-runtime"].calls["converse"] + services["bedrock-runtime"].calls["converse_stream"],
+        "orchestration_calls": orchestration_calls,
+        "dynamodb_round_trips": sum(table.calls.values()),
+        "s3_round_trips": sum(services["s3"].calls.values()),
+    }
+
+
+def run_agent(args, action_group):
+    services = standins(args)
+    action_group._clients.clear()
+    action_group._clients.update({name: client for name, client in services.items() if name != "dynamodb"})
+    action_group._table = services["dynamodb"].Table("templatestorage-atc-bench")
+    action_group._template_store = None
+    action_group._validation_cache = None
+    action_group.example_cache = ExampleCache()
+
+    start = time.perf_counter()
+    session_attributes = {"validate_counter": "0"}
+    for api_path, parameters in AGENT_STEPS:
+        time.sleep(args.orchestration_ms / 1000)
+        response = action_group.lambda_handler(
+            {
+                "actionGroup": "benchmark",
+                "apiPath": api_path,
+                "httpMethod": "POST",
+                "sessionId": "benchmark",
+                "parameters": parameters,
+                "sessionAttributes": session_attributes,
+            },
+            None,
+        )["response"]
+        assert response["httpStatusCode"] == 200, response
+        session_attributes = response["sessionState"]["sessionAttributes"]
+    # Final orchestration call writing the answer of the agent.
+    time.sleep(args.orchestration_ms / 1000)
+    # The app reads the template of the turn back from DynamoDB.
+    action_group.get_generated_cloudformation(sessionId="benchmark")
+    elapsed = time.perf_counter() - start
+    return dict(counts(services, len(AGENT_STEPS) + 1), wall_ms=elapsed * 1000)
+
+
+def run_direct(args):
+    services = standins(args)
+    clients._registry._clients.clear()
+    clients._registry._clients.update({name: client for name, client in services.items() if name != "dynamodb"})
+    clients._registry._resources.clear()
+    clients._registry._resources["dynamodb"] = services["dynamodb"]
+    _template_stores.clear()
+    _validation_caches.clear()
+    routing._routers.clear()
+    parameters._store._environments.clear()
+    pipeline._example_cache = ExampleCache()
+
+    knowledgebase = KnowledgeBase(environmentName="bench")
+    direct = pipeline.DirectPipeline(environmentName="bench", knowledgebase=knowledgebase)
+
+    start = time.perf_counter()
+    response_text, _ = direct.run(sessionId="benchmark", text=EXPLAIN, trace=None, instruction="generate")
+    assert response_text == "The CloudFormation template is valid.", response_text
+    knowledgebase.get_generated_cloudformation(sessionId="benchmark")
+    elapsed = time.perf_counter() - start
+    return dict(counts(services, 0), wall_ms=elapsed * 1000)
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    action_group = importlib.import_module("lambda")
+
+    results = dict()
+    for name, run in (("agent", lambda: run_agent(args, action_group)), ("direct", lambda: run_direct(args))):
+        runs = [run() for _ in range(args.runs)]
+        results[name] = dict(runs[-1], wall_ms=statistics.median(run["wall_ms"] for run in runs))
+
+    print(f"{'pipeline':<8} {'wall p50':>10} {'model':>6} {'orchestration':>14} {'dynamodb':>9} {'s3':>4}")
+    for name, result in results.items():
+        print(
+            f"{name:<8} {result['wall_ms']:>7.1f} ms {result['model_calls']:>6} {result['orchestration_calls']:>14} "
+            f"{result['dynamodb_round_trips']:>9} {result['s3_round_trips']:>4}"
+        )
+
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump({"args": vars(args), "results": results}, json_file, indent=2)
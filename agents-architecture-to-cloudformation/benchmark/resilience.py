@@ -0,0 +1,106 @@
+"""
+Benchmarks the shared resilience layer against the previous backoff_mechanism on a throttling Bedrock stand-in.
+
+- burst: --requests calls from --threads threads against a model serving --quota requests per second. The
+  previous backoff sends everything at once and retries the throttled calls, the resilience layer paces the calls
+  with its token bucket sized to the quota.
+- outage: --requests sequential calls while every request is throttled. The previous backoff waits through all of
+  its retries for every call, the circuit breaker fails the calls fast once it opened.
+
+Delays are multiplied by --scale so the run stays short, 1 second of backoff lasts --scale seconds.
+
+Run from agents-architecture-to-cloudformation/:
+
+    python -m benchmark.resilience --requests 30 --threads 10 --quota 10 --scale 0.05
+"""
+
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+import json
+import random
+import time
+
+from benchmark.standins import LocalBedrockRuntime
+from util.agent.resilience import BASE_DELAY, BREAKER_RESET, MAX_DELAY, CircuitBreaker, Resilience, RetryError
+
+MESSAGES = [{"role": "user", "content": [{"text": "List the services."}]}]
+
+parser = ArgumentParser()
+parser.add_argument("--requests", type=int, default=30)
+parser.add_argument("--threads", type=int, default=10)
+parser.add_argument("--quota", type=float, default=10.0)
+parser.add_argument("--scale", type=float, default=0.05)
+parser.add_argument("--json", type=str, default=None)
+
+
+def legacy_backoff(bedrock, scale):
+    # The retry loop previously copied into every deployable, its delays scaled.
+    MAX_RETRIES, INITIAL_DELAY, MAX_DELAY = 5, 1, 60
+    delay, retries, slept = INITIAL_DELAY, 0, 0.0
+    while retries < MAX_RETRIES:
+        try:
+            bedrock.converse(modelId="benchmark", messages=MESSAGES)
+            return True, slept
+        except bedrock.exceptions.ThrottlingException:
+            sleep = (delay + random.uniform(0, 1)) * scale
+            time.sleep(sleep)
+            slept += sleep
+            delay = min(delay * 2, MAX_DELAY)
+            retries += 1
+    return False, slept
+
+
+def resilient(resilience, bedrock):
+    try:
+        resilience.call(bedrock.converse, modelId="benchmark", messages=MESSAGES)
+        ok = True
+    except RetryError:
+        ok = False
+    return ok, resilience.last_call()["sleep_s"]
+
+
+def run(call, bedrock, requests, threads):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        outcomes = list(executor.map(lambda _: call(), range(requests)))
+    return {
+        "wall_s": time.perf_counter() - start,
+        "succeeded": sum(ok for ok, _ in outcomes),
+        "attempts": bedrock.calls["converse"] + bedrock.calls["throttled"],
+        "throttled": bedrock.calls["throttled"],
+        "sleep_s": sum(slept for _, slept in outcomes),
+    }
+
+
+def layer(quota, scale):
+    return Resilience(
+        requests_per_minute=quota * 60,
+        burst=max(int(quota), 1),
+        base_delay=BASE_DELAY * scale,
+        max_delay=MAX_DELAY * scale,
+        breaker=CircuitBreaker(reset_after=BREAKER_RESET * scale * 100),
+    )
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    results = dict()
+    for scenario, quota, threads in (("burst", args.quota, args.threads), ("outage", 0, 1)):
+        bedrock = LocalBedrockRuntime(quota=quota)
+        results[f"{scenario} legacy"] = run(lambda: legacy_backoff(bedrock, args.scale), bedrock, args.requests, threads)
+        bedrock = LocalBedrockRuntime(quota=quota)
+        resilience = layer(args.quota, args.scale)
+        results[f"{scenario} resilience"] = run(lambda: resilient(resilience, bedrock), bedrock, args.requests, threads)
+        results[f"{scenario} resilience"]["metrics"] = resilience.pop_metrics()
+
+    print(f"{'scenario':<20} {'wall':>8} {'succeeded':>10} {'attempts':>9} {'throttled':>10} {'sleep':>8}")
+    for name, result in results.items():
+        print(
+            f"{name:<20} {result['wall_s']:>6.2f} s {result['succeeded']:>10} {result['attempts']:>9} "
+            f"{result['throttled']:>10} {result['sleep_s']:>6.2f} s"
+        )
+
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump({"args": vars(args), "results": results}, json_file, indent=2)
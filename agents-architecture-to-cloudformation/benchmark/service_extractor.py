@@ -0,0 +1,136 @@
+"""
+Compares the local AWS service extractor with the get_summary_document model call on the data/ingest explanations.
+
+The reference services of an explanation are the ones deploying the resource types of its paired example
+template (example1.txt <-> example1.yaml). The model answer is free text, it is mapped to the same canonical
+names with the alias dictionary before scoring. The model is only called when --model-id is given and AWS
+credentials are available.
+
+Run from agents-architecture-to-cloudformation/:
+
+    python -m benchmark.service_extractor --repeat 1000 --model-id anthropic.claude-3-sonnet-20240229-v1:0
+"""
+
+from util.agent.service_extractor import SERVICES, extract_services, get_retrieval_query
+
+from argparse import ArgumentParser
+import json
+import os
+import re
+import statistics
+import time
+
+INGEST_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "data", "ingest"
+)
+
+parser = ArgumentParser()
+parser.add_argument("--repeat", type=int, default=1000)
+parser.add_argument("--model-id", type=str, default=None)
+parser.add_argument("--json", type=str, default=None)
+
+SYSTEM_PROMPT = """
+        List all the AWS Services in the document. Do output anything else.
+    """
+
+
+def reference_services(template):
+    types = re.findall(r"Type:\s*[\"']?(AWS::[A-Za-z0-9]+::[A-Za-z0-9]+)", template)
+    return {
+        service
+        for service, entry in SERVICES.items()
+        for resource_type in types
+        if resource_type.startswith(entry["types"])
+    }
+
+
+def score(found, reference):
+    found = set(found)
+    true_positives = len(found & reference)
+    return {
+        "precision": true_positives / len(found) if found else 0.0,
+        "recall": true_positives / len(reference) if reference else 1.0,
+    }
+
+
+def local(explain, repeat):
+    latencies = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        query = get_retrieval_query(explain)
+        latencies.append((time.perf_counter() - start) * 1e6)
+    return query, extract_services(explain), statistics.median(latencies)
+
+
+def model(explain, modelId):
+    import boto3
+
+    start = time.perf_counter()
+    response = boto3.client("bedrock-runtime").converse(
+        modelId=modelId,
+        system=[{"text": SYSTEM_PROMPT}],
+        messages=[
+            {
+                "role": "user",
+                "content": [{"text": f"\n        <document>\n        {explain}\n        </document>\n\n    "}],
+            }
+        ],
+        inferenceConfig={"maxTokens": 4096, "temperature": 0, "topP": 1},
+    )
+    seconds = time.perf_counter() - start
+    query = response["output"]["message"]["content"][0]["text"]
+    return query, extract_services(query), seconds * 1e6
+
+
+def benchmark(repeat, modelId=None):
+    results = list()
+    for domain in sorted(os.listdir(INGEST_DIR)):
+        domain_path = os.path.join(INGEST_DIR, domain)
+        if not os.path.isdir(domain_path):
+            continue
+
+        for domain_file in sorted(os.listdir(domain_path)):
+            if not domain_file.endswith(".txt"):
+                continue
+            with open(os.path.join(domain_path, domain_file)) as text_file:
+                explain = text_file.read()
+            with open(os.path.join(domain_path, domain_file.replace(".txt", ".yaml"))) as yaml_file:
+                reference = reference_services(yaml_file.read())
+
+            query, found, latency_us = local(explain, repeat)
+            result = {
+                "explanation": f"{domain}/{domain_file}",
+                "reference": sorted(reference),
+                "local": {"query": query, "latency_us": latency_us, **score(found, reference)},
+            }
+            if modelId:
+                query, found, latency_us = model(explain, modelId)
+                result["model"] = {"query": query, "latency_us": latency_us, **score(found, reference)}
+            results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    results = benchmark(args.repeat, args.model_id)
+    methods = ("local", "model") if args.model_id else ("local",)
+
+    print(f"{'explanation':<36} " + " ".join(f"{m + ' P/R':>12} {m + ' us':>12}" for m in methods))
+    for result in results:
+        print(
+            f"{result['explanation']:<36} "
+            + " ".join(
+                f"{result[m]['precision']:>5.2f}/{result[m]['recall']:<6.2f} {result[m]['latency_us']:>12.1f}"
+                for m in methods
+            )
+        )
+    for m in methods:
+        print(
+            f"{m:<6} precision {statistics.mean(r[m]['precision'] for r in results):.2f} "
+            f"recall {statistics.mean(r[m]['recall'] for r in results):.2f} "
+            f"p50 latency {statistics.median(r[m]['latency_us'] for r in results):.1f} us"
+        )
+
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump({"repeat": args.repeat, "model_id": args.model_id, "results": results}, json_file, indent=2)
@@ -0,0 +1,399 @@
+"""
+Local stand-ins for the AWS services used by the agent action group, for benchmarks only.
+
+Every stand-in counts its calls per operation and sleeps for an injected round-trip latency, so benchmarks
+can compare request counts and wall time without an AWS account.
+"""
+
+from botocore.exceptions import ClientError
+
+from collections import Counter
+import copy
+import io
+import re
+import threading
+import time
+
+TEMPLATE = """AWSTemplateFormatVersion: 2010-09-09
+Description: This template is not production ready and should only be used for inspiration
+Resources:
+  Bucket:
+    Type: AWS::S3::Bucket
+  Queue:
+    Type: AWS::SQS::Queue
+Outputs:
+  BucketArn:
+    Value: !GetAtt Bucket.Arn
+"""
+
+# Resource types without required properties, cycled through by synthetic_template.
+SYNTHETIC_TYPES = ("AWS::S3::Bucket", "AWS::SQS::Queue", "AWS::SNS::Topic")
+
+
+def synthetic_template(resources, description="Synthetic benchmark template"):
+    """
+    Returns a valid template of `resources` resources, with one output per resource, to size the payloads.
+    """
+    lines = ["AWSTemplateFormatVersion: 2010-09-09", f"Description: {description}", "Resources:"]
+    for idx in range(resources):
+        lines += [f"  Resource{idx}:", f"    Type: {SYNTHETIC_TYPES[idx % len(SYNTHETIC_TYPES)]}"]
+    lines.append("Outputs:")
+    for idx in range(resources):
+        lines += [f"  Resource{idx}Ref:", f"    Value: !Ref Resource{idx}"]
+    return "\n".join(lines) + "\n"
+
+
+class TransactionCanceledException(ClientError):
+    pass
+
+
+class _Exceptions:
+    TransactionCanceledException = TransactionCanceledException
+    ConditionalCheckFailedException = ClientError
+
+
+class _Meta:
+    def __init__(self, client):
+        self.client = client
+
+
+class _Client:
+    """Base of the client stand-ins: per operation call counters and an injected round-trip latency."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self.exceptions = _Exceptions()
+        self._lock = threading.Lock()
+
+    def _round_trip(self, operation, latency=None):
+        with self._lock:
+            self.calls[operation] += 1
+        latency = self.latency if latency is None else latency
+        if latency:
+            time.sleep(latency)
+
+
+class _BedrockExceptions(_Exceptions):
+    class ThrottlingException(ClientError):
+        pass
+
+    class ValidationException(ClientError):
+        pass
+
+
+class LocalEventStream:
+    """Stand-in of a botocore EventStream, iterating events until closed."""
+
+    def __init__(self, events):
+        self._events = events
+        self.closed = False
+
+    def __iter__(self):
+        for event in self._events:
+            if self.closed:
+                return
+            yield event
+
+    def close(self):
+        self.closed = True
+
+
+class LocalBedrockRuntime(_Client):
+    """Stand-in of the bedrock-runtime client answering with a fixed template after the model latency.
+
+    converse_stream answers with the template in a ```yaml code block followed by `trailer`, the prose models tend
+    to add after the block, streamed in deltas of `delta_chars` characters every `delta_latency` seconds.
+    """
+
+    def __init__(self, latency=0.0, template=TEMPLATE, trailer="", delta_chars=16, delta_latency=0.0, quota=None):
+        super().__init__(latency)
+        # Requests per second served before ThrottlingException, None for no quota and 0 for a throttling outage.
+        self.quota = quota
+        self._allowance = quota or 0
+        self._updated = time.monotonic()
+        self.exceptions = _BedrockExceptions()
+        self.template = template
+        self.trailer = trailer
+        self.delta_chars = delta_chars
+        self.delta_latency = delta_latency
+        self.streamed_chars = 0
+
+    def converse(self, modelId, messages, system=None, inferenceConfig=None, **kwargs):
+        self._admit("converse")
+        self._round_trip("converse")
+        return {
+            "output": {"message": {"role": "assistant", "content": [{"text": self.template}]}},
+            "usage": {"inputTokens": 0, "outputTokens": 0},
+        }
+
+    def converse_stream(self, modelId, messages, system=None, inferenceConfig=None, **kwargs):
+        self._admit("converse_stream")
+        self._round_trip("converse_stream")
+        return {"stream": LocalEventStream(self._events("```yaml\n" + self.template + "```\n" + self.trailer))}
+
+    def _admit(self, operation):
+        if self.quota is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._allowance = min(self.quota, self._allowance + (now - self._updated) * self.quota)
+            self._updated = now
+            if self._allowance >= 1:
+                self._allowance -= 1
+                return
+            self.calls["throttled"] += 1
+        raise self.exceptions.ThrottlingException(
+            {"Error": {"Code": "ThrottlingException", "Message": "Too many requests"}}, operation
+        )
+
+    def _events(self, text):
+        yield {"messageStart": {"role": "assistant"}}
+        for start in range(0, len(text), self.delta_chars):
+            if self.delta_latency:
+                time.sleep(self.delta_latency)
+            delta = text[start : start + self.delta_chars]
+            with self._lock:
+                self.streamed_chars += len(delta)
+            yield {"contentBlockDelta": {"delta": {"text": delta}, "contentBlockIndex": 0}}
+        yield {"messageStop": {"stopReason": "end_turn"}}
+        yield {"metadata": {"usage": {"inputTokens": 0, "outputTokens": len(text) // 4}}}
+
+
+class LocalAgentRuntime(_Client):
+    """Stand-in of the bedrock-agent-runtime client, retrieve returns the example documents of the bucket."""
+
+    def __init__(self, latency=0.0, uris=("s3://datasource/data/example0.yaml",)):
+        super().__init__(latency)
+        self.uris = list(uris)
+
+    def retrieve(self, retrievalQuery, knowledgeBaseId, retrievalConfiguration=None, **kwargs):
+        self._round_trip("retrieve")
+        return {
+            "retrievalResults": [
+                {"metadata": {"cfn_stack": uri, "architecture_image": uri.replace(".yaml", ".png")}}
+                for uri in self.uris
+            ]
+        }
+
+
+class LocalS3(_Client):
+    """Stand-in of the s3 client serving objects, str or bytes, from a dict keyed by S3 URI."""
+
+    def __init__(self, latency=0.0, objects=None):
+        super().__init__(latency)
+        self.objects = dict(objects or dict())
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None, **kwargs):
+        self._round_trip("get_object")
+        body = self.objects.get(f"s3://{Bucket}/{Key}")
+        if body is None:
+            raise ClientError({"Error": {"Code": "NoSuchKey", "Message": "Not found"}}, "GetObject")
+        etag = f'"{hash(body)}"'
+        if IfNoneMatch == etag:
+            raise ClientError(
+                {"Error": {"Code": "304", "Message": "Not Modified"}, "ResponseMetadata": {"HTTPStatusCode": 304}},
+                "GetObject",
+            )
+        return {"Body": io.BytesIO(body if isinstance(body, bytes) else body.encode("utf-8")), "ETag": etag}
+
+
+class LocalCloudFormation(_Client):
+    """Stand-in of the cloudformation client, validate_template accepts every template."""
+
+    def validate_template(self, TemplateBody=None, **kwargs):
+        self._round_trip("validate_template")
+        return {"Parameters": []}
+
+
+# Parameters of the parameter stack, served as "benchmark" unless they are set.
+APP_PARAMETERS = ("AGENT_ID", "AGENT_ALIAS_ID", "KNOWLEDGEBASEID", "BEDROCK_MODEL_ID")
+
+
+class LocalSSM(_Client):
+    """Stand-in of the ssm client serving parameters from a dict."""
+
+    def __init__(self, latency=0.0, parameters=None):
+        super().__init__(latency)
+        self.parameters = dict(parameters or dict())
+
+    def get_parameter(self, Name, WithDecryption=False, **kwargs):
+        self._round_trip("get_parameter")
+        return {"Parameter": {"Name": Name, "Value": self.parameters.get(Name, "benchmark")}}
+
+    def get_parameters_by_path(self, Path, Recursive=False, WithDecryption=False, MaxResults=10, NextToken=None, **kwargs):
+        self._round_trip("get_parameters_by_path")
+        parameters = {Path + name: "benchmark" for name in APP_PARAMETERS}
+        parameters.update({name: value for name, value in self.parameters.items() if name.startswith(Path)})
+        names = sorted(name for name in parameters if Recursive or "/" not in name[len(Path):])
+        start = int(NextToken or 0)
+        response = {"Parameters": [{"Name": name, "Value": parameters[name]} for name in names[start:start + MaxResults]]}
+        if start + MaxResults < len(names):
+            response["NextToken"] = str(start + MaxResults)
+        return response
+
+
+class LocalTable:
+    """
+    In-memory stand-in of a boto3 DynamoDB Table resource.
+
+    Supports the subset of expressions used by the templatestorage table: SET update expressions with
+    if_not_exists counters, and attribute_not_exists / equality conditions.
+    """
+
+    def __init__(self, name="templatestorage-atc-bench", latency=0.0):
+        self.name = name
+        self.latency = latency
+        self.calls = Counter()
+        self.written_bytes = 0
+        self.items = dict()
+        self.exceptions = _Exceptions()
+        self.meta = _Meta(self)
+        self._lock = threading.Lock()
+
+    def get_item(self, Key, ProjectionExpression=None, ConsistentRead=False, **kwargs):
+        self._round_trip("get_item")
+        item = self.items.get(_key(Key))
+        if item is None:
+            return dict()
+        if ProjectionExpression:
+            names = [name.strip() for name in ProjectionExpression.split(",")]
+            item = {name: item[name] for name in names if name in item}
+        return {"Item": copy.deepcopy(item)}
+
+    def put_item(self, Item, ConditionExpression=None, ExpressionAttributeNames=None, **kwargs):
+        self._round_trip("put_item")
+        with self._lock:
+            self._check(Item, ConditionExpression, ExpressionAttributeNames, dict())
+            self._put(Item)
+        return dict()
+
+    def update_item(
+        self,
+        Key,
+        UpdateExpression,
+        ExpressionAttributeNames=None,
+        ExpressionAttributeValues=None,
+        ConditionExpression=None,
+        ReturnValues=None,
+        **kwargs,
+    ):
+        self._round_trip("update_item")
+        with self._lock:
+            item = self._update(
+                Key, UpdateExpression, ExpressionAttributeNames, ExpressionAttributeValues, ConditionExpression
+            )
+        return {"Attributes": copy.deepcopy(item)}
+
+    def transact_write_items(self, TransactItems, **kwargs):
+        self._round_trip("transact_write_items")
+        with self._lock:
+            reasons = list()
+            for transact_item in TransactItems:
+                operation, request = next(iter(transact_item.items()))
+                key = request["Key"] if operation == "Update" else {
+                    "sessionId": request["Item"]["sessionId"],
+                    "version": request["Item"]["version"],
+                }
+                try:
+                    self._check(
+                        self.items.get(_key(key), dict()),
+                        request.get("ConditionExpression"),
+                        request.get("ExpressionAttributeNames"),
+                        request.get("ExpressionAttributeValues"),
+                    )
+                    reasons.append({"Code": "None"})
+                except ClientError:
+                    reasons.append({"Code": "ConditionalCheckFailed"})
+
+            if any(reason["Code"] != "None" for reason in reasons):
+                raise TransactionCanceledException(
+                    {
+                        "Error": {"Code": "TransactionCanceledException", "Message": "Transaction cancelled"},
+                        "CancellationReasons": reasons,
+                    },
+                    "TransactWriteItems",
+                )
+
+            for transact_item in TransactItems:
+                operation, request = next(iter(transact_item.items()))
+                if operation == "Put":
+                    self._put(request["Item"])
+                else:
+                    self._update(
+                        request["Key"],
+                        request["UpdateExpression"],
+                        request.get("ExpressionAttributeNames"),
+                        request.get("ExpressionAttributeValues"),
+                        None,
+                    )
+        return dict()
+
+    def _round_trip(self, operation):
+        self.calls[operation] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _put(self, item):
+        self.written_bytes += _size(item)
+        self.items[_key(item)] = copy.deepcopy(item)
+
+    def _update(self, key, expression, names, values, condition):
+        names, values = names or dict(), values or dict()
+        item = self.items.setdefault(_key(key), dict(key))
+        self._check(item, condition, names, values)
+
+        for assignment in re.split(r",\s*(?![^()]*\))", expression.replace("SET ", "", 1)):
+            target, value = [part.strip() for part in assignment.split(" = ", 1)]
+            target = names.get(target, target)
+            if value.startswith("if_not_exists("):
+                default, increment = value[len("if_not_exists(") :].split(") + ")
+                attribute, default = [part.strip() for part in default.split(",")]
+                item[target] = item.get(names.get(attribute, attribute), values[default]) + values[increment]
+            else:
+                item[target] = values[value]
+        self.written_bytes += _size(item)
+        return item
+
+    def _check(self, item, condition, names, values):
+        if not condition:
+            return
+        names, values = names or dict(), values or dict()
+        satisfied = False
+        for clause in condition.split(" OR "):
+            clause = clause.strip()
+            if clause.startswith("attribute_not_exists("):
+                attribute = clause[len("attribute_not_exists(") : -1]
+                satisfied |= names.get(attribute, attribute) not in item
+            elif clause.startswith("attribute_exists("):
+                attribute = clause[len("attribute_exists(") : -1]
+                satisfied |= names.get(attribute, attribute) in item
+            else:
+                attribute, value = [part.strip() for part in clause.split(" = ")]
+                satisfied |= item.get(names.get(attribute, attribute)) == values[value]
+        if not satisfied:
+            raise ClientError(
+                {"Error": {"Code": "ConditionalCheckFailedException", "Message": "The conditional request failed"}},
+                "PutItem",
+            )
+
+
+def _key(item):
+    return (item["sessionId"], item["version"])
+
+
+def _size(item):
+    return sum(len(str(name)) + len(value if isinstance(value, (str, bytes)) else str(value)) for name, value in item.items())
+
+
+class LocalDynamoDB:
+    """Stand-in of the dynamodb resource handing out one LocalTable per table name."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.tables = dict()
+
+    def Table(self, name):
+        if name not in self.tables:
+            self.tables[name] = LocalTable(name=name, latency=self.latency)
+        return self.tables[name]
@@ -0,0 +1,100 @@
+"""
+Benchmarks template versioning writes against a local DynamoDB stand-in with injected round-trip latency.
+
+Compares the former two-request write (atomic counter update_item on v0, then put_item of vN) with
+TemplateStore.put, which persists both items in one transact_write_items request.
+
+Run from agents-architecture-to-cloudformation/:
+
+    python -m benchmark.template_store --latency-ms 8 --writes 200 --json results.json
+"""
+
+from benchmark.standins import LocalTable
+from util.agent.template_store import TemplateStore
+
+from argparse import ArgumentParser
+import datetime
+import json
+import time
+
+parser = ArgumentParser()
+parser.add_argument("--latency-ms", type=float, default=8.0)
+parser.add_argument("--writes", type=int, default=200)
+parser.add_argument("--sessions", type=int, default=10)
+parser.add_argument("--json", type=str, default=None)
+
+TEMPLATE = "AWSTemplateFormatVersion: 2010-09-09\nResources:\n  Bucket:\n    Type: AWS::S3::Bucket\n"
+
+
+def legacy_put(table, sessionId, template):
+    creationDate = str(int(datetime.datetime.now(tz=datetime.timezone.utc).timestamp()))
+    ttl = str(int((datetime.datetime.now() + datetime.timedelta(seconds=900)).timestamp()))
+
+    response = table.update_item(
+        Key={"sessionId": sessionId, "version": "v0"},
+        UpdateExpression="SET Latest = if_not_exists(Latest, :defaultval) + :incrval, #creationDate = :creationDate, #template = :template, #ttl = :ttl",
+        ExpressionAttributeNames={"#creationDate": "creationDate", "#template": "template", "#ttl": "ttl"},
+        ExpressionAttributeValues={
+            ":creationDate": creationDate,
+            ":template": template,
+            ":ttl": ttl,
+            ":defaultval": 0,
+            ":incrval": 1,
+        },
+        ReturnValues="UPDATED_NEW",
+    )
+    table.put_item(
+        Item={
+            "sessionId": sessionId,
+            "version": "v" + str(response["Attributes"]["Latest"]),
+            "creationDate": creationDate,
+            "template": template,
+            "ttl": ttl,
+        }
+    )
+
+
+def run(name, put, table, writes, sessions):
+    start = time.perf_counter()
+    for write in range(writes):
+        put(f"session-{write % sessions}", TEMPLATE + f"# revision {write}\n")
+    seconds = time.perf_counter() - start
+    return {
+        "name": name,
+        "writes": writes,
+        "seconds": seconds,
+        "writes_per_second": writes / seconds,
+        "round_trips_per_write": sum(table.calls.values()) / writes,
+        "calls": dict(table.calls),
+    }
+
+
+def benchmark(latency, writes, sessions):
+    legacy_table = LocalTable(latency=latency)
+    store_table = LocalTable(latency=latency)
+    store = TemplateStore(store_table)
+
+    results = [
+        run("update_item + put_item", lambda s, t: legacy_put(legacy_table, s, t), legacy_table, writes, sessions),
+        run("TemplateStore.put", lambda s, t: store.put(s, t), store_table, writes, sessions),
+    ]
+
+    # Both strategies must end with the same versions per session.
+    assert legacy_table.items.keys() == store_table.items.keys()
+    return results
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    results = benchmark(args.latency_ms / 1000, args.writes, args.sessions)
+
+    print(f"{'strategy':<24} {'writes/s':>10} {'round trips/write':>18}")
+    for result in results:
+        print(
+            f"{result['name']:<24} {result['writes_per_second']:>10.1f} "
+            f"{result['round_trips_per_write']:>18.2f}"
+        )
+
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump({"latency_ms": args.latency_ms, "results": results}, json_file, indent=2)
@@ -0,0 +1,141 @@
+"""
+Benchmarks the storage and read latency of compressed, delta-encoded template versions.
+
+Every example template in data/ingest seeds a session that goes through the generate -> reiterate -> validate ->
+resolve -> validate -> update loop for several turns, each step writing a version with small edits like the
+model makes. The bytes written to the local DynamoDB stand-in are compared with storing the full text in v0 and
+vN, and every version is read back through a cold store (base snapshot read from the table) and a warm store.
+
+Run from agents-architecture-to-cloudformation/:
+
+    python -m benchmark.template_versions --turns 3 --latency-ms 5 --json results.json
+"""
+
+from benchmark.standins import LocalTable
+from util.agent.template_store import TemplateStore
+
+from argparse import ArgumentParser
+import json
+import os
+import random
+import statistics
+import time
+
+INGEST_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "data", "ingest"
+)
+STEPS = ("generate", "reiterate", "validate", "resolve", "validate", "update")
+
+parser = ArgumentParser()
+parser.add_argument("--turns", type=int, default=3)
+parser.add_argument("--latency-ms", type=float, default=5.0)
+parser.add_argument("--seed", type=int, default=0)
+parser.add_argument("--json", type=str, default=None)
+
+
+def edit(template, step, rng):
+    lines = template.splitlines(keepends=True)
+    if step == "validate":
+        return template
+
+    if step == "resolve":
+        # A fix touches one or two lines.
+        for _ in range(rng.randint(1, 2)):
+            index = rng.randrange(len(lines))
+            lines[index] = lines[index].rstrip("\n") + "  # fixed\n"
+        return "".join(lines)
+
+    # Reiterate, update and regenerate rewrite a few values and add a block.
+    for _ in range(rng.randint(2, 5)):
+        index = rng.randrange(len(lines))
+        if ": " in lines[index]:
+            key, _ = lines[index].split(": ", 1)
+            lines[index] = f"{key}: value-{rng.randint(0, 9999)}\n"
+    block = [
+        f"  Queue{rng.randint(0, 9999)}:\n",
+        "    Type: AWS::SQS::Queue\n",
+        "    Properties:\n",
+        f"      VisibilityTimeout: {rng.randint(30, 900)}\n",
+    ]
+    index = rng.randrange(len(lines))
+    return "".join(lines[:index] + block + lines[index:])
+
+
+def examples():
+    for domain in sorted(os.listdir(INGEST_DIR)):
+        domain_path = os.path.join(INGEST_DIR, domain)
+        if not os.path.isdir(domain_path):
+            continue
+        for domain_file in sorted(os.listdir(domain_path)):
+            if domain_file.endswith(".yaml"):
+                with open(os.path.join(domain_path, domain_file)) as yaml_file:
+                    yield f"{domain}/{domain_file}", yaml_file.read()
+
+
+def read_all(store, sessions):
+    latencies = list()
+    for sessionId, versions in sessions.items():
+        for version, template in versions.items():
+            start = time.perf_counter()
+            assert store.get(sessionId, version=version) == template, (sessionId, version)
+            latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def benchmark(turns, latency, seed):
+    rng = random.Random(seed)
+    table = LocalTable()
+    store = TemplateStore(table)
+    sessions = dict()
+
+    for sessionId, template in examples():
+        sessions[sessionId] = dict()
+        for _ in range(turns):
+            for step in STEPS:
+                template = edit(template, step, rng)
+                version = store.put(sessionId, template)
+                sessions[sessionId]["v" + str(version)] = template
+        sessions[sessionId]["v0"] = template
+
+    encodings = dict()
+    for item in table.items.values():
+        encodings[item["encoding"]] = encodings.get(item["encoding"], 0) + 1
+
+    table.latency = latency
+    cold = read_all(TemplateStore(table), sessions)
+    warm = read_all(store, sessions)
+    table.latency = 0
+
+    return {
+        "sessions": len(sessions),
+        "versions": sum(len(versions) - 1 for versions in sessions.values()),
+        "encodings": encodings,
+        "full_text_bytes": store.template_bytes,
+        "stored_bytes": store.stored_bytes,
+        "max_item_bytes": max(len(item["body"]) for item in table.items.values()),
+        "read_ms": {
+            name: {"p50": statistics.median(latencies), "p95": _p95(latencies)}
+            for name, latencies in (("cold", cold), ("warm", warm))
+        },
+    }
+
+
+def _p95(latencies):
+    return statistics.quantiles(latencies, n=20)[-1]
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    results = benchmark(args.turns, args.latency_ms / 1000, args.seed)
+
+    print(f"{results['sessions']} sessions, {results['versions']} versions, items {results['encodings']}")
+    print(
+        f"bytes full text {results['full_text_bytes']} -> stored {results['stored_bytes']} "
+        f"({results['stored_bytes'] / results['full_text_bytes']:.2f}), largest item body {results['max_item_bytes']}"
+    )
+    for name, result in results["read_ms"].items():
+        print(f"read {name:<5} p50 {result['p50']:>7.2f} ms   p95 {result['p95']:>7.2f} ms")
+
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump({"turns": args.turns, "latency_ms": args.latency_ms, **results}, json_file, indent=2)
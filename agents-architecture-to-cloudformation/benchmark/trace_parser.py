@@ -0,0 +1,143 @@
+"""
+Benchmarks the parsing of the trace of a Bedrock Agent invocation in BedrockAgent.invoke_agent.
+
+The completion stream of invoke_agent is replayed from memory: --steps orchestration steps, each with a model
+invocation input, a rationale, a tool call carrying a --resources template and the tool output carrying the
+generated template.
+
+- legacy: every orchestration trace is dumped with json.dumps(..., indent=3), loaded back with json.loads to find
+  the tool, and kept as the pretty-printed string, the behaviour before util.invoke.trace.
+- typed: util.invoke.trace.TraceParser builds compact records holding references to the event payloads, the JSON
+  is only formatted when a record is expanded.
+
+"retained" is the memory held by the trace records once the stream is parsed (tracemalloc), and "expand" is the
+cost of formatting one tool call record when the user opens it.
+
+Run from agents-architecture-to-cloudformation/:
+
+    python -m benchmark.trace_parser --steps 12 --resources 80 --runs 20
+"""
+
+from argparse import ArgumentParser
+import json
+import statistics
+import time
+import tracemalloc
+
+from benchmark.standins import synthetic_template
+from util.invoke.trace import TraceParser
+
+parser = ArgumentParser()
+parser.add_argument("--steps", type=int, default=12)
+parser.add_argument("--resources", type=int, default=80)
+parser.add_argument("--runs", type=int, default=20)
+parser.add_argument("--json", type=str, default=None)
+
+
+def completion(args):
+    template = synthetic_template(args.resources)
+    events = list()
+    for step in range(args.steps):
+        trace_id = f"benchmark-trace-{step}"
+        api_path = ("/generateCloudFormation", "/reiterateCloudFormation", "/validateCloudFormation")[step % 3]
+        orchestration = [
+            {"modelInvocationInput": {"traceId": trace_id, "text": "Human: " + template * 2, "type": "ORCHESTRATION"}},
+            {"rationale": {"traceId": trace_id, "text": f"I will call {api_path} with the template."}},
+            {
+                "invocationInput": {
+                    "traceId": trace_id,
+                    "invocationType": "ACTION_GROUP",
+                    "actionGroupInvocationInput": {
+                        "actionGroupName": "benchmark",
+                        "apiPath": api_path,
+                        "verb": "post",
+                        "requestBody": {"content": {"application/json": [{"name": "template", "type": "string", "value": template}]}},
+                    },
+                }
+            },
+            {
+                "observation": {
+                    "traceId": trace_id,
+                    "type": "ACTION_GROUP",
+                    "actionGroupInvocationOutput": {"text": json.dumps({"CloudformationTemplate": template})},
+                }
+            },
+        ]
+        events += [{"trace": {"agentId": "benchmark", "trace": {"orchestrationTrace": trace}}} for trace in orchestration]
+    events.append({"chunk": {"bytes": b"The CloudFormation template is valid."}})
+    return events
+
+
+def legacy(events):
+    # The loop of invoke_agent before the typed trace records, without the rendering.
+    trace_text = list()
+    for event in events:
+        if "trace" in event:
+            trace_obj = event["trace"]["trace"]
+            if "orchestrationTrace" in trace_obj:
+                trace_dump = json.dumps(trace_obj["orchestrationTrace"], indent=3)
+                if "rationale" in trace_obj["orchestrationTrace"]:
+                    trace_text.append(
+                        {"heading": "Rationale", "category": "rationale", "content": trace_obj["orchestrationTrace"]["rationale"]["text"]}
+                    )
+                elif "modelInvocationInput" not in trace_obj["orchestrationTrace"]:
+                    tools = json.loads(trace_dump)
+                    if "invocationInput" in tools:
+                        tool_used = tools["invocationInput"]["actionGroupInvocationInput"]["apiPath"]
+                        trace_text.append({"heading": f"Tool call {tool_used}", "category": "invocationInput", "content": trace_dump})
+                    if "observation" in tools:
+                        tool_used = trace_text[-1]["heading"].split()[-1]
+                        trace_text.append({"heading": f"Tool output {tool_used}", "category": "observation", "content": trace_dump})
+    return trace_text
+
+
+def typed(events):
+    trace = TraceParser()
+    for event in events:
+        if "trace" in event:
+            trace.feed(event)
+    return trace.records
+
+
+def measure(args, parse, expand):
+    events = completion(args)
+    runs = list()
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        parse(events)
+        runs.append((time.perf_counter() - start) * 1000)
+
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    records = parse(events)
+    retained = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    expand(records[1])
+    return {
+        "parse_p50_ms": statistics.median(runs),
+        "records": len(records),
+        "retained_kb": retained / 1024,
+        "expand_ms": (time.perf_counter() - start) * 1000,
+    }
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    results = {
+        "legacy": measure(args, legacy, lambda record: record["content"]),
+        "typed": measure(args, typed, lambda record: record.content),
+    }
+
+    print(f"{'trace':<7} {'parse p50':>10} {'records':>8} {'retained':>10} {'expand':>9}")
+    for name, result in results.items():
+        print(
+            f"{name:<7} {result['parse_p50_ms']:>7.2f} ms {result['records']:>8} "
+            f"{result['retained_kb']:>7.0f} KB {result['expand_ms']:>6.2f} ms"
+        )
+
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump({"args": vars(args), "results": results}, json_file, indent=2)
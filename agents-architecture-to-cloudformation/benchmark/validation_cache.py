@@ -0,0 +1,107 @@
+"""
+Benchmarks repeated /validateCloudFormation actions of the action group Lambda with the validation cache.
+
+A session generates a template once, then validates it --repeats times, as the agent does when resolve returns
+the template unchanged or the user clicks Validate again. The first validation misses the cache, the following ones
+are served from memory, and a fresh container (module state reset) is served from DynamoDB. The Lambda runs
+against in-memory stand-ins of CloudFormation and DynamoDB with injected round-trip latencies.
+
+Run from agents-architecture-to-cloudformation/:
+
+    python -m benchmark.validation_cache --validate-ms 150 --storage-ms 5 --repeats 5
+"""
+
+from argparse import ArgumentParser
+import importlib
+import json
+import os
+import statistics
+import sys
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path[:0] = [os.path.join(APP_DIR, "util", "agent"), os.path.join(APP_DIR, "util", "prompt_templates")]
+os.environ.setdefault("KnowledgeBaseId", "benchmark")
+os.environ.setdefault("EnvironmentName", "bench")
+os.environ.setdefault("BedrockModelId", "anthropic.claude-3-sonnet-20240229-v1:0")
+
+from benchmark.standins import TEMPLATE, LocalCloudFormation, LocalTable
+
+parser = ArgumentParser()
+parser.add_argument("--validate-ms", type=float, default=150.0)
+parser.add_argument("--storage-ms", type=float, default=5.0)
+parser.add_argument("--repeats", type=int, default=5)
+parser.add_argument("--json", type=str, default=None)
+
+
+def reset(action_group, table, cfn):
+    # A fresh container: no client, store or cache survives, only the DynamoDB table does.
+    action_group._clients.clear()
+    action_group._clients["cloudformation"] = cfn
+    action_group._table = table
+    action_group._template_store = None
+    action_group._validation_cache = None
+
+
+def validate(action_group, table, cfn):
+    calls, writes = cfn.calls["validate_template"], _writes(table)
+    start = time.perf_counter()
+    response = action_group.lambda_handler(
+        {
+            "actionGroup": "benchmark",
+            "apiPath": "/validateCloudFormation",
+            "httpMethod": "POST",
+            "sessionId": "benchmark",
+            "sessionAttributes": {"validate_counter": "0"},
+        },
+        None,
+    )["response"]
+    elapsed = time.perf_counter() - start
+    assert response["httpStatusCode"] == 200, response
+    return {
+        "ms": elapsed * 1000,
+        "cached": response["responseBody"]["application/json"]["body"]["cached"],
+        "validate_template_calls": cfn.calls["validate_template"] - calls,
+        "dynamodb_writes": _writes(table) - writes,
+    }
+
+
+def _writes(table):
+    return table.calls["put_item"] + table.calls["update_item"] + 2 * table.calls["transact_write_items"]
+
+
+def summary(runs):
+    return {
+        "p50_ms": statistics.median(run["ms"] for run in runs),
+        "cached": sum(run["cached"] for run in runs),
+        "validate_template_calls": sum(run["validate_template_calls"] for run in runs),
+        "dynamodb_writes": sum(run["dynamodb_writes"] for run in runs),
+    }
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    action_group = importlib.import_module("lambda")
+
+    table = LocalTable(latency=args.storage_ms / 1000)
+    cfn = LocalCloudFormation(latency=args.validate_ms / 1000)
+    reset(action_group, table, cfn)
+    action_group.get_template_store().put(sessionId="benchmark", template=TEMPLATE)
+
+    results = {
+        "first": summary([validate(action_group, table, cfn)]),
+        "repeat (memory)": summary([validate(action_group, table, cfn) for _ in range(args.repeats)]),
+    }
+    reset(action_group, table, cfn)
+    results["new container (dynamodb)"] = summary([validate(action_group, table, cfn)])
+
+    print(f"{'validation':<26} {'p50':>9} {'cached':>7} {'validate_template':>18} {'writes (WCU)':>13}")
+    for name, result in results.items():
+        print(
+            f"{name:<26} {result['p50_ms']:>6.1f} ms {result['cached']:>7} {result['validate_template_calls']:>18} "
+            f"{result['dynamodb_writes']:>13}"
+        )
+
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump({"args": vars(args), "results": results}, json_file, indent=2)
@@ -0,0 +1,246 @@
+"""
+The steps of the CloudFormation actions, shared by the agent action group Lambda and the direct pipeline of the
+Streamlit app so both run the same prompts and the same validation.
+
+Every builder returns the (system prompt, Converse messages) of a model call, the caller invokes the model and
+decides where the template is read from and persisted to.
+"""
+
+try:
+    # In the Lambda zip the prompt templates and the validator are copied next to this module.
+    from cfn_validator import validate_template, validator_version
+    from validation_cache import ValidationCache
+    import generateCloudFormationPrompt, reiterateCloudFormationPrompt, resolveErrorPrompt, updateInstructionPrompt, sys_generateCloudFormationPrompt, sys_reiterateCloudFormationPrompt, sys_resolveErrorPrompt, sys_updateInstructionPrompt
+except ImportError:
+    from util.agent.cfn_validator import validate_template, validator_version
+    from util.agent.validation_cache import ValidationCache
+    from util.prompt_templates import generateCloudFormationPrompt, reiterateCloudFormationPrompt, resolveErrorPrompt, updateInstructionPrompt, sys_generateCloudFormationPrompt, sys_reiterateCloudFormationPrompt, sys_resolveErrorPrompt, sys_updateInstructionPrompt
+
+import datetime
+
+CACHE_POINT = {"cachePoint": {"type": "default"}}
+RETRIEVAL_CONFIGURATION = {
+    "vectorSearchConfiguration": {
+        "numberOfResults": 3,
+        "overrideSearchType": "HYBRID",
+    }
+}
+METADATA_TTL = 900  # Seconds the retrieved documents of a session are kept in DynamoDB
+
+SUMMARY_SYSTEM_PROMPT = """
+        List all the AWS Services in the document. Do output anything else.
+    """
+
+
+def metadata_item(sessionId, retrievalResults):
+    """
+    Builds the METADATA item holding the documents retrieved from the knowledge base for a session.
+
+    Args:
+        sessionId (str): The ID of the session.
+        retrievalResults (list): The retrievalResults of the knowledge base retrieve call.
+
+    Returns:
+        dict: The METADATA item, one "documentN" attribute per retrieved document.
+    """
+    item = {
+        "sessionId": sessionId,
+        "version": "METADATA",
+        "creationDate": str(int(datetime.datetime.now(tz=datetime.timezone.utc).timestamp())),
+        "ttl": int((datetime.datetime.now() + datetime.timedelta(seconds=METADATA_TTL)).timestamp()),
+    }
+    for idx, result in enumerate(retrievalResults):
+        item[f"document{idx}"] = result["metadata"]
+    return item
+
+
+def example_uris(metadata):
+    """
+    Returns the S3 URIs of the example templates of a METADATA item.
+
+    Args:
+        metadata (dict): The METADATA item.
+
+    Returns:
+        list: The S3 URIs, "s3://bucket/key".
+    """
+    return [v["cfn_stack"] for k, v in metadata.items() if "document" in k]
+
+
+def get_example_messages(documents, prompt, prompt_cache=False):
+    """
+    Builds the user message with the retrieved example templates followed by the action prompt.
+    The examples are the static prefix shared by every action of a session, when prompt caching is enabled a
+    cachePoint is inserted after them so the following actions read the prefix from the prompt cache.
+
+    Args:
+        documents (list): The example CloudFormation templates retrieved from the knowledge base.
+        prompt (str): The action prompt.
+        prompt_cache (bool): Whether to insert a cachePoint after the examples.
+
+    Returns:
+        list: A list of Converse messages.
+    """
+    content = [
+        {
+            "text": f"""Take this example CloudFormation YAML code as a refernce <example{idx}></example{idx}>:
+                            <example{idx}>
+                                {document}
+                            </example{idx}>
+                            """,
+        }
+        for idx, document in enumerate(documents)
+    ]
+    if prompt_cache and documents:
+        content.append(CACHE_POINT)
+    content.append({"text": prompt})
+
+    return [{"role": "user", "content": content}]
+
+
+def summary_request(explain):
+    """
+    Returns the model call listing the AWS services of an architecture explanation.
+
+    Args:
+        explain (str): The architecture explanation.
+
+    Returns:
+        tuple: The system prompt and the Converse messages.
+    """
+    _prompt = f"""
+        <document>
+        {explain}
+        </document>
+
+    """
+    return SUMMARY_SYSTEM_PROMPT, [{"role": "user", "content": [{"text": _prompt}]}]
+
+
+def generate_request(architectureExplanation, documents, prompt_cache=False):
+    """
+    Returns the model call generating a CloudFormation template from an architecture explanation.
+
+    Args:
+        architectureExplanation (str): The architecture explanation.
+        documents (list): The example CloudFormation templates.
+        prompt_cache (bool): Whether to insert a cachePoint after the examples.
+
+    Returns:
+        tuple: The system prompt and the Converse messages.
+    """
+    _system_prompt = sys_generateCloudFormationPrompt.SYS_GENERATE_CLOUDFORMATION_PROMPT
+    _prompt = generateCloudFormationPrompt.GENERATE_CLOUDFORMATION_PROMPT.replace("{{architectureExplanation}}", architectureExplanation)
+    return _system_prompt, get_example_messages(documents=documents, prompt=_prompt, prompt_cache=prompt_cache)
+
+
+def reiterate_request(cloudformationTemplate, documents, prompt_cache=False):
+    """
+    Returns the model call reiterating a CloudFormation template with AWS best practices.
+
+    Args:
+        cloudformationTemplate (str): The CloudFormation template.
+        documents (list): The example CloudFormation templates.
+        prompt_cache (bool): Whether to insert a cachePoint after the examples.
+
+    Returns:
+        tuple: The system prompt and the Converse messages.
+    """
+    _system_prompt = sys_reiterateCloudFormationPrompt.SYS_REITERATE_CLOUDFORMATION_PROMPT
+    _prompt = reiterateCloudFormationPrompt.REITERATE_CLOUDFORMATION_PROMPT.replace("{{cloudformationTemplate}}", cloudformationTemplate)
+    return _system_prompt, get_example_messages(documents=documents, prompt=_prompt, prompt_cache=prompt_cache)
+
+
+def update_request(cloudformationTemplate, updateInstruction, documents, prompt_cache=False):
+    """
+    Returns the model call updating a CloudFormation template with a user instruction.
+
+    Args:
+        cloudformationTemplate (str): The CloudFormation template.
+        updateInstruction (str): The update instruction.
+        documents (list): The example CloudFormation templates.
+        prompt_cache (bool): Whether to insert a cachePoint after the examples.
+
+    Returns:
+        tuple: The system prompt and the Converse messages.
+    """
+    _system_prompt = sys_updateInstructionPrompt.SYS_UPDATE_CLOUDFORMATION_PROMPT
+    _prompt = updateInstructionPrompt.UPDATE_CLOUDFORMATION_PROMPT.replace("{{cloudformationTemplate}}", cloudformationTemplate).replace("{{updateInstruction}}", updateInstruction)
+    return _system_prompt, get_example_messages(documents=documents, prompt=_prompt, prompt_cache=prompt_cache)
+
+
+def resolve_request(cloudformationTemplate, cloudformationInstruction, documents, prompt_cache=False):
+    """
+    Returns the model call resolving the validation errors of a CloudFormation template.
+
+    Args:
+        cloudformationTemplate (str): The CloudFormation template.
+        cloudformationInstruction (str): The validation errors to resolve.
+        documents (list): The example CloudFormation templates.
+        prompt_cache (bool): Whether to insert a cachePoint after the examples.
+
+    Returns:
+        tuple: The system prompt and the Converse messages.
+    """
+    _system_prompt = sys_resolveErrorPrompt.SYS_RESOLVE_CLOUDFORMATION_PROMPT
+    _prompt = resolveErrorPrompt.RESOLVE_CLOUDFORMATION_PROMPT.replace("{{cloudformationTemplate}}", cloudformationTemplate).replace("{{cloudformationInstruction}}", cloudformationInstruction)
+    return _system_prompt, get_example_messages(documents=documents, prompt=_prompt, prompt_cache=prompt_cache)
+
+
+def validation_cache(table):
+    """
+    Returns a validation cache storing results in the templatestorage table, keyed by the validator version.
+
+    Args:
+        table (boto3.resources.factory.dynamodb.Table): The templatestorage table.
+
+    Returns:
+        ValidationCache: The validation cache.
+    """
+    return ValidationCache(table, validator=validator_version())
+
+
+def check_template(cloudformationTemplate, cfn, cache=None):
+    """
+    Validates a CloudFormation template, locally first and with cfn.validate_template only if the local checks pass.
+    With a cache, a stored result of the same normalised template is returned without validating it again. Only
+    the results of cfn.validate_template are stored.
+
+    Args:
+        cloudformationTemplate (str): The CloudFormation template.
+        cfn (botocore.client.CloudFormation): The CloudFormation client.
+        cache (ValidationCache): The validation cache, None to always validate.
+
+    Returns:
+        tuple: Whether the template is valid, the validation errors and where the result came from, one of
+            "memory", "dynamodb" (cache hits), "local_invalid", "remote" or "remote_error".
+    """
+    if cache is not None:
+        cached = cache.get(cloudformationTemplate)
+        if cached is not None:
+            print(f"Cloudformation validation cache hit ({cached[2]})")
+            return cached
+
+    is_valid, validation_errors, source = _check_template(cloudformationTemplate, cfn)
+    # Only the verdicts of CloudFormation are stored. Throttling or network errors say nothing about the template,
+    # and the local checks are cheap to rerun: a false positive of theirs must not outlive a fix of the validator.
+    if cache is not None and source == "remote":
+        cache.put(cloudformationTemplate, is_valid, validation_errors)
+    return is_valid, validation_errors, source
+
+
+def _check_template(cloudformationTemplate, cfn):
+    # Templates failing the local checks go straight back to resolve, only clean ones are validated remotely.
+    local_errors = validate_template(cloudformationTemplate)
+    if local_errors:
+        print(f"Cloudformation template invalid: {local_errors}")
+        return False, f"Cloudformation template invalid: {'; '.join(local_errors)}", "local_invalid"
+
+    try:
+        cfn.validate_template(TemplateBody=cloudformationTemplate)
+    except Exception as ex:
+        print(f"Cloudformation template invalid: {ex}")
+        code = getattr(ex, "response", dict()).get("Error", dict()).get("Code")
+        return False, f"Cloudformation template invalid: {ex}", "remote" if code == "ValidationError" else "remote_error"
+    print("Cloudformation valid")
+    return True, str(), "remote"
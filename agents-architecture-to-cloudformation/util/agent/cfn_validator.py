@@ -0,0 +1,282 @@
+"""
+Local CloudFormation validation run before the remote cfn.validate_template call.
+
+The resource specification index is built at packaging time from the CloudFormation resource specification:
+
+    python3 cfn_validator.py CloudFormationResourceSpecification.json resource_spec.pickle
+
+and unpickled once per container on the first validation. Without the index only the parsing and reference
+checks run.
+"""
+
+from argparse import ArgumentParser
+import gzip
+import json
+import os
+import pickle
+import re
+
+SPEC_INDEX_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "resource_spec.pickle")
+
+PSEUDO_PARAMETERS = {
+    "AWS::AccountId",
+    "AWS::NotificationARNs",
+    "AWS::NoValue",
+    "AWS::Partition",
+    "AWS::Region",
+    "AWS::StackId",
+    "AWS::StackName",
+    "AWS::URLSuffix",
+}
+# Types without a fixed schema, their properties and attributes are not checked.
+SCHEMALESS_TYPES = ("Custom::", "AWS::CloudFormation::CustomResource")
+SUB_VARIABLE = re.compile(r"\$\{(?!!)([^}]+)\}")
+
+_spec_index = None
+_template_loader = None
+
+
+def get_template_loader():
+    """
+    Returns the YAML loader of CloudFormation templates, importing PyYAML on first use to keep it off the cold start.
+
+    Returns:
+        yaml.SafeLoader: A (C)SafeLoader reading the short-form intrinsic tags as their long form, or None if PyYAML is
+            not installed.
+    """
+    global _template_loader
+    if _template_loader is not None:
+        return _template_loader
+    try:
+        import yaml
+    except ImportError:
+        print("PyYAML is not installed, skipping the local validation")
+        return None
+
+    # The libyaml parser shipped in the PyYAML wheels is several times faster than the pure Python one.
+    class TemplateLoader(getattr(yaml, "CSafeLoader", yaml.SafeLoader)):
+        pass
+
+    def construct_intrinsic(loader, tag_suffix, node):
+        if isinstance(node, yaml.ScalarNode):
+            value = loader.construct_scalar(node)
+        elif isinstance(node, yaml.SequenceNode):
+            value = loader.construct_sequence(node, deep=True)
+        else:
+            value = loader.construct_mapping(node, deep=True)
+
+        if tag_suffix == "Ref":
+            return {"Ref": value}
+        if tag_suffix == "Condition":
+            return {"Condition": value}
+        if tag_suffix == "GetAtt" and isinstance(value, str):
+            value = value.split(".", 1)
+        return {"Fn::" + tag_suffix: value}
+
+    TemplateLoader.add_multi_constructor("!", construct_intrinsic)
+    # Dates such as AWSTemplateFormatVersion stay strings, like CloudFormation reads them.
+    TemplateLoader.yaml_implicit_resolvers = {
+        first: [(tag, regexp) for tag, regexp in resolvers if tag != "tag:yaml.org,2002:timestamp"]
+        for first, resolvers in yaml.SafeLoader.yaml_implicit_resolvers.items()
+    }
+    _template_loader = TemplateLoader
+    return _template_loader
+
+
+def load_spec_index(path=SPEC_INDEX_PATH):
+    """
+    Returns the resource specification index, unpickling it on first use.
+
+    Args:
+        path (str): The path of the pickled index.
+
+    Returns:
+        dict: {"version", "types": {type: (required properties, properties, attributes)}}, or None if missing.
+    """
+    global _spec_index
+    if _spec_index is None and os.path.exists(path):
+        with open(path, "rb") as index_file:
+            _spec_index = pickle.load(index_file)
+    return _spec_index
+
+
+def validator_version():
+    """
+    Returns the version of the local validation, the resource specification version of the index.
+
+    Returns:
+        str: The specification version, or "local" when only the parsing and reference checks run.
+    """
+    spec_index = load_spec_index()
+    return str(spec_index["version"]) if spec_index else "local"
+
+
+def build_spec_index(specification):
+    """
+    Returns the index of a CloudFormation resource specification.
+
+    Args:
+        specification (dict): The parsed CloudFormationResourceSpecification.json.
+
+    Returns:
+        dict: {"version", "types": {type: (required properties, properties, attributes)}}
+    """
+    types = dict()
+    for resource_type, definition in specification["ResourceTypes"].items():
+        properties = definition.get("Properties", dict())
+        types[resource_type] = (
+            frozenset(name for name, prop in properties.items() if prop.get("Required")),
+            frozenset(properties),
+            frozenset(definition.get("Attributes", dict())),
+        )
+    return {"version": specification.get("ResourceSpecificationVersion"), "types": types}
+
+
+def validate_template(template, spec_index=None):
+    """
+    Validates a CloudFormation template locally.
+
+    Args:
+        template (str): The CloudFormation template, YAML or JSON.
+        spec_index (dict): The resource specification index, loaded from SPEC_INDEX_PATH when None.
+
+    Returns:
+        list: The validation errors, empty if the template passed the local checks.
+    """
+    loader = get_template_loader()
+    if loader is None:
+        return list()
+
+    parser = loader(template)
+    try:
+        body = parser.get_single_data()
+    except Exception as ex:
+        return [f"Template format error: {ex}"]
+    finally:
+        parser.dispose()
+
+    if not isinstance(body, dict):
+        return ["Template format error: the template is not a mapping"]
+    resources = body.get("Resources")
+    if not isinstance(resources, dict) or not resources:
+        return ["Template format error: at least one Resources member must be defined"]
+
+    # Transforms such as AWS::Serverless create resources implicitly (ServerlessRestApi, <Function>Role...) that
+    # references may target, the template is left to the remote check.
+    if body.get("Transform"):
+        return list()
+
+    if spec_index is None:
+        spec_index = load_spec_index()
+
+    parameters = body.get("Parameters") if isinstance(body.get("Parameters"), dict) else dict()
+    conditions = body.get("Conditions") if isinstance(body.get("Conditions"), dict) else dict()
+
+    errors = list()
+    for name, resource in resources.items():
+        if not isinstance(resource, dict) or not isinstance(resource.get("Type"), str):
+            errors.append(f"Resource {name} must define a Type")
+            continue
+        errors.extend(_check_resource(name, resource, spec_index))
+
+        depends_on = resource.get("DependsOn", list())
+        for dependency in [depends_on] if isinstance(depends_on, str) else depends_on:
+            if dependency not in resources:
+                errors.append(f"Resource {name} DependsOn unknown resource {dependency}")
+        if "Condition" in resource and resource["Condition"] not in conditions:
+            errors.append(f"Resource {name} uses unknown condition {resource['Condition']}")
+
+    for path, kind, target, attribute in _references(body):
+        if kind == "Ref":
+            if target not in parameters and target not in resources and target not in PSEUDO_PARAMETERS:
+                errors.append(f"Unresolved resource dependency [{target}] in {path}")
+        elif target not in resources:
+            errors.append(f"Unresolved resource dependency [{target}] in Fn::GetAtt of {path}")
+        elif attribute and spec_index is not None:
+            errors.extend(_check_attribute(path, resources[target], target, attribute, spec_index))
+    return errors
+
+
+def _check_resource(name, resource, spec_index):
+    resource_type = resource["Type"]
+    if spec_index is None or not resource_type.startswith("AWS::") or resource_type.startswith(SCHEMALESS_TYPES):
+        return list()
+    if resource_type not in spec_index["types"]:
+        return [f"Resource {name} has unrecognized resource type {resource_type}"]
+
+    required, known, _ = spec_index["types"][resource_type]
+    properties = resource.get("Properties", dict())
+    # Properties built by an intrinsic function cannot be checked before deployment.
+    if not isinstance(properties, dict) or any(key.startswith("Fn::") for key in properties):
+        return list()
+
+    errors = [f"Resource {name} is missing required property {prop}" for prop in sorted(required - properties.keys())]
+    errors.extend(
+        f"Resource {name} has unsupported property {prop} for {resource_type}"
+        for prop in sorted(properties.keys() - known)
+    )
+    return errors
+
+
+def _check_attribute(path, resource, target, attribute, spec_index):
+    resource_type = resource.get("Type", "")
+    if resource_type.startswith(SCHEMALESS_TYPES) or resource_type not in spec_index["types"]:
+        return list()
+    attributes = spec_index["types"][resource_type][2]
+    # Nested stack outputs ("Outputs.Name") and similar attributes are only known once deployed.
+    if attribute in attributes or attribute.split(".", 1)[0] in attributes or "." in attribute:
+        return list()
+    return [f"Resource {target} of type {resource_type} has no attribute {attribute}, in {path}"]
+
+
+def _references(node, path="Template"):
+    """
+    Yields every (path, "Ref" or "GetAtt", target, attribute) of a parsed template, including Fn::Sub variables.
+    """
+    if isinstance(node, list):
+        for item in node:
+            yield from _references(item, path)
+        return
+    if not isinstance(node, dict):
+        return
+
+    for key, value in node.items():
+        if key == "Ref" and isinstance(value, str):
+            yield path, "Ref", value, None
+        elif key == "Fn::GetAtt":
+            if isinstance(value, str):
+                value = value.split(".", 1)
+            if isinstance(value, list) and value and isinstance(value[0], str):
+                attribute = value[1] if len(value) > 1 and isinstance(value[1], str) else None
+                yield path, "GetAtt", value[0], attribute
+        elif key == "Fn::Sub":
+            string, variables = value, dict()
+            if isinstance(value, list) and len(value) == 2 and isinstance(value[1], dict):
+                string, variables = value
+            if isinstance(string, str):
+                for variable in SUB_VARIABLE.findall(string):
+                    target, _, attribute = variable.strip().partition(".")
+                    if target in variables:
+                        continue
+                    yield path, "GetAtt" if attribute else "Ref", target, attribute or None
+            yield from _references(variables, path)
+        else:
+            child = f"{path}/{key}" if path.count("/") < 2 else path
+            yield from _references(value, child)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Builds the resource specification index of the local validation.")
+    parser.add_argument("specification", type=str)
+    parser.add_argument("index", type=str, nargs="?", default=SPEC_INDEX_PATH)
+    args = parser.parse_args()
+
+    with open(args.specification, "rb") as specification_file:
+        content = specification_file.read()
+    if content[:2] == b"\x1f\x8b":
+        content = gzip.decompress(content)
+
+    index = build_spec_index(json.loads(content))
+    with open(args.index, "wb") as index_file:
+        pickle.dump(index, index_file, protocol=pickle.HIGHEST_PROTOCOL)
+    print(f"Indexed {len(index['types'])} resource types of specification {index['version']}")
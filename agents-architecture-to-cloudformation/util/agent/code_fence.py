@@ -0,0 +1,155 @@
+import re
+import time
+
+CHARS_PER_TOKEN = 4  # Rough character to token ratio, output tokens are not reported for a stream closed early
+
+# A fence line opens with ``` and an optional info string ("```yaml"), and closes with a bare ```.
+OPENING_FENCE = re.compile(r"^([ \t]*)```[^`\n]*\n", re.MULTILINE)
+
+
+def closing_fence(indent):
+    """
+    Returns the pattern of the fence closing a block opened at an indentation of `indent` characters. A ``` line
+    indented deeper is content of the block, for example inline Lambda code in a YAML block scalar.
+    """
+    return re.compile(r"^[ \t]{0,%d}```[ \t]*(?:\n|\Z)" % indent, re.MULTILINE)
+
+
+class CodeFenceExtractor:
+    """CodeFenceExtractor class extracting the first fenced code block of a streamed model output.
+
+    Deltas are fed as they arrive. Complete lines are set aside and only the last incomplete line is scanned with
+    the deltas following it, once a newline arrives, so a fence split across deltas is still found and every
+    character is copied and scanned about once. feed() returns True as soon as the closing fence line is complete,
+    the caller then stops reading the stream. An output without an opening fence is returned whole, and a block cut
+    by maxTokens is returned up to where it stopped.
+
+    Usage:
+
+    extractor = CodeFenceExtractor()
+
+    # Returns True once the code block closed.
+    done = extractor.feed(delta)
+
+    # Returns the content of the code block, without the fences.
+    template = extractor.template()
+    """
+
+    def __init__(self):
+        self._lines = list()
+        self._tail = list()
+        self._offset = 0
+        self._start = None
+        self._end = None
+        self._closing = None
+        self.chars = 0
+
+    @property
+    def closed(self):
+        return self._end is not None
+
+    def feed(self, delta):
+        """
+        Appends a delta of the model output.
+
+        Args:
+            delta (str): The text of a contentBlockDelta.
+
+        Returns:
+            bool: True if the code block is complete and the rest of the output can be skipped.
+        """
+        if self.closed:
+            return True
+        self._tail.append(delta)
+        self.chars += len(delta)
+        # Both fences end with a newline, a delta without one cannot complete either of them.
+        if "\n" not in delta:
+            return False
+        tail = "".join(self._tail)
+
+        if self._start is None:
+            match = OPENING_FENCE.search(tail)
+            if match is None:
+                self._set_aside(tail, tail.rfind("\n") + 1)
+                return False
+            self._start = self._offset + match.end()
+            self._closing = closing_fence(len(match.group(1)))
+            tail = self._set_aside(tail, match.end())
+
+        match = self._closing.search(tail)
+        # A fence at the very end of the text may still get an info string, wait for its newline.
+        if match is None or not match.group().endswith("\n"):
+            self._set_aside(tail, tail.rfind("\n") + 1)
+            return False
+        self._end = self._offset + match.start()
+        return True
+
+    def template(self):
+        """
+        Returns the content of the code block.
+
+        Returns:
+            str: The code block without its fences, or the whole output if it has no opening fence.
+        """
+        text = "".join(self._lines) + "".join(self._tail)
+        if self._start is None:
+            return text.strip()
+        if self._end is None:
+            # The stream ended on the closing fence line, or maxTokens cut the block.
+            match = self._closing.search(text, self._offset)
+            return text[self._start : match.start() if match else len(text)].strip("\n")
+        return text[self._start : self._end].strip("\n")
+
+    def _set_aside(self, tail, index):
+        # Moves the lines of the tail before `index` out of the scanned text and returns the rest.
+        self._lines.append(tail[:index])
+        self._offset += index
+        tail = tail[index:]
+        self._tail = [tail]
+        return tail
+
+
+def read_code_block(stream, on_delta=None, deadline=None):
+    """
+    Reads a converse_stream event stream until its first code block closes, then closes the stream.
+
+    Args:
+        stream (botocore.eventstream.EventStream): The "stream" of the converse_stream response.
+        on_delta (function): Called with every text delta read, for example to render it.
+        deadline (float): time.monotonic() value after which the stream is closed unfinished, None for no deadline.
+
+    Returns:
+        tuple: The CodeFenceExtractor and the stream statistics {"stopped_early", "timed_out", "stop_reason",
+            "output_tokens", "wall_ms", "usage"}, output_tokens is estimated from the characters read when the stream
+            was closed before its usage.
+    """
+    start = time.perf_counter()
+    extractor = CodeFenceExtractor()
+    usage, stop_reason, stopped_early, timed_out = None, None, False, False
+    for event in stream:
+        if deadline is not None and time.monotonic() >= deadline:
+            timed_out = True
+            break
+        if "contentBlockDelta" in event:
+            delta = event["contentBlockDelta"]["delta"].get("text", "")
+            if on_delta is not None:
+                on_delta(delta)
+            if extractor.feed(delta):
+                stopped_early = True
+                break
+        elif "messageStop" in event:
+            stop_reason = event["messageStop"].get("stopReason")
+        elif "metadata" in event:
+            usage = event["metadata"].get("usage", dict())
+    if stopped_early or timed_out:
+        # Closing the connection stops the download, output after the block is neither waited for nor read.
+        stream.close()
+
+    return extractor, {
+        "stopped_early": stopped_early,
+        "timed_out": timed_out,
+        "stop_reason": stop_reason,
+        "output_tokens": usage.get("outputTokens", 0) if usage else extractor.chars // CHARS_PER_TOKEN,
+        "wall_ms": (time.perf_counter() - start) * 1000,
+        "usage": usage or dict(),
+    }
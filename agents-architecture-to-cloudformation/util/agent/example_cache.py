@@ -0,0 +1,123 @@
+from botocore.exceptions import ClientError
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+MAX_WORKERS = 4  # Concurrent S3 downloads per retrieval
+MAX_ENTRIES = 64  # Example bodies kept by the warm container
+REVALIDATE_AFTER = 300  # Seconds an example is served from memory before a conditional GET
+
+
+class ExampleCache:
+    """ExampleCache class holding retrieved example templates in the warm Lambda container.
+
+    Bodies are kept in an LRU keyed by S3 URI together with their ETag. Within REVALIDATE_AFTER seconds an example
+    is served from memory; afterwards it is revalidated with a conditional GET (IfNoneMatch) and only downloaded
+    again when it changed. Missing examples are fetched concurrently on a bounded thread pool.
+
+    Usage:
+
+    cache = ExampleCache()
+
+    # Returns the bodies of the examples, in the order of the URIs. Examples that cannot be read are skipped.
+    documents = cache.get_many(s3, ["s3://bucket/key.yaml"])
+
+    # Returns and resets the counters since the previous call.
+    stats = cache.pop_stats()
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS, max_entries=MAX_ENTRIES, revalidate_after=REVALIDATE_AFTER):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._max_entries = max_entries
+        self._revalidate_after = revalidate_after
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._stats = _empty_stats()
+
+    def get_many(self, s3, uris):
+        """
+        Returns the bodies of the examples stored at the S3 URIs.
+
+        Args:
+            s3 (botocore.client.S3): The S3 client.
+            uris (list): The S3 URIs of the examples, "s3://bucket/key".
+
+        Returns:
+            list: The example bodies in the order of the URIs, examples that cannot be read are skipped.
+        """
+        documents = list(self._executor.map(lambda uri: self.get(s3, uri), uris))
+        return [document for document in documents if document is not None]
+
+    def get(self, s3, uri):
+        """
+        Returns the body of the example stored at an S3 URI.
+
+        Args:
+            s3 (botocore.client.S3): The S3 client.
+            uri (str): The S3 URI of the example, "s3://bucket/key".
+
+        Returns:
+            str: The example body, or None if it cannot be read.
+        """
+        with self._lock:
+            entry = self._entries.get(uri)
+            if entry is not None:
+                self._entries.move_to_end(uri)
+                if time.monotonic() - entry["checked"] < self._revalidate_after:
+                    self._stats["hits"] += 1
+                    return entry["body"]
+
+        bucket, key = uri.replace("s3://", "").split("/", 1)
+        request = {"Bucket": bucket, "Key": key}
+        if entry is not None:
+            request["IfNoneMatch"] = entry["etag"]
+
+        try:
+            response = s3.get_object(**request)
+            body = response["Body"].read().decode("utf-8")
+            etag = response.get("ETag")
+            counter = "misses"
+        except ClientError as e:
+            if entry is not None and _not_modified(e):
+                body, etag, counter = entry["body"], entry["etag"], "revalidated"
+            else:
+                if e.response["Error"]["Code"] == "NoSuchKey":
+                    print("The specified object does not exist.")
+                else:
+                    print(f"An error occurred: {e}")
+                with self._lock:
+                    self._stats["errors"] += 1
+                return None
+
+        with self._lock:
+            self._entries[uri] = {"body": body, "etag": etag, "checked": time.monotonic()}
+            self._entries.move_to_end(uri)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+            self._stats[counter] += 1
+        return body
+
+    def pop_stats(self):
+        """
+        Returns and resets the counters since the previous call.
+
+        Returns:
+            dict: {"hits", "revalidated", "misses", "errors", "entries"}
+        """
+        with self._lock:
+            stats, self._stats = self._stats, _empty_stats()
+            stats["entries"] = len(self._entries)
+        return stats
+
+
+def _empty_stats():
+    return {"hits": 0, "revalidated": 0, "misses": 0, "errors": 0}
+
+
+def _not_modified(error):
+    return (
+        error.response.get("ResponseMetadata", dict()).get("HTTPStatusCode") == 304
+        or error.response["Error"]["Code"] in ("304", "NotModified")
+    )
@@ -1,99 +1,394 @@
-import sys
-from pip._internal import main
-
-main(
-    [
-        "install",
-        "-I",
-        "-q",
-        "boto3",
-        "--target",
-        "/tmp/",
-        "--no-cache-dir",
-        "--disable-pip-version-check",
-    ]
-)
-sys.path.insert(0, "/tmp/")
-
-from botocore.exceptions import ClientError, ValidationError
-from boto3.session import Session
-from botocore.config import Config
-
-import generateCloudFormationPrompt, reiterateCloudFormationPrompt, resolveErrorPrompt, updateInstructionPrompt, sys_generateCloudFormationPrompt, sys_reiterateCloudFormationPrompt, sys_resolveErrorPrompt, sys_updateInstructionPrompt
-
-import random
-import time
+from code_fence import read_code_block
+from cfn_actions import RETRIEVAL_CONFIGURATION, check_template, example_uris, generate_request, metadata_item, reiterate_request, resolve_request, summary_request, update_request, validation_cache
+from example_cache import ExampleCache
+from model_routes import ModelRouter, parse_routes
+from resilience import REQUESTS_PER_MINUTE, DeadlineExceeded, RetryError, get_resilience
+from service_extractor import get_retrieval_query
+from template_store import TemplateStore
+
+from collections import Counter
 import os
-import datetime
+import time
 
 KnowledgeBaseId = os.environ["KnowledgeBaseId"]
 EnvironmentName = os.environ["EnvironmentName"]
 BedrockModelId = os.environ["BedrockModelId"]
+PromptCaching = os.environ.get("PromptCaching", "false").lower() == "true"
+ModelRoutes = os.environ.get("ModelRoutes", "")
+BedrockRequestsPerMinute = int(os.environ.get("BedrockRequestsPerMinute", REQUESTS_PER_MINUTE))
+
+# Models that rejected cachePoint blocks in this container, they are called without checkpoints afterwards.
+PROMPT_CACHE_UNSUPPORTED = set()
+
+MAX_TOKENS = 4000  # Output tokens of a model call whose route sets no maxTokens
+RESPONSE_MARGIN = 5.0  # Seconds kept to log and return the response before the Lambda is killed
+MIN_MODEL_SECONDS = 10.0  # Budget under which a model call is not started
+MIN_RETRIEVAL_SECONDS = 60.0  # Budget under which a missing METADATA item is not retrieved from the knowledge base
+READ_TIMEOUTS = (5, 10, 20, 40, 80, 160, 300, 600)  # Bedrock read timeouts, one client per timeout used
+TOKENS_PER_SECOND = 30.0  # Initial output throughput estimate, refined by every stream of the container
+
+# Clients are created on first use by the action that needs them and reused by the warm container.
+_session = None
+_clients = dict()
+_table = None
+_template_store = None
+_validation_cache = None
+
+# Example templates retrieved from S3, kept by the warm container across actions and invocations.
+example_cache = ExampleCache()
+
+# Per invocation counters, logged and reset by lambda_handler.
+metrics = Counter()
+
+# time.monotonic() deadline of the running action, set by lambda_handler from the Lambda context.
+_deadline = None
+_tokens_per_second = TOKENS_PER_SECOND
+
+# Model and inference parameters of every action, with the fallback chains and the statistics per route.
+model_router = ModelRouter(default_model_id=BedrockModelId, routes=parse_routes(ModelRoutes))
+
+
+#######################
+##### AWS Clients #####
+#######################
+
+
+def get_session():
+    """
+    Returns the boto3 session shared by all clients, creating it on first use.
+
+    Returns:
+        boto3.session.Session: The session reused by the warm container.
+    """
+    global _session
+    if _session is None:
+        # boto3 is imported lazily so the handler does not pay for it before an action needs a client.
+        from boto3.session import Session
+
+        _session = Session()
+    return _session
+
+
+def get_client(service_name, read_timeout=None):
+    """
+    Returns the client of an AWS service, creating it on first use.
+
+    Args:
+        service_name (str): The AWS service name, for example "bedrock-runtime".
+        read_timeout (int): The read timeout in seconds, None for the default of 600 seconds.
 
-bedrock = Session().client(
-    "bedrock-runtime", config=Config(read_timeout=600, connect_timeout=600)
-)
-cfn = Session().client("cloudformation")
-bedrock_agent = Session().client("bedrock-agent-runtime")
-s3 = Session().client("s3")
-table = Session().resource("dynamodb").Table(f"templatestorage-atc-{EnvironmentName}")
+    Returns:
+        botocore.client.BaseClient: The client reused by the warm container.
+    """
+    key = service_name if read_timeout is None else f"{service_name}:{read_timeout}"
+    if key not in _clients:
+        from botocore.config import Config
+
+        _clients[key] = get_session().client(
+            service_name, config=Config(read_timeout=read_timeout or 600, connect_timeout=600)
+        )
+    return _clients[key]
+
+
+#####################
+##### Deadline #####
+###################
+
+
+class BudgetExhausted(Exception):
+    """Raised when the running action cannot complete before the Lambda timeout."""
+
+
+def remaining_budget():
+    """
+    Returns the seconds left to the running action, None if it has no deadline.
+    """
+    return None if _deadline is None else _deadline - time.monotonic()
+
+
+def check_budget(required, step):
+    """
+    Raises BudgetExhausted if less than `required` seconds are left to the running action.
+    """
+    remaining = remaining_budget()
+    if remaining is not None and remaining < required:
+        raise BudgetExhausted(f"{remaining:.1f}s left before the Lambda timeout, {step} needs {required:.0f}s")
+
+
+def model_limits(max_tokens):
+    """
+    Returns the Bedrock read timeout and the maxTokens the remaining budget allows.
+
+    Args:
+        max_tokens (int): The maxTokens of the route.
+
+    Returns:
+        tuple: The read timeout in seconds, None without deadline, and the maxTokens.
+    """
+    remaining = remaining_budget()
+    if remaining is None:
+        return None, max_tokens
+    check_budget(MIN_MODEL_SECONDS, "a model call")
+    # The largest timeout the budget covers, so a stalled read fails before the Lambda is killed.
+    read_timeout = max([timeout for timeout in READ_TIMEOUTS if timeout <= remaining] or [READ_TIMEOUTS[0]])
+    budget_tokens = int(remaining * _tokens_per_second)
+    if budget_tokens < max_tokens:
+        max_tokens = budget_tokens
+        metrics["model_max_tokens_reduced"] += 1
+    return read_timeout, max_tokens
+
+
+def get_table():
+    """
+    Returns the DynamoDB table storing metadata and template versions, creating it on first use.
+
+    Returns:
+        boto3.resources.factory.dynamodb.Table: The table reused by the warm container.
+    """
+    global _table
+    if _table is None:
+        _table = (
+            get_session()
+            .resource("dynamodb")
+            .Table(f"templatestorage-atc-{EnvironmentName}")
+        )
+    return _table
 
 
 ############################
 ##### Invoke Bedrock ######
 ##########################
-def invoke_model(modelId, system_prompt, messages):
+def converse(operation, modelId, system_prompt, messages, inference_config, read_timeout=None):
     """
-    Invokes Amazon Bedrock Foundational model.
+    Calls the Converse API, sending the prompt again without cachePoint blocks if the model rejects them.
 
     Args:
+        operation (str): The bedrock-runtime operation, "converse" or "converse_stream".
         modelId (str): The ID or name of the foundational model to be invoked.
         system_prompt (str): The prompt or instruction to be provided to the model, setting the context or guiding the model's behavior.
         messages (list): A list of messages or input data to be processed by the model.
+        inference_config (dict): The inferenceConfig of the call.
+        read_timeout (int): The read timeout of the client in seconds, None for the default.
 
     Returns:
-        str: The response or output generated by the model.
+        dict: The response of the operation.
     """
+    bedrock = get_client("bedrock-runtime", read_timeout=read_timeout)
 
-    response = bedrock.converse(
+    if has_cache_points(messages) and modelId in PROMPT_CACHE_UNSUPPORTED:
+        messages = strip_cache_points(messages)
+
+    request = dict(
         modelId=modelId,
         messages=messages,
         system=[{"text": system_prompt}],
-        inferenceConfig={"temperature": 0.2, "maxTokens": 4000},
+        inferenceConfig=inference_config,
+    )
+    try:
+        return getattr(bedrock, operation)(**request)
+    except bedrock.exceptions.ValidationException:
+        if not has_cache_points(messages):
+            raise
+        # The model does not support prompt caching, send the same prompt without checkpoints.
+        request["messages"] = strip_cache_points(messages)
+        PROMPT_CACHE_UNSUPPORTED.add(modelId)
+        return getattr(bedrock, operation)(**request)
+
+
+def log_usage(modelId, usage):
+    model_router.record_usage(usage)
+    print(
+        f"Bedrock usage {modelId}: input {usage.get('inputTokens', 0)}, output {usage.get('outputTokens', 0)}, "
+        f"cache read {usage.get('cacheReadInputTokens', 0)}, cache write {usage.get('cacheWriteInputTokens', 0)} tokens"
     )
-    return response["output"]["message"]["content"][0]["text"]
 
 
-def backoff_mechanism(func, modelId, system_prompt, messages):
+def invoke_model(modelId, system_prompt, messages, inference_config=None):
     """
-    Implements a backoff mechanism to handle throttling exceptions.
+    Invokes Amazon Bedrock Foundational model.
 
     Args:
-        func (function): The function to be called with backoff.
         modelId (str): The ID or name of the foundational model to be invoked.
         system_prompt (str): The prompt or instruction to be provided to the model, setting the context or guiding the model's behavior.
         messages (list): A list of messages or input data to be processed by the model.
+        inference_config (dict): The inferenceConfig of the route, None for the defaults.
 
     Returns:
         str: The response or output generated by the model.
     """
-    MAX_RETRIES = 5  # Maximum number of retries
-    INITIAL_DELAY = 1  # Initial delay in seconds
-    MAX_DELAY = 60  # Maximum delay in second
+    inference_config = dict(inference_config or dict())
+    read_timeout, inference_config["maxTokens"] = model_limits(inference_config.get("maxTokens", MAX_TOKENS))
+    try:
+        response = converse("converse", modelId, system_prompt, messages, inference_config, read_timeout)
+    except Exception as ex:
+        raise_if_timed_out(ex)
+        raise
+    log_usage(modelId, response.get("usage", dict()))
+    return response["output"]["message"]["content"][0]["text"]
 
-    delay = INITIAL_DELAY
-    retries = 0
 
-    while retries < MAX_RETRIES:
-        try:
-            return func(modelId=modelId, system_prompt=system_prompt, messages=messages)
-        except bedrock.exceptions.ThrottlingException as e:
-            print(f"Retry {retries + 1}/{MAX_RETRIES}: {e}")
-            time.sleep(delay + random.uniform(0, 1))  # Add a random jitter
-            delay = min(delay * 2, MAX_DELAY)
-            retries += 1
+def invoke_model_template(modelId, system_prompt, messages, inference_config=None):
+    """
+    Invokes Amazon Bedrock Foundational model with a streamed response and returns the CloudFormation template of
+    its YAML code block. The stream is closed as soon as the code block ends, so the prose models tend to add after
+    it is neither generated into the response nor waited for.
 
-    return False
+    Args:
+        modelId (str): The ID or name of the foundational model to be invoked.
+        system_prompt (str): The prompt or instruction to be provided to the model, setting the context or guiding the model's behavior.
+        messages (list): A list of messages or input data to be processed by the model.
+        inference_config (dict): The inferenceConfig of the route, None for the defaults.
+
+    Returns:
+        str: The CloudFormation template.
+    """
+    global _tokens_per_second
+    inference_config = dict(inference_config or dict())
+    route_max_tokens = inference_config.get("maxTokens", MAX_TOKENS)
+    read_timeout, inference_config["maxTokens"] = model_limits(route_max_tokens)
+    try:
+        response = converse("converse_stream", modelId, system_prompt, messages, inference_config, read_timeout)
+        extractor, stats = read_code_block(response["stream"], deadline=_deadline)
+    except Exception as ex:
+        raise_if_timed_out(ex)
+        raise
+
+    metrics["model_streams"] += 1
+    metrics["model_early_stops"] += stats["stopped_early"]
+    metrics["model_output_tokens"] += stats["output_tokens"]
+    metrics["model_stream_ms"] += int(stats["wall_ms"])
+    # A stream closed early has no usage, its output tokens are estimated.
+    log_usage(modelId, stats["usage"] or {"outputTokens": stats["output_tokens"]})
+    print(
+        f"Bedrock stream {modelId}: {stats['output_tokens']} output tokens in {stats['wall_ms']:.0f} ms, "
+        f"stopped at the end of the code block: {stats['stopped_early']}"
+    )
+
+    if stats["timed_out"]:
+        raise BudgetExhausted(f"The model was still writing the template {stats['wall_ms']:.0f} ms into the call")
+    max_tokens = inference_config["maxTokens"]
+    if not extractor.closed and stats["stop_reason"] == "max_tokens" and max_tokens < route_max_tokens:
+        raise BudgetExhausted(f"The template did not fit in the {max_tokens} output tokens the budget allowed")
+    if stats["wall_ms"] > 0 and stats["output_tokens"]:
+        # Moving average of the output throughput, it sizes maxTokens to the budget of the next calls.
+        _tokens_per_second = 0.8 * _tokens_per_second + 0.2 * stats["output_tokens"] * 1000 / stats["wall_ms"]
+    return extractor.template()
+
+
+def raise_if_timed_out(ex):
+    """
+    Raises BudgetExhausted from a connect or read timeout of a call made under a deadline. The read timeouts are
+    sized to the budget. Errors of the service such as ModelTimeoutException are left to the retries.
+    """
+    from botocore.exceptions import ConnectTimeoutError, ReadTimeoutError
+    from urllib3.exceptions import ReadTimeoutError as StreamReadTimeoutError
+
+    # A timeout while the event stream is read is raised by urllib3, not wrapped by botocore.
+    if _deadline is not None and isinstance(ex, (ConnectTimeoutError, ReadTimeoutError, StreamReadTimeoutError)):
+        raise BudgetExhausted(f"Bedrock did not answer before the deadline: {ex}") from ex
+
+
+def call_model(func, action, system_prompt, messages):
+    """
+    Calls a model function with the model of the action's route, falling back along the route's chain.
+
+    Args:
+        func (function): The model function, invoke_model or invoke_model_template.
+        action (str): The action of the call, a route of model_routes.ROUTES.
+        system_prompt (str): The prompt or instruction to be provided to the model, setting the context or guiding the model's behavior.
+        messages (list): A list of messages or input data to be processed by the model.
+
+    Returns:
+        str: The response or output generated by the model. Raises RetryError if no model of the route succeeded.
+    """
+    return model_router.call(action, call_route_model, func=func, system_prompt=system_prompt, messages=messages)
+
+
+def call_route_model(func, modelId, inference_config, system_prompt, messages):
+    """
+    Calls a model function through the rate limit, retries and circuit breaker of the model.
+
+    Args:
+        func (function): The model function, invoke_model or invoke_model_template.
+        modelId (str): The ID or name of the foundational model to be invoked.
+        inference_config (dict): The inferenceConfig of the route.
+        system_prompt (str): The prompt or instruction to be provided to the model, setting the context or guiding the model's behavior.
+        messages (list): A list of messages or input data to be processed by the model.
+
+    Returns:
+        str: The response or output generated by the model. Raises RetryError if the call did not succeed.
+    """
+    resilience = model_resilience(modelId)
+    # No attempt starts unless it leaves the model enough of the budget.
+    deadline = None if _deadline is None else _deadline - MIN_MODEL_SECONDS
+    try:
+        return resilience.call(
+            func,
+            modelId=modelId,
+            system_prompt=system_prompt,
+            messages=messages,
+            inference_config=inference_config,
+            deadline=deadline,
+        )
+    except DeadlineExceeded as ex:
+        raise BudgetExhausted(f"No time left to call Bedrock: {ex}") from ex
+    except RetryError as ex:
+        metrics[f"model_{type(ex).__name__}"] += 1
+        raise
+    finally:
+        stats = resilience.last_call()
+        metrics["model_attempts"] += stats["attempts"]
+        metrics["model_retries"] += stats["retries"]
+        metrics["model_sleep_ms"] += int(stats["sleep_s"] * 1000)
+
+
+def model_resilience(modelId):
+    """
+    Returns the rate limit, retries and circuit breaker of a model, shared by every call of the warm container.
+    Bedrock quotas are per model, so a throttled model does not hold back the fallbacks of its routes.
+    """
+    return get_resilience(f"bedrock:{modelId}", requests_per_minute=BedrockRequestsPerMinute)
+
+
+##########################
+##### Prompt Caching #####
+##########################
+
+
+def has_cache_points(messages):
+    """
+    Checks if any message carries a Converse cachePoint block.
+
+    Args:
+        messages (list): A list of Converse messages.
+
+    Returns:
+        bool: True if a cachePoint block is present, False otherwise.
+    """
+    return any(
+        "cachePoint" in block for message in messages for block in message["content"]
+    )
+
+
+def strip_cache_points(messages):
+    """
+    Removes the Converse cachePoint blocks, for models that do not support prompt caching.
+
+    Args:
+        messages (list): A list of Converse messages.
+
+    Returns:
+        list: The messages without cachePoint blocks.
+    """
+    return [
+        {
+            "role": message["role"],
+            "content": [
+                block for block in message["content"] if "cachePoint" not in block
+            ],
+        }
+        for message in messages
+    ]
 
 
 #########################
@@ -101,9 +396,37 @@ def backoff_mechanism(func, modelId, system_prompt, messages):
 #######################
 
 
+def get_template_store():
+    """
+    Returns the versioned template store, creating it on first use.
+
+    Returns:
+        TemplateStore: The store reused by the warm container, it remembers the latest version of each session.
+    """
+    global _template_store
+    if _template_store is None:
+        _template_store = TemplateStore(get_table())
+    return _template_store
+
+
+def get_validation_cache():
+    """
+    Returns the validation cache, creating it on first use.
+
+    Returns:
+        ValidationCache: The cache reused by the warm container, backed by the templatestorage table.
+    """
+    global _validation_cache
+    if _validation_cache is None:
+        _validation_cache = validation_cache(get_table())
+    return _validation_cache
+
+
 def put_validity_cloudformation(sessionId, template, is_valid):
     """
     Stores the validity of a CloudFormation template in DynamoDB.
+    The validated template is the latest one, so only v0 is marked; a new version is written only if another
+    writer stored a newer template in the meantime.
 
     Args:
         sessionId (str): The ID of the session.
@@ -114,51 +437,10 @@ def put_validity_cloudformation(sessionId, template, is_valid):
         bool: True if the validity is stored successfully, False otherwise.
     """
     try:
-        creationDate = str(
-            int(datetime.datetime.now(tz=datetime.timezone.utc).timestamp())
-        )
-        ttl = str(
-            int((datetime.datetime.now() + datetime.timedelta(seconds=900)).timestamp())
-        )
-
-        response = table.update_item(
-            Key={"sessionId": sessionId, "version": "v0"},
-            # Atomic counter is used to increment the latest version
-            UpdateExpression="SET Latest = if_not_exists(Latest, :defaultval) + :incrval, #creationDate = :creationDate, #template = :template, #ttl = :ttl, #is_valid = :is_valid",
-            ExpressionAttributeNames={
-                "#creationDate": "creationDate",
-                "#template": "template",
-                "#ttl": "ttl",
-                "#is_valid": "is_valid",
-            },
-            ExpressionAttributeValues={
-                ":creationDate": creationDate,
-                ":is_valid": is_valid,
-                ":template": template,
-                ":ttl": ttl,
-                ":defaultval": 0,
-                ":incrval": 1,
-            },
-            # return the affected attribute after the update
-            ReturnValues="UPDATED_NEW",
-        )
-
-        # Get the updated version
-        latest_version = response["Attributes"]["Latest"]
-
-        # Add the new item with the latest version
-        table.put_item(
-            Item={
-                "sessionId": sessionId,
-                "is_valid": is_valid,
-                "version": "v" + str(latest_version),
-                "creationDate": creationDate,
-                "template": template,
-                "ttl": ttl,
-            }
-        )
+        if not get_template_store().set_validity(sessionId=sessionId, is_valid=is_valid):
+            get_template_store().put(sessionId=sessionId, template=template, is_valid=is_valid)
     except Exception as ex:
-        print(f"Error at put_generated_cloudformation {ex}")
+        print(f"Error at put_validity_cloudformation {ex}")
         return False
     else:
         return True
@@ -176,48 +458,7 @@ def put_generated_cloudformation(sessionId, template):
         bool: True if the template is stored successfully, False otherwise.
     """
     try:
-        creationDate = str(
-            int(datetime.datetime.now(tz=datetime.timezone.utc).timestamp())
-        )
-        ttl = str(
-            int((datetime.datetime.now() + datetime.timedelta(seconds=900)).timestamp())
-        )
-
-        response = table.update_item(
-            Key={"sessionId": sessionId, "version": "v0"},
-            # Atomic counter is used to increment the latest version
-            UpdateExpression="SET Latest = if_not_exists(Latest, :defaultval) + :incrval, #creationDate = :creationDate, #template = :template, #ttl = :ttl, #is_valud = :is_valid",
-            ExpressionAttributeNames={
-                "#creationDate": "creationDate",
-                "#template": "template",
-                "#ttl": "ttl",
-                "#is_valud": "is_valid",
-            },
-            ExpressionAttributeValues={
-                ":creationDate": creationDate,
-                ":template": template,
-                ":ttl": ttl,
-                ":defaultval": 0,
-                ":incrval": 1,
-                ":is_valid": None,
-            },
-            # return the affected attribute after the update
-            ReturnValues="UPDATED_NEW",
-        )
-
-        # Get the updated version
-        latest_version = response["Attributes"]["Latest"]
-
-        # Add the new item with the latest version
-        table.put_item(
-            Item={
-                "sessionId": sessionId,
-                "version": "v" + str(latest_version),
-                "creationDate": creationDate,
-                "template": template,
-                "ttl": ttl,
-            }
-        )
+        get_template_store().put(sessionId=sessionId, template=template)
     except Exception as ex:
         print(f"Error at put_generated_cloudformation {ex}")
         return False
@@ -236,9 +477,7 @@ def get_generated_cloudformation(sessionId, version="v0"):
     Returns:
         str: The generated CloudFormation template.
     """
-    return table.get_item(Key={"sessionId": sessionId, "version": version})["Item"][
-        "template"
-    ]
+    return get_template_store().get(sessionId=sessionId, version=version)
 
 
 def get_kb_yaml(sessionId, version="METADATA"):
@@ -252,7 +491,7 @@ def get_kb_yaml(sessionId, version="METADATA"):
     Returns:
         dict: The YAML metadata.
     """
-    return table.get_item(Key={"sessionId": sessionId, "version": version})
+    return get_table().get_item(Key={"sessionId": sessionId, "version": version})
 
 
 def retrieve_relevant_documents(sessionId, query):
@@ -266,43 +505,19 @@ def retrieve_relevant_documents(sessionId, query):
     Returns:
         dict: The relevant documents.
     """
-    creationDate = str(int(datetime.datetime.now(tz=datetime.timezone.utc).timestamp()))
-    ttl = str(
-        int((datetime.datetime.now() + datetime.timedelta(seconds=900)).timestamp())
-    )
-
-    relevant_documents = bedrock_agent.retrieve(
+    relevant_documents = get_client("bedrock-agent-runtime").retrieve(
         retrievalQuery={"text": get_summary_document(query)},
         knowledgeBaseId=KnowledgeBaseId,
-        retrievalConfiguration={
-            "vectorSearchConfiguration": {
-                "numberOfResults": 3,
-                "overrideSearchType": "HYBRID",
-            }
-        },
+        retrievalConfiguration=RETRIEVAL_CONFIGURATION,
     )
 
-    for idx, metadata in enumerate(
-        [result["metadata"] for result in relevant_documents["retrievalResults"]]
-    ):
+    # All documents are written with a single request, the item is only created when METADATA is missing.
+    item = metadata_item(sessionId, relevant_documents["retrievalResults"])
+    get_table().put_item(Item=item)
+    metrics["retrievals"] += 1
+    metrics["metadata_writes"] += 1
 
-        response = table.update_item(
-            Key={"sessionId": sessionId, "version": "METADATA"},
-            UpdateExpression=f"SET #document{idx} = :document{idx}, #creationDate = :creationDate, #ttl = :ttl",
-            ExpressionAttributeNames={
-                f"#document{idx}": f"document{idx}",
-                "#creationDate": "creationDate",
-                "#ttl": "ttl",
-            },
-            ExpressionAttributeValues={
-                f":document{idx}": metadata,
-                ":creationDate": creationDate,
-                ":ttl": ttl,
-            },
-            # return the affected attribute after the update
-            ReturnValues="ALL_NEW",
-        )
-    return response["Attributes"]
+    return item
 
 
 def retrieve_yaml(sessionId, query=None):
@@ -317,33 +532,24 @@ def retrieve_yaml(sessionId, query=None):
         dict: The YAML metadata.
     """
     response = get_kb_yaml(sessionId=sessionId, version="METADATA")
+    remaining = remaining_budget()
 
     if "Item" in response:
         relevant_documents = response["Item"]
         print(f"Found item in dynamodb {sessionId}")
+    elif query is None and remaining is not None and remaining < MIN_RETRIEVAL_SECONDS:
+        # The examples only guide the model, the template is rewritten without them rather than not at all.
+        print(f"Item with key {sessionId} not found, retrieval skipped with {remaining:.1f}s left.")
+        metrics["retrieval_skipped"] += 1
+        relevant_documents = dict()
     else:
         print(f"Item with key {sessionId} not found.")
         relevant_documents = retrieve_relevant_documents(
             sessionId=sessionId, query=query
         )
 
-    documents = list()
-
-    for docs in [v for k, v in relevant_documents.items() if "document" in k]:
-        bucket, key = docs["cfn_stack"].replace("s3://", "").split("/", 1)
-
-        try:
-            # Retrieve the object contents
-            response = s3.get_object(Bucket=bucket, Key=key)
-            contents = response["Body"].read().decode("utf-8")
-            documents.append(contents)
-        except ClientError as e:
-            if e.response["Error"]["Code"] == "NoSuchKey":
-                print("The specified object does not exist.")
-            else:
-                print(f"An error occurred: {e}")
-
-    return documents
+    # Examples are fetched concurrently, and served from memory by the following actions of the session.
+    return example_cache.get_many(get_client("s3"), example_uris(relevant_documents))
 
 
 ###############################
@@ -354,6 +560,7 @@ def retrieve_yaml(sessionId, query=None):
 def get_summary_document(explain):
     """
     Generating an explanation with less than 1000 characters to accommodate the character limit for the knowledge base query.
+    The AWS services are extracted locally from the explanation, the model is only asked when none is recognised.
 
     Args:
         explain (str): Current architecture explanation recieved from the streamlit app.
@@ -361,20 +568,17 @@ def get_summary_document(explain):
     Returns:
         str: New architecture explanation with less than 1000 characters.
     """
-    _system_prompt = """
-        List all the AWS Services in the document. Do output anything else.
-    """
-    _prompt = f"""
-        <document>
-        {explain}
-        </document>
-
-    """
-    _messages = [{"role": "user", "content": [{"text": _prompt}]}]
-    # func, modelId, system_prompt, messages
-    return backoff_mechanism(
+    query = get_retrieval_query(explain)
+    if query is not None:
+        metrics["summary_local"] += 1
+        return query
+
+    metrics["summary_model"] += 1
+    _system_prompt, _messages = summary_request(explain)
+    # func, action, system_prompt, messages
+    return call_model(
         func=invoke_model,
-        modelId=BedrockModelId,
+        action="summary",
         system_prompt=_system_prompt,
         messages=_messages,
     )
@@ -399,41 +603,22 @@ def generate_cloudformation(architectureExplanation, sessionId):
 
         documents = retrieve_yaml(sessionId=sessionId, query=architectureExplanation)
 
-        _system_prompt = sys_generateCloudFormationPrompt.SYS_GENERATE_CLOUDFORMATION_PROMPT
-
-        _prompt = generateCloudFormationPrompt.GENERATE_CLOUDFORMATION_PROMPT.replace("{{architectureExplanation}}", architectureExplanation)
-        
-        message_document = [
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "text": f"""Take this example CloudFormation YAML code as a refernce <example{idx}></example{idx}>:
-                            <example{idx}>
-                                {document}
-                            </example{idx}>
-                            """,
-                    }
-                    for idx, document in enumerate(documents)
-                ],
-            }
-        ]
-        message_document[0]["content"].append(
-            {
-                "text": _prompt,
-            },
+        _system_prompt, _messages = generate_request(
+            architectureExplanation=architectureExplanation, documents=documents, prompt_cache=PromptCaching
         )
-        _messages = message_document
     except Exception as ex:
         return False, ex
     else:
-        # func, modelId, system_prompt, messages
-        generated_cloudformation_stack = backoff_mechanism(
-            func=invoke_model,
-            modelId=BedrockModelId,
-            system_prompt=_system_prompt,
-            messages=_messages,
-        )
+        # func, action, system_prompt, messages
+        try:
+            generated_cloudformation_stack = call_model(
+                func=invoke_model_template,
+                action="generate",
+                system_prompt=_system_prompt,
+                messages=_messages,
+            )
+        except RetryError as ex:
+            return False, f"Bedrock call was unsuccessful: {ex}"
 
         if not generated_cloudformation_stack:
             return False, f"Bedrock call was unsuccessful"
@@ -454,35 +639,29 @@ def generate_cloudformation(architectureExplanation, sessionId):
 def validate_cloudformtaion(sessionId):
     """
     Validates the CloudFormation template stored in version vo (latest) in DynamoDB.
+    A result stored for the same normalised template is reused without a validate_template call.
 
     Args:
         event (dict): The event data.
 
     Returns:
-        dict: {"isValid": True/False, "error": Error Message}
+        dict: {"isValid": True/False, "error": Error Message, "cached": True if the result came from the cache}
     """
     try:
         cloudformationTemplate = get_generated_cloudformation(sessionId=sessionId)
     except Exception as ex:
         return False, ex
 
-    validation_errors = str()
-    try:
-        response = cfn.validate_template(
-            TemplateBody=cloudformationTemplate,
-        )
-    except Exception as ex:
-        print(f"Cloudformation template invalid: {ex}")
-        validation_errors = f"Cloudformation template invalid: {ex}"
-        is_valid = False
-    else:
-        is_valid = True
-        print("Cloudformation valid")
+    is_valid, validation_errors, source = check_template(
+        cloudformationTemplate, get_client("cloudformation"), cache=get_validation_cache()
+    )
+    metrics[f"validate_{source}"] += 1
+    cached = source in ("memory", "dynamodb")
 
     if put_validity_cloudformation(
         sessionId=sessionId, template=cloudformationTemplate, is_valid=is_valid
     ):
-        return True, {"isValid": is_valid, "error": str(validation_errors)}
+        return True, {"isValid": is_valid, "error": str(validation_errors), "cached": cached}
     else:
         return False, f"Template storage unsuccessful"
 
@@ -509,42 +688,23 @@ def reiterate_cloudformation(sessionId):
         documents = retrieve_yaml(
             sessionId=sessionId,
         )
-        _system_prompt = sys_reiterateCloudFormationPrompt.SYS_REITERATE_CLOUDFORMATION_PROMPT
-        _prompt = reiterateCloudFormationPrompt.REITERATE_CLOUDFORMATION_PROMPT.replace("{{cloudformationTemplate}}", cloudformationTemplate)
-
-        message_document = [
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "text": f"""Take this example CloudFormation YAML code as a refernce <example{idx}></example{idx}>:
-                            <example{idx}>
-                                {document}
-                            </example{idx}>
-                            """,
-                    }
-                    for idx, document in enumerate(documents)
-                ],
-            }
-        ]
-
-        message_document[0]["content"].append(
-            {
-                "text": _prompt,
-            },
+        _system_prompt, _messages = reiterate_request(
+            cloudformationTemplate=cloudformationTemplate, documents=documents, prompt_cache=PromptCaching
         )
-        _messages = message_document
     except Exception as ex:
         return False, ex
     else:
-        # func, modelId, system_prompt, messages
+        # func, action, system_prompt, messages
 
-        updated_cloudformation = backoff_mechanism(
-            func=invoke_model,
-            modelId=BedrockModelId,
-            system_prompt=_system_prompt,
-            messages=_messages,
-        )
+        try:
+            updated_cloudformation = call_model(
+                func=invoke_model_template,
+                action="reiterate",
+                system_prompt=_system_prompt,
+                messages=_messages,
+            )
+        except RetryError as ex:
+            return False, f"Bedrock call was unsuccessful: {ex}"
         if not updated_cloudformation:
             return False, f"Bedrock call was unsuccessful"
 
@@ -577,44 +737,27 @@ def update_cloudformation(updateInstruction, sessionId):
 
         documents = retrieve_yaml(sessionId=sessionId, query=None)
 
-        _system_prompt = sys_updateInstructionPrompt.SYS_UPDATE_CLOUDFORMATION_PROMPT
-        
-        _prompt = updateInstructionPrompt.UPDATE_CLOUDFORMATION_PROMPT.replace("{{cloudformationTemplate}}", cloudformationTemplate).replace("{{updateInstruction}}", updateInstruction)
-        
-        message_document = [
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "text": f"""Take this example CloudFormation YAML code as a refernce <example{idx}></example{idx}>:
-                            <example{idx}>
-                                {document}
-                            </example{idx}>
-                            """,
-                    }
-                    for idx, document in enumerate(documents)
-                ],
-            }
-        ]
-
-        message_document[0]["content"].append(
-            {
-                "text": _prompt,
-            },
+        _system_prompt, _messages = update_request(
+            cloudformationTemplate=cloudformationTemplate,
+            updateInstruction=updateInstruction,
+            documents=documents,
+            prompt_cache=PromptCaching,
         )
-        _messages = message_document
     except Exception as ex:
         return False, ex
     else:
 
-        # func, modelId, system_prompt, messages
+        # func, action, system_prompt, messages
 
-        updated_cloudformation = backoff_mechanism(
-            func=invoke_model,
-            modelId=BedrockModelId,
-            system_prompt=_system_prompt,
-            messages=_messages,
-        )
+        try:
+            updated_cloudformation = call_model(
+                func=invoke_model_template,
+                action="update",
+                system_prompt=_system_prompt,
+                messages=_messages,
+            )
+        except RetryError as ex:
+            return False, f"Bedrock call was unsuccessful: {ex}"
         if not updated_cloudformation:
             return False, "Bedrock call was unsuccessful"
 
@@ -646,43 +789,26 @@ def resolve_cloudformation(cloudformationInstruction, sessionId):
         cloudformationTemplate = get_generated_cloudformation(sessionId=sessionId)
 
         documents = retrieve_yaml(sessionId=sessionId, query=None)
-        _system_prompt = sys_resolveErrorPrompt.SYS_RESOLVE_CLOUDFORMATION_PROMPT
-
-        _prompt = resolveErrorPrompt.RESOLVE_CLOUDFORMATION_PROMPT.replace("{{cloudformationTemplate}}", cloudformationTemplate).replace("{{cloudformationInstruction}}", cloudformationInstruction)
-
-        message_document = [
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "text": f"""Take this example CloudFormation YAML code as a refernce <example{idx}></example{idx}>:
-                            <example{idx}>
-                                {document}
-                            </example{idx}>
-                            """,
-                    }
-                    for idx, document in enumerate(documents)
-                ],
-            }
-        ]
-
-        message_document[0]["content"].append(
-            {
-                "text": _prompt,
-            },
+        _system_prompt, _messages = resolve_request(
+            cloudformationTemplate=cloudformationTemplate,
+            cloudformationInstruction=cloudformationInstruction,
+            documents=documents,
+            prompt_cache=PromptCaching,
         )
-        _messages = message_document
     except Exception as ex:
         return False, ex
     else:
-        # func, modelId, system_prompt, messages
+        # func, action, system_prompt, messages
 
-        updated_cloudformation = backoff_mechanism(
-            func=invoke_model,
-            modelId=BedrockModelId,
-            system_prompt=_system_prompt,
-            messages=_messages,
-        )
+        try:
+            updated_cloudformation = call_model(
+                func=invoke_model_template,
+                action="resolve",
+                system_prompt=_system_prompt,
+                messages=_messages,
+            )
+        except RetryError as ex:
+            return False, f"Bedrock call was unsuccessful: {ex}"
         if not updated_cloudformation:
             return False, "Bedrock call was unsuccessful"
         if put_generated_cloudformation(
@@ -699,8 +825,14 @@ def resolve_cloudformation(cloudformationInstruction, sessionId):
 
 
 def lambda_handler(event, context):
+    global _deadline
     print(event)
 
+    # Actions stop RESPONSE_MARGIN seconds before the Lambda timeout, the agent then gets a timeout response.
+    budget_ms = context.get_remaining_time_in_millis() if context is not None else None
+    _deadline = time.monotonic() + budget_ms / 1000 - RESPONSE_MARGIN if budget_ms is not None else None
+    start = time.monotonic()
+
     response_code = 200
     action_group = event["actionGroup"]
     api_path = event["apiPath"]
@@ -715,74 +847,97 @@ def lambda_handler(event, context):
         None,
     )
 
-    if validate_counter == 0 or validate_counter == 1:
-
-        if api_path == "/generateCloudFormation":
-
-            for param in parameters:
-                if param["name"] == "architectureExplanation":
-                    architectureExplanation = param["value"]
-
-            if not architectureExplanation:
-                valid, result = (
-                    False,
-                    "Missing mandatory parameter: architectureExplanation",
-                )
-            else:
-                valid, result = generate_cloudformation(
-                    architectureExplanation=architectureExplanation,
-                    sessionId=event["sessionId"],
-                )
+    try:
+        if validate_counter == 0 or validate_counter == 1:
 
-        elif api_path == "/validateCloudFormation":
-            validate_counter += 1
+            if api_path == "/generateCloudFormation":
 
-            valid, result = validate_cloudformtaion(sessionId=event["sessionId"])
+                for param in parameters:
+                    if param["name"] == "architectureExplanation":
+                        architectureExplanation = param["value"]
 
-        elif api_path == "/reiterateCloudFormation":
+                if not architectureExplanation:
+                    valid, result = (
+                        False,
+                        "Missing mandatory parameter: architectureExplanation",
+                    )
+                else:
+                    valid, result = generate_cloudformation(
+                        architectureExplanation=architectureExplanation,
+                        sessionId=event["sessionId"],
+                    )
 
-            valid, result = reiterate_cloudformation(
-                sessionId=event["sessionId"],
-            )
+            elif api_path == "/validateCloudFormation":
+                validate_counter += 1
 
-        elif api_path == "/updateCloudFormation":
+                valid, result = validate_cloudformtaion(sessionId=event["sessionId"])
 
-            for param in parameters:
-                if param["name"] == "updateInstruction":
-                    updateInstruction = param["value"]
+            elif api_path == "/reiterateCloudFormation":
 
-            if not updateInstruction:
-                valid, result = False, "Missing mandatory parameter: updateInstruction"
-            else:
-                valid, result = update_cloudformation(
-                    updateInstruction=updateInstruction,
+                valid, result = reiterate_cloudformation(
                     sessionId=event["sessionId"],
                 )
-        elif api_path == "/resolveCloudFormation":
-            for param in parameters:
-                if param["name"] == "cloudformationInstruction":
-                    cloudformationInstruction = param["value"]
-
-            if not cloudformationInstruction:
-                valid, result = (
-                    False,
-                    "Missing mandatory parameter: cloudformationInstruction",
-                )
+
+            elif api_path == "/updateCloudFormation":
+
+                for param in parameters:
+                    if param["name"] == "updateInstruction":
+                        updateInstruction = param["value"]
+
+                if not updateInstruction:
+                    valid, result = False, "Missing mandatory parameter: updateInstruction"
+                else:
+                    valid, result = update_cloudformation(
+                        updateInstruction=updateInstruction,
+                        sessionId=event["sessionId"],
+                    )
+            elif api_path == "/resolveCloudFormation":
+                for param in parameters:
+                    if param["name"] == "cloudformationInstruction":
+                        cloudformationInstruction = param["value"]
+
+                if not cloudformationInstruction:
+                    valid, result = (
+                        False,
+                        "Missing mandatory parameter: cloudformationInstruction",
+                    )
+                else:
+                    valid, result = resolve_cloudformation(
+                        cloudformationInstruction=cloudformationInstruction,
+                        sessionId=event["sessionId"],
+                    )
             else:
-                valid, result = resolve_cloudformation(
-                    cloudformationInstruction=cloudformationInstruction,
-                    sessionId=event["sessionId"],
-                )
+                valid, result = False, f"Unrecognized api path: {action_group}::{api_path}"
         else:
-            valid, result = False, f"Unrecognized api path: {action_group}::{api_path}"
-    else:
-        response_code = 423
-        valid, result = (
-            True,
-            f"/validateCloudFormation has been called twice returning control",
-        )
-
-    if not valid:
+            response_code = 423
+            valid, result = (
+                True,
+                f"/validateCloudFormation has been called twice returning control",
+            )
+    except BudgetExhausted as ex:
+        valid, result = False, ex
+
+    elapsed_ms = int((time.monotonic() - start) * 1000)
+    metrics["budget_used_ms"] += elapsed_ms
+    if budget_ms is not None:
+        print(f"Budget {api_path}: used {elapsed_ms} ms of {budget_ms} ms")
+
+    if isinstance(result, BudgetExhausted):
+        # A structured partial response returned before the Lambda is killed, the stored template is unchanged.
+        metrics["budget_exhausted"] += 1
+        response_code = 408
+        response_body = {
+            "application/json": {
+                "body": {
+                    "status": "timeout",
+                    "partial": True,
+                    "error_message": f"Api path {action_group}::{api_path} ran out of time: {result}",
+                    "budgetMs": budget_ms,
+                    "elapsedMs": elapsed_ms,
+                }
+            }
+        }
+    elif not valid:
         response_code = 404
         response_body = {
             "application/json": {
@@ -805,5 +960,11 @@ def lambda_handler(event, context):
         },
     }
 
+    print(f"Example cache {example_cache.pop_stats()}")
+    print(f"Model routes {model_router.pop_stats()}")
+    print(f"Metrics {dict(metrics)}")
+    metrics.clear()
+    _deadline = None
+
     api_response = {"messageVersion": "1.0", "response": response}
     return api_response
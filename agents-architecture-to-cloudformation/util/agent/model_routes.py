@@ -0,0 +1,208 @@
+"""
+Per-action routing of the Amazon Bedrock model calls.
+
+Every model call names its action ("summary", "generate", ...) and ModelRouter.call invokes the model of the
+action's route with the route's inference parameters. When the model cannot serve the call (its retries ran out,
+its circuit breaker is open, or the model is not enabled in the account) the next model of the route's fallback
+chain is called. Latency, token usage, failures and fallbacks are recorded per action and model, so the routes can
+be tuned from the logs.
+
+Routes are the ROUTES defaults overridden by a JSON document, for example:
+
+    {"summary": {"modelId": "anthropic.claude-3-haiku-20240307-v1:0", "fallbacks": ["default"]},
+     "reiterate": {"maxTokens": 3000}}
+
+"default" stands for the model the deployment is configured with (BedrockModelId).
+"""
+
+try:
+    # In the Lambda zip the shared modules are copied next to this module.
+    from resilience import DeadlineExceeded, RetryError
+except ImportError:
+    from util.agent.resilience import DeadlineExceeded, RetryError
+
+import json
+import threading
+import time
+
+DEFAULT_MODEL = "default"  # Stands for the BedrockModelId of the deployment
+HAIKU = "anthropic.claude-3-haiku-20240307-v1:0"
+
+# Summaries only shorten the explanation into a retrieval query, the smallest model is enough for them.
+ROUTES = {
+    "summary": {"modelId": HAIKU, "temperature": 0.2, "maxTokens": 1000, "fallbacks": [DEFAULT_MODEL]},
+    "generate": {"modelId": DEFAULT_MODEL, "temperature": 0.2, "maxTokens": 4000, "fallbacks": []},
+    "reiterate": {"modelId": DEFAULT_MODEL, "temperature": 0.2, "maxTokens": 4000, "fallbacks": []},
+    "update": {"modelId": DEFAULT_MODEL, "temperature": 0.2, "maxTokens": 4000, "fallbacks": []},
+    "resolve": {"modelId": DEFAULT_MODEL, "temperature": 0.2, "maxTokens": 4000, "fallbacks": []},
+    "explain": {"modelId": DEFAULT_MODEL, "maxTokens": 4000, "fallbacks": []},
+}
+INFERENCE_KEYS = ("temperature", "topP", "maxTokens")
+
+# Errors of a model that another model may not have: not enabled in the account or region, or failing itself.
+FALLBACK_CODES = {"AccessDeniedException", "ResourceNotFoundException", "ModelErrorException"}
+
+
+def parse_routes(text):
+    """
+    Returns the route overrides of a JSON document.
+
+    Args:
+        text (str): The JSON document, an empty string for no overrides.
+
+    Returns:
+        dict: The overrides per action. Raises ValueError if the document is not valid.
+    """
+    if not text or not text.strip():
+        return dict()
+    routes = json.loads(text)
+    if not isinstance(routes, dict) or not all(isinstance(route, dict) for route in routes.values()):
+        raise ValueError("Model routes must be a JSON object of routes per action")
+    unknown = set(routes) - set(ROUTES)
+    if unknown:
+        raise ValueError(f"Unknown model route actions: {', '.join(sorted(unknown))}")
+    return routes
+
+
+def should_fall_back(error):
+    """
+    Returns whether a failed call may be sent to the next model of its route.
+    """
+    if isinstance(error, DeadlineExceeded):
+        # Another model would not have more time.
+        return False
+    if isinstance(error, RetryError):
+        return True
+    response = getattr(error, "response", None)
+    if not isinstance(response, dict):
+        return False
+    return response.get("Error", dict()).get("Code") in FALLBACK_CODES
+
+
+class ModelRouter:
+    """ModelRouter class sending the model call of every action to the model of its route.
+
+    Usage:
+
+    router = ModelRouter(default_model_id=BedrockModelId, routes=parse_routes(os.environ.get("ModelRoutes", "")))
+
+    # Calls invoke(modelId=..., inference_config=..., **kwargs) along the fallback chain of the action.
+    text = router.call("summary", invoke_model, system_prompt=system_prompt, messages=messages)
+
+    # Adds the token usage of a Converse response to the route of the running call.
+    router.record_usage(response["usage"])
+
+    # Statistics per action and model, pop_stats resets them.
+    stats = router.stats()
+    """
+
+    def __init__(self, default_model_id, routes=None):
+        self._default_model_id = default_model_id
+        self._routes = {action: dict(route, **(routes or dict()).get(action, dict())) for action, route in ROUTES.items()}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stats = dict()
+
+    def chain(self, action):
+        """
+        Returns the model IDs of an action, the route's model followed by its fallbacks.
+        """
+        route = self._routes[action]
+        chain = list()
+        for modelId in [route["modelId"]] + list(route.get("fallbacks", [])):
+            modelId = self._default_model_id if modelId == DEFAULT_MODEL else modelId
+            if modelId not in chain:
+                chain.append(modelId)
+        return chain
+
+    def inference_config(self, action):
+        """
+        Returns the Converse inferenceConfig of an action.
+        """
+        return {key: value for key, value in self._routes[action].items() if key in INFERENCE_KEYS}
+
+    def call(self, action, invoke, **kwargs):
+        """
+        Calls the model of an action, falling back along its chain.
+
+        Args:
+            action (str): The action of the call, a key of ROUTES.
+            invoke (function): Called with modelId, inference_config and kwargs.
+            **kwargs: The other arguments of invoke.
+
+        Returns:
+            The return value of invoke. The error of the last model is raised if no model served the call.
+        """
+        chain = self.chain(action)
+        for idx, modelId in enumerate(chain):
+            self._local.route = (action, modelId)
+            start = time.perf_counter()
+            try:
+                result = invoke(modelId=modelId, inference_config=self.inference_config(action), **kwargs)
+            except Exception as e:
+                self._record(action, modelId, start, failures=1)
+                if idx == len(chain) - 1 or not should_fall_back(e):
+                    raise
+                print(f"Model route {action}: {modelId} failed, falling back to {chain[idx + 1]}: {e}")
+            else:
+                self._record(action, modelId, start, served=1, fallbacks=int(idx > 0))
+                return result
+            finally:
+                self._local.route = None
+
+    def record_usage(self, usage):
+        """
+        Adds the token usage of a Converse response to the route of the call running in this thread.
+
+        Args:
+            usage (dict): The "usage" of the response, {"inputTokens", "outputTokens", ...}.
+        """
+        route = getattr(self._local, "route", None)
+        if route is None or not usage:
+            return
+        self._record(
+            *route,
+            input_tokens=usage.get("inputTokens", 0),
+            output_tokens=usage.get("outputTokens", 0),
+            cache_read_tokens=usage.get("cacheReadInputTokens", 0),
+        )
+
+    def stats(self):
+        """
+        Returns the statistics per action and model: calls, served, failures, fallbacks (calls served after the
+        previous model of the chain failed), latency_ms, max_latency_ms and the input, output and cache read tokens.
+        """
+        with self._lock:
+            return {action: {modelId: dict(stats) for modelId, stats in models.items()} for action, models in self._stats.items()}
+
+    def pop_stats(self):
+        """
+        Returns and resets the statistics since the previous pop.
+        """
+        with self._lock:
+            stats, self._stats = self._stats, dict()
+        return stats
+
+    def _record(self, action, modelId, start=None, **counts):
+        with self._lock:
+            stats = self._stats.setdefault(action, dict()).setdefault(
+                modelId,
+                {
+                    "calls": 0,
+                    "served": 0,
+                    "failures": 0,
+                    "fallbacks": 0,
+                    "latency_ms": 0,
+                    "max_latency_ms": 0,
+                    "input_tokens": 0,
+                    "output_tokens": 0,
+                    "cache_read_tokens": 0,
+                },
+            )
+            for name, count in counts.items():
+                stats[name] += count
+            if start is not None:
+                latency_ms = int((time.perf_counter() - start) * 1000)
+                stats["calls"] += 1
+                stats["latency_ms"] += latency_ms
+                stats["max_latency_ms"] = max(stats["max_latency_ms"], latency_ms)
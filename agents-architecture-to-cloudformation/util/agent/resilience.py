@@ -0,0 +1,314 @@
+"""
+Retries, client-side rate limiting and circuit breaking of the Amazon Bedrock calls.
+
+Every model call goes through Resilience.call: it takes a token from a bucket refilled at the Bedrock request quota,
+fails fast while the circuit breaker is open, and retries throttling and stream errors with full-jitter exponential
+backoff until the attempts or the caller's deadline run out. Failures are raised, never returned as None.
+
+One Resilience instance is shared per name by the whole process (get_resilience), so every session of the app or
+every action of a warm Lambda container draws from the same bucket. Containers do not coordinate, the quota of a
+container is the account quota divided by the expected concurrency.
+"""
+
+from collections import Counter
+import random
+import threading
+import time
+
+REQUESTS_PER_MINUTE = 100  # Client-side Bedrock request rate, the on-demand quota of the model
+BURST = 10  # Requests that can be sent at once after an idle period
+MAX_ATTEMPTS = 5  # Attempts per call, the first one included
+BASE_DELAY = 1.0  # Seconds, upper bound of the first backoff
+MAX_DELAY = 30.0  # Seconds, upper bound of any backoff
+BREAKER_THRESHOLD = 5  # Consecutive throttled attempts that open the circuit
+BREAKER_RESET = 30.0  # Seconds the circuit stays open before a probe call is let through
+
+# Error codes worth retrying. Errors sent inside a converse_stream response use a lowercase first letter.
+THROTTLING_CODES = {"ThrottlingException", "TooManyRequestsException", "ServiceQuotaExceededException"}
+TRANSIENT_CODES = {
+    "ServiceUnavailableException",
+    "InternalServerException",
+    "ModelStreamErrorException",
+    "ModelNotReadyException",
+    "ModelTimeoutException",
+}
+
+
+class RetryError(Exception):
+    """Raised when a call did not succeed, carries the last error and the statistics of the call."""
+
+    def __init__(self, message, last_error=None, stats=None):
+        super().__init__(message)
+        self.last_error = last_error
+        self.stats = stats or dict()
+
+
+class CircuitOpenError(RetryError):
+    """Raised without calling the service while the circuit breaker is open."""
+
+
+class DeadlineExceeded(RetryError):
+    """Raised when the next attempt could not start before the caller's deadline."""
+
+
+class TokenBucket:
+    """TokenBucket class limiting the request rate of a process.
+
+    Usage:
+
+    bucket = TokenBucket(rate=100 / 60, capacity=10)
+
+    # Waits for a token and returns the seconds waited, raises DeadlineExceeded if it would wait past the deadline.
+    waited = bucket.acquire(deadline=time.monotonic() + 5)
+    """
+
+    def __init__(self, rate, capacity):
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, deadline=None):
+        """
+        Takes a token, waiting for the bucket to refill if it is empty.
+
+        Args:
+            deadline (float): time.monotonic() value the token must be taken by, None to wait as long as needed.
+
+        Returns:
+            float: The seconds waited.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+            self._updated = now
+            wait = max(0.0, (1 - self._tokens) / self._rate)
+            if deadline is not None and now + wait > deadline:
+                raise DeadlineExceeded("The request rate limit would delay the call past its deadline")
+            # The token is reserved now, concurrent callers queue behind it.
+            self._tokens -= 1
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class CircuitBreaker:
+    """CircuitBreaker class failing fast during sustained throttling.
+
+    The circuit opens after `threshold` consecutive throttled attempts. While open, calls fail without reaching the
+    service; after `reset_after` seconds a single probe call is let through, its success closes the circuit and
+    its throttling opens it again.
+    """
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, reset_after=BREAKER_RESET):
+        self._threshold = threshold
+        self._reset_after = reset_after
+        self._failures = 0
+        self._opened = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened is None:
+                return "closed"
+            return "half-open" if time.monotonic() - self._opened >= self._reset_after else "open"
+
+    def allow(self):
+        """
+        Returns whether a call may reach the service.
+        """
+        with self._lock:
+            if self._opened is None:
+                return True
+            if time.monotonic() - self._opened < self._reset_after or self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures, self._opened, self._probing = 0, None, False
+
+    def record_throttle(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self._threshold:
+                self._opened, self._probing = time.monotonic(), False
+
+    def record_release(self):
+        # A probe that failed with a non-throttling error lets the next call probe.
+        with self._lock:
+            self._probing = False
+
+
+class Resilience:
+    """Resilience class running calls with rate limiting, full-jitter backoff, circuit breaking and deadlines.
+
+    Usage:
+
+    bedrock = get_resilience("bedrock")
+
+    # Returns func(**kwargs), raises RetryError (CircuitOpenError, DeadlineExceeded) if it did not succeed.
+    text = bedrock.call(invoke_model, modelId=modelId, system_prompt=system_prompt, messages=messages)
+
+    # Statistics of the last call of this thread: {"attempts", "retries", "sleep_s", "throttles"}.
+    stats = bedrock.last_call()
+
+    # Counters of every call since the previous pop.
+    metrics = bedrock.pop_metrics()
+    """
+
+    def __init__(
+        self,
+        requests_per_minute=REQUESTS_PER_MINUTE,
+        burst=BURST,
+        max_attempts=MAX_ATTEMPTS,
+        base_delay=BASE_DELAY,
+        max_delay=MAX_DELAY,
+        breaker=None,
+    ):
+        self.bucket = TokenBucket(rate=requests_per_minute / 60, capacity=burst)
+        self.breaker = breaker or CircuitBreaker()
+        self._max_attempts = max_attempts
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._metrics = Counter()
+
+    def call(self, func, *args, deadline=None, **kwargs):
+        """
+        Calls func, retrying throttling and transient errors.
+
+        Args:
+            func (function): The function to call.
+            deadline (float): time.monotonic() value no attempt may start after, None for no deadline.
+            *args, **kwargs: The arguments of func.
+
+        Returns:
+            The return value of func.
+        """
+        stats = {"attempts": 0, "retries": 0, "sleep_s": 0.0, "throttles": 0}
+        self._local.stats = stats
+        try:
+            return self._call(func, args, kwargs, deadline, stats)
+        except RetryError as e:
+            e.stats = stats
+            self._count(type(e).__name__)
+            raise
+        finally:
+            self._count("calls", stats)
+
+    def _call(self, func, args, kwargs, deadline, stats):
+        last_error = None
+        for attempt in range(self._max_attempts):
+            if not self.breaker.allow():
+                raise CircuitOpenError("Bedrock is throttling, the circuit breaker is open", last_error)
+            try:
+                stats["sleep_s"] += self.bucket.acquire(deadline=deadline)
+            except DeadlineExceeded as e:
+                self.breaker.record_release()
+                e.last_error = last_error
+                raise
+
+            stats["attempts"] += 1
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                kind = classify(e)
+                if kind is None:
+                    self.breaker.record_release()
+                    raise
+                last_error = e
+                if kind == "throttling":
+                    stats["throttles"] += 1
+                    self.breaker.record_throttle()
+                else:
+                    self.breaker.record_release()
+            else:
+                self.breaker.record_success()
+                return result
+
+            if attempt == self._max_attempts - 1:
+                break
+            # Full jitter: a uniform delay up to the exponential bound spreads the retries of concurrent callers.
+            delay = random.uniform(0, min(self._max_delay, self._base_delay * 2**attempt))
+            if deadline is not None and time.monotonic() + delay > deadline:
+                raise DeadlineExceeded(f"No time left to retry before the deadline: {last_error}", last_error)
+            print(f"Retry {attempt + 1}/{self._max_attempts - 1} in {delay:.1f}s: {last_error}")
+            time.sleep(delay)
+            stats["retries"] += 1
+            stats["sleep_s"] += delay
+
+        raise RetryError(f"Bedrock call failed after {stats['attempts']} attempts: {last_error}", last_error)
+
+    def last_call(self):
+        """
+        Returns the statistics of the last call made by the current thread.
+        """
+        return dict(getattr(self._local, "stats", dict()))
+
+    def pop_metrics(self):
+        """
+        Returns and resets the counters since the previous pop: calls, attempts, retries, sleep_ms, throttles and
+        the RetryError, CircuitOpenError and DeadlineExceeded failures.
+        """
+        with self._lock:
+            metrics, self._metrics = self._metrics, Counter()
+        return dict(metrics)
+
+    def _count(self, name, stats=None):
+        with self._lock:
+            self._metrics[name] += 1
+            if stats is not None:
+                self._metrics["attempts"] += stats["attempts"]
+                self._metrics["retries"] += stats["retries"]
+                self._metrics["throttles"] += stats["throttles"]
+                self._metrics["sleep_ms"] += int(stats["sleep_s"] * 1000)
+
+
+def classify(error):
+    """
+    Returns "throttling" or "transient" for errors worth retrying, None for the others.
+    """
+    response = getattr(error, "response", None)
+    if not isinstance(response, dict):
+        return None
+    code = response.get("Error", dict()).get("Code", "")
+    code = code[:1].upper() + code[1:]
+    if code in THROTTLING_CODES:
+        return "throttling"
+    if code in TRANSIENT_CODES:
+        return "transient"
+    return None
+
+
+def deadline_in(seconds):
+    """
+    Returns the deadline `seconds` from now, for Resilience.call.
+    """
+    return time.monotonic() + seconds
+
+
+_instances = dict()
+_instances_lock = threading.Lock()
+
+
+def get_resilience(name="bedrock", **kwargs):
+    """
+    Returns the process-wide Resilience instance of a name, creating it with kwargs on first use.
+
+    Args:
+        name (str): The name of the rate limited dependency.
+        **kwargs: The Resilience arguments, only used on creation.
+
+    Returns:
+        Resilience: The shared instance.
+    """
+    with _instances_lock:
+        if name not in _instances:
+            _instances[name] = Resilience(**kwargs)
+        return _instances[name]
@@ -0,0 +1,276 @@
+from collections import deque
+import re
+
+MAX_QUERY_CHARACTERS = 1000  # Character limit of a knowledge base retrieval query
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+# Canonical AWS service names, the aliases an architecture explanation uses for them and the CloudFormation
+# resource type prefixes they deploy. Aliases are matched case-insensitively on word boundaries.
+SERVICES = {
+    "Amazon VPC": {
+        "aliases": ("vpc", "vpcs", "virtual private cloud", "subnet", "subnets", "route table", "route tables"),
+        "types": ("AWS::EC2::VPC", "AWS::EC2::Subnet", "AWS::EC2::RouteTable", "AWS::EC2::Route"),
+    },
+    "NAT Gateway": {
+        "aliases": ("nat gateway", "nat gateways", "network address translation"),
+        "types": ("AWS::EC2::NatGateway", "AWS::EC2::EIP"),
+    },
+    "Internet Gateway": {
+        "aliases": ("internet gateway", "internet gateways", "igw"),
+        "types": ("AWS::EC2::InternetGateway", "AWS::EC2::VPCGatewayAttachment"),
+    },
+    "Security Group": {
+        "aliases": ("security group", "security groups"),
+        "types": ("AWS::EC2::SecurityGroup",),
+    },
+    "Amazon EC2": {
+        "aliases": ("ec2", "elastic compute cloud", "ec2 instance", "ec2 instances", "launch template"),
+        "types": ("AWS::EC2::Instance", "AWS::EC2::LaunchTemplate"),
+    },
+    "Amazon EC2 Auto Scaling": {
+        "aliases": ("auto scaling", "autoscaling", "auto scaling group", "auto scaling groups", "asg"),
+        "types": ("AWS::AutoScaling::", "AWS::ApplicationAutoScaling::"),
+    },
+    "Elastic Load Balancing": {
+        "aliases": (
+            "elastic load balancing",
+            "elastic load balancer",
+            "load balancer",
+            "load balancers",
+            "application load balancer",
+            "network load balancer",
+            "alb",
+            "nlb",
+            "elb",
+        ),
+        "types": ("AWS::ElasticLoadBalancingV2::", "AWS::ElasticLoadBalancing::"),
+    },
+    "Amazon CloudFront": {
+        "aliases": ("cloudfront", "content delivery network", "cdn"),
+        "types": ("AWS::CloudFront::",),
+    },
+    "Amazon Route 53": {
+        "aliases": ("route 53", "route53"),
+        "types": ("AWS::Route53::",),
+    },
+    "AWS WAF": {
+        "aliases": ("waf", "web application firewall"),
+        "types": ("AWS::WAFv2::",),
+    },
+    "Amazon API Gateway": {
+        "aliases": ("api gateway", "rest api", "http api", "websocket api"),
+        "types": ("AWS::ApiGateway::", "AWS::ApiGatewayV2::"),
+    },
+    "AWS Lambda": {
+        "aliases": ("lambda", "lambdas", "lambda function", "lambda functions"),
+        "types": ("AWS::Lambda::",),
+    },
+    "AWS Step Functions": {
+        "aliases": ("step functions", "step function", "state machine", "state machines", "sfn"),
+        "types": ("AWS::StepFunctions::",),
+    },
+    "Amazon ECS": {
+        "aliases": ("ecs", "elastic container service", "fargate", "ecs cluster", "ecs service", "task definition"),
+        "types": ("AWS::ECS::",),
+    },
+    "Amazon EKS": {
+        "aliases": ("eks", "elastic kubernetes service", "kubernetes"),
+        "types": ("AWS::EKS::",),
+    },
+    "Amazon ECR": {
+        "aliases": ("ecr", "elastic container registry"),
+        "types": ("AWS::ECR::",),
+    },
+    "Amazon S3": {
+        "aliases": ("s3", "simple storage service", "s3 bucket", "s3 buckets"),
+        "types": ("AWS::S3::",),
+    },
+    "Amazon EFS": {
+        "aliases": ("efs", "elastic file system"),
+        "types": ("AWS::EFS::",),
+    },
+    "Amazon DynamoDB": {
+        "aliases": ("dynamodb", "dynamo db", "dynamodb table", "dynamodb tables", "dynamodb stream", "dynamodb streams"),
+        "types": ("AWS::DynamoDB::",),
+    },
+    "Amazon RDS": {
+        "aliases": ("rds", "relational database service", "aurora", "mysql", "postgresql"),
+        "types": ("AWS::RDS::",),
+    },
+    "Amazon ElastiCache": {
+        "aliases": ("elasticache", "redis", "memcached"),
+        "types": ("AWS::ElastiCache::",),
+    },
+    "Amazon SQS": {
+        "aliases": ("sqs", "simple queue service", "sqs queue", "sqs queues"),
+        "types": ("AWS::SQS::",),
+    },
+    "Amazon SNS": {
+        "aliases": ("sns", "simple notification service", "sns topic", "sns topics"),
+        "types": ("AWS::SNS::",),
+    },
+    "Amazon EventBridge": {
+        "aliases": ("eventbridge", "event bridge", "event bus", "cloudwatch events"),
+        "types": ("AWS::Events::",),
+    },
+    "Amazon Kinesis": {
+        "aliases": ("kinesis", "kinesis data streams", "kinesis data firehose", "firehose"),
+        "types": ("AWS::Kinesis::", "AWS::KinesisFirehose::"),
+    },
+    "Amazon Cognito": {
+        "aliases": ("cognito", "user pool", "user pools", "identity pool"),
+        "types": ("AWS::Cognito::",),
+    },
+    "AWS IAM": {
+        "aliases": ("iam", "identity and access management", "iam role", "iam roles", "iam policy"),
+        "types": ("AWS::IAM::",),
+    },
+    "AWS KMS": {
+        "aliases": ("kms", "key management service"),
+        "types": ("AWS::KMS::",),
+    },
+    "AWS Secrets Manager": {
+        "aliases": ("secrets manager",),
+        "types": ("AWS::SecretsManager::",),
+    },
+    "AWS Systems Manager": {
+        "aliases": ("systems manager", "parameter store", "ssm"),
+        "types": ("AWS::SSM::",),
+    },
+    "Amazon CloudWatch": {
+        "aliases": ("cloudwatch", "cloudwatch logs", "cloudwatch alarm", "cloudwatch alarms", "log group", "log groups"),
+        "types": ("AWS::CloudWatch::", "AWS::Logs::"),
+    },
+    "Amazon Bedrock": {
+        "aliases": ("bedrock", "agents for amazon bedrock", "bedrock agent", "bedrock agents", "knowledge base"),
+        "types": ("AWS::Bedrock::",),
+    },
+    "Amazon SageMaker": {
+        "aliases": ("sagemaker",),
+        "types": ("AWS::SageMaker::",),
+    },
+    "AWS Glue": {
+        "aliases": ("glue", "glue crawler", "glue job"),
+        "types": ("AWS::Glue::",),
+    },
+    "Amazon Athena": {
+        "aliases": ("athena",),
+        "types": ("AWS::Athena::",),
+    },
+    "Amazon OpenSearch Service": {
+        "aliases": ("opensearch", "elasticsearch"),
+        "types": ("AWS::OpenSearchService::", "AWS::OpenSearchServerless::"),
+    },
+    "AWS AppSync": {
+        "aliases": ("appsync", "graphql"),
+        "types": ("AWS::AppSync::",),
+    },
+    "Amazon SES": {
+        "aliases": ("ses", "simple email service"),
+        "types": ("AWS::SES::",),
+    },
+}
+
+
+class AliasAutomaton:
+    """AliasAutomaton class matching every alias of a dictionary in one pass over a text (Aho-Corasick).
+
+    Texts and aliases are split into lowercase words, the automaton is built once over the alias word sequences
+    and matching then costs one transition per word of the text whatever the number of aliases. Working on
+    words keeps matches on word boundaries, so "sns" is not found in "lessons".
+
+    Usage:
+
+    automaton = AliasAutomaton({"cdn": "Amazon CloudFront"})
+
+    # Returns the values of the aliases found in the text, in order of first occurrence.
+    values = automaton.find("The CDN caches static content.")
+    """
+
+    def __init__(self, aliases):
+        self._goto = [dict()]
+        self._fail = [0]
+        self._output = [list()]
+
+        for alias, value in aliases.items():
+            state = 0
+            for word in _words(alias):
+                if word not in self._goto[state]:
+                    self._goto.append(dict())
+                    self._fail.append(0)
+                    self._output.append(list())
+                    self._goto[state][word] = len(self._goto) - 1
+                state = self._goto[state][word]
+            self._output[state].append(value)
+
+        # Breadth-first pass linking every state to the longest proper suffix that is also a prefix.
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for word, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and word not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(word, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def find(self, text):
+        """
+        Returns the values of the aliases found in a text.
+
+        Args:
+            text (str): The text to search.
+
+        Returns:
+            list: The values of the matched aliases, without duplicates, in order of first occurrence.
+        """
+        goto, fail, output = self._goto, self._fail, self._output
+        found = dict()
+        state = 0
+        for word in _words(text):
+            while state and word not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(word, 0)
+            for value in output[state]:
+                found.setdefault(value, None)
+        return list(found)
+
+
+def _words(text):
+    return _WORD.findall(text.lower())
+
+
+_automaton = AliasAutomaton(
+    {alias: service for service, entry in SERVICES.items() for alias in (service, *entry["aliases"])}
+)
+
+
+def extract_services(explain):
+    """
+    Returns the AWS services named in an architecture explanation.
+
+    Args:
+        explain (str): The architecture explanation.
+
+    Returns:
+        list: The canonical service names, in order of first mention.
+    """
+    return _automaton.find(explain)
+
+
+def get_retrieval_query(explain):
+    """
+    Returns a compact knowledge base query listing the AWS services of an architecture explanation.
+
+    Args:
+        explain (str): The architecture explanation.
+
+    Returns:
+        str: The comma separated service names within the query character limit, or None if no service is named.
+    """
+    services = extract_services(explain)
+    if not services:
+        return None
+    return ", ".join(services)[:MAX_QUERY_CHARACTERS]
@@ -0,0 +1,335 @@
+from collections import OrderedDict
+from difflib import SequenceMatcher
+import datetime
+import json
+import threading
+import zlib
+
+TTL = 900  # Seconds a template version is kept in DynamoDB
+MAX_RETRIES = 3  # Attempts when another writer moved the latest version concurrently
+MAX_SESSIONS = 1024  # Sessions whose latest version number is remembered
+SNAPSHOT_EVERY = 8  # Versions stored as deltas against a snapshot before the next full snapshot
+MAX_SNAPSHOTS = 256  # Decoded snapshots kept in memory to reconstruct deltas without a second read
+COMPRESSION_LEVEL = 6
+
+
+class TemplateStore:
+    """TemplateStore class versioning CloudFormation templates in the templatestorage DynamoDB table.
+
+    Version "v0" always holds the latest template and the "Latest" version number, "v1".."vN" hold every version.
+    A write persists both items in one TransactWriteItems request: v0 is updated on the condition that Latest is
+    still the version this store last saw, and vN is created on the condition that it does not exist yet. The
+    version number is learnt from every read of v0, so a write normally takes a single round trip; if another
+    writer moved Latest, the store re-reads it and retries.
+
+    Template bodies are stored zlib-compressed in the binary "body" attribute. v0 always holds the full latest
+    template. A version is stored either as a full snapshot ("encoding" zlib) or as a line delta against an
+    earlier snapshot of the session ("encoding" delta, "base" vK); a snapshot is written every SNAPSHOT_EVERY
+    versions, whenever the delta would not be smaller, when the store does not know a base for the session and
+    when the base has lived half its TTL. A delta expires together with its base.
+    Reconstructing any version therefore takes at most two reads, and snapshots are immutable so they are kept
+    decoded in memory. Items written before compression, with a plain "template" attribute, are still read.
+
+    The module has no dependency on the Lambda layout, it is imported by lambda.py and by the Streamlit app.
+
+    Usage:
+
+    store = TemplateStore(table)
+
+    # Stores a new version of the template and returns its number.
+    version = store.put(sessionId, template, is_valid=None)
+
+    # Records the validity of the latest template without a new version.
+    store.set_validity(sessionId, is_valid)
+
+    # Returns an attribute of a version, v0 is the latest.
+    template = store.get(sessionId, version="v0", key="template")
+    """
+
+    def __init__(self, table, ttl=TTL):
+        self._table = table
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._latest = OrderedDict()
+        self._bases = OrderedDict()
+        self._snapshots = OrderedDict()
+        self._validity = OrderedDict()
+        self.writes = 0
+        self.conflicts = 0
+        self.stored_bytes = 0
+        self.template_bytes = 0
+
+    def get(self, sessionId, version="v0", key="template"):
+        """
+        Returns an attribute of a template version.
+
+        Args:
+            sessionId (str): The ID of the session.
+            version (str): The version of the template, v0 is the latest.
+            key (str): The attribute to return, "template" or "is_valid".
+
+        Returns:
+            The attribute value.
+        """
+        item = self._table.get_item(Key={"sessionId": sessionId, "version": version})["Item"]
+        if version == "v0" and "Latest" in item:
+            self._remember(sessionId, int(item["Latest"]))
+        if key == "template" and "body" in item:
+            return self._decode(sessionId, version, item)
+        return item[key]
+
+    def put(self, sessionId, template, is_valid=None, items=()):
+        """
+        Stores a new version of the template as v0 and vN in one transactional request.
+
+        Args:
+            sessionId (str): The ID of the session.
+            template (str): The CloudFormation template.
+            is_valid (bool): Whether the template is valid, None if it was not validated.
+            items (list): Other items of the table written in the same request, for example METADATA.
+
+        Returns:
+            int: The number of the new version.
+        """
+        previous = self._latest_version(sessionId)
+        full = compress(template)
+
+        for attempt in range(MAX_RETRIES):
+            try:
+                item = self._transact_put(sessionId, template, full, is_valid, previous, items)
+            except self._table.meta.client.exceptions.TransactionCanceledException as e:
+                if attempt == MAX_RETRIES - 1 or not _condition_failed(e):
+                    raise
+                self.conflicts += 1
+                previous = self._read_latest(sessionId)
+            else:
+                self.writes += 1
+                self.stored_bytes += len(full) + len(item["body"])
+                self.template_bytes += 2 * len(template.encode("utf-8"))
+                self._remember(sessionId, previous + 1)
+                self._remember_base(sessionId, previous + 1, template, item)
+                self._remember_validity(sessionId, previous + 1, is_valid)
+                return previous + 1
+
+    def set_validity(self, sessionId, is_valid):
+        """
+        Records the validity of the latest template on v0 without writing a new version.
+
+        Args:
+            sessionId (str): The ID of the session.
+            is_valid (bool): Whether the latest template is valid.
+
+        Returns:
+            bool: True if v0 was updated, False if another writer stored a newer template in the meantime.
+        """
+        previous = self._latest_version(sessionId)
+        with self._lock:
+            # Validating the same version again does not change what v0 records.
+            if previous and self._validity.get(sessionId) == (previous, is_valid):
+                return True
+        if previous:
+            condition, values = "Latest = :previous", {":previous": previous}
+        else:
+            condition, values = "attribute_exists(Latest)", dict()
+        try:
+            self._table.update_item(
+                Key={"sessionId": sessionId, "version": "v0"},
+                UpdateExpression="SET #is_valid = :is_valid",
+                ConditionExpression=condition,
+                ExpressionAttributeNames={"#is_valid": "is_valid"},
+                ExpressionAttributeValues={":is_valid": is_valid, **values},
+            )
+        except self._table.meta.client.exceptions.ConditionalCheckFailedException:
+            self.conflicts += 1
+            return False
+        self._remember_validity(sessionId, previous, is_valid)
+        return True
+
+    def _transact_put(self, sessionId, template, full, is_valid, previous, items):
+        now = datetime.datetime.now(tz=datetime.timezone.utc)
+        creationDate = str(int(now.timestamp()))
+        ttl = int((now + datetime.timedelta(seconds=self._ttl)).timestamp())
+        version = previous + 1
+        encoded = self._encode(sessionId, template, full, now)
+
+        item = {
+            "sessionId": sessionId,
+            "version": "v" + str(version),
+            "creationDate": creationDate,
+            "ttl": ttl,
+            **encoded,
+        }
+        if is_valid is not None:
+            item["is_valid"] = is_valid
+
+        if previous:
+            condition, values = "Latest = :previous", {":previous": previous}
+        else:
+            condition, values = "attribute_not_exists(Latest)", dict()
+
+        self._table.meta.client.transact_write_items(
+            TransactItems=[
+                {
+                    "Update": {
+                        "TableName": self._table.name,
+                        "Key": {"sessionId": sessionId, "version": "v0"},
+                        "UpdateExpression": "SET Latest = :latest, #creationDate = :creationDate, #body = :body, #encoding = :encoding, #ttl = :ttl, #is_valid = :is_valid",
+                        "ConditionExpression": condition,
+                        "ExpressionAttributeNames": {
+                            "#creationDate": "creationDate",
+                            "#body": "body",
+                            "#encoding": "encoding",
+                            "#ttl": "ttl",
+                            "#is_valid": "is_valid",
+                        },
+                        "ExpressionAttributeValues": {
+                            ":latest": version,
+                            ":creationDate": creationDate,
+                            ":body": full,
+                            ":encoding": "zlib",
+                            ":ttl": ttl,
+                            ":is_valid": is_valid,
+                            **values,
+                        },
+                    }
+                },
+                {
+                    "Put": {
+                        "TableName": self._table.name,
+                        "Item": item,
+                        "ConditionExpression": "attribute_not_exists(#version)",
+                        "ExpressionAttributeNames": {"#version": "version"},
+                    }
+                },
+                *({"Put": {"TableName": self._table.name, "Item": other}} for other in items),
+            ]
+        )
+        return item
+
+    def _encode(self, sessionId, template, full, now):
+        with self._lock:
+            base = self._bases.get(sessionId)
+        if (
+            base is None
+            or base["deltas"] >= SNAPSHOT_EVERY - 1
+            or int(base["ttl"]) - now.timestamp() < self._ttl / 2
+        ):
+            return {"body": full, "encoding": "zlib"}
+
+        delta = compress(json.dumps(diff(base["template"], template), separators=(",", ":")))
+        if len(delta) >= len(full):
+            return {"body": full, "encoding": "zlib"}
+        # The delta cannot outlive the snapshot it is reconstructed from.
+        return {"body": delta, "encoding": "delta", "base": base["version"], "ttl": base["ttl"]}
+
+    def _decode(self, sessionId, version, item):
+        body = _bytes(item["body"])
+        if item.get("encoding") != "delta":
+            return decompress(body)
+
+        base = item["base"]
+        with self._lock:
+            base_template = self._snapshots.get((sessionId, base))
+            if base_template is not None:
+                self._snapshots.move_to_end((sessionId, base))
+        if base_template is None:
+            base_template = self.get(sessionId, version=base)
+            self._remember_snapshot(sessionId, base, base_template)
+        return patch(base_template, json.loads(decompress(body)))
+
+    def _remember_base(self, sessionId, version, template, item):
+        with self._lock:
+            if item["encoding"] == "delta":
+                if sessionId in self._bases:
+                    self._bases[sessionId]["deltas"] += 1
+                    self._bases.move_to_end(sessionId)
+                return
+            self._bases[sessionId] = {
+                "version": "v" + str(version),
+                "template": template,
+                "ttl": item["ttl"],
+                "deltas": 0,
+            }
+            self._bases.move_to_end(sessionId)
+            while len(self._bases) > MAX_SESSIONS:
+                self._bases.popitem(last=False)
+        self._remember_snapshot(sessionId, "v" + str(version), template)
+
+    def _remember_snapshot(self, sessionId, version, template):
+        with self._lock:
+            self._snapshots[(sessionId, version)] = template
+            self._snapshots.move_to_end((sessionId, version))
+            while len(self._snapshots) > MAX_SNAPSHOTS:
+                self._snapshots.popitem(last=False)
+
+    def _remember_validity(self, sessionId, version, is_valid):
+        with self._lock:
+            self._validity[sessionId] = (version, is_valid)
+            self._validity.move_to_end(sessionId)
+            while len(self._validity) > MAX_SESSIONS:
+                self._validity.popitem(last=False)
+
+    def _latest_version(self, sessionId):
+        with self._lock:
+            if sessionId in self._latest:
+                self._latest.move_to_end(sessionId)
+                return self._latest[sessionId]
+        # A session this store has not seen yet is assumed new, the write condition catches the other case.
+        return 0
+
+    def _read_latest(self, sessionId):
+        item = self._table.get_item(
+            Key={"sessionId": sessionId, "version": "v0"},
+            ProjectionExpression="Latest",
+            ConsistentRead=True,
+        ).get("Item", dict())
+        latest = int(item.get("Latest", 0))
+        self._remember(sessionId, latest)
+        return latest
+
+    def _remember(self, sessionId, latest):
+        with self._lock:
+            self._latest[sessionId] = latest
+            self._latest.move_to_end(sessionId)
+            while len(self._latest) > MAX_SESSIONS:
+                self._latest.popitem(last=False)
+
+
+def compress(text):
+    return zlib.compress(text.encode("utf-8"), COMPRESSION_LEVEL)
+
+
+def decompress(body):
+    return zlib.decompress(body).decode("utf-8")
+
+
+def diff(base, template):
+    """
+    Returns the line delta turning base into template: [start, end] copies base lines, a string inserts text.
+    """
+    base_lines = base.splitlines(keepends=True)
+    lines = template.splitlines(keepends=True)
+    delta = list()
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, base_lines, lines, autojunk=False).get_opcodes():
+        if tag == "equal":
+            delta.append([i1, i2])
+        elif j2 > j1:
+            delta.append("".join(lines[j1:j2]))
+    return delta
+
+
+def patch(base, delta):
+    base_lines = base.splitlines(keepends=True)
+    return "".join(
+        "".join(base_lines[op[0] : op[1]]) if isinstance(op, list) else op for op in delta
+    )
+
+
+def _bytes(value):
+    # The boto3 resource returns Binary attributes wrapped in boto3.dynamodb.types.Binary.
+    return getattr(value, "value", value)
+
+
+def _condition_failed(error):
+    reasons = error.response.get("CancellationReasons", list())
+    return any(reason.get("Code") == "ConditionalCheckFailed" for reason in reasons)
@@ -0,0 +1,129 @@
+from collections import OrderedDict
+import datetime
+import hashlib
+import threading
+import time
+
+TTL = 3600  # Seconds a validation result is reused
+MAX_ENTRIES = 512  # Validation results kept in memory
+PREFIX = "VALIDATION#"  # sessionId prefix of the validation items, they never collide with a uuid session id
+
+
+class ValidationCache:
+    """ValidationCache class memoizing CloudFormation validation results by normalised template hash.
+
+    A result is looked up in an in-memory LRU first, then in the templatestorage DynamoDB table, where it is stored
+    under sessionId "VALIDATION#<sha256>" and version "VALIDATION#<resource specification version>" so results are
+    shared across containers and sessions, and invalidated when the validator changes. Results expire after TTL
+    seconds: "ttl" is a Number, so DynamoDB TTL deletes the items, and the expiry is also checked on read since the
+    deletion may lag behind it.
+
+    Templates are normalised before hashing: line endings, trailing whitespace and blank lines do not change the
+    validation result, so templates differing only by them share one entry.
+
+    Usage:
+
+    cache = ValidationCache(table, validator="18.0.0")
+
+    # Returns (is_valid, error, "memory" or "dynamodb"), or None on a miss.
+    result = cache.get(template)
+
+    # Stores a validation result.
+    cache.put(template, is_valid, error)
+    """
+
+    def __init__(self, table, validator=None, ttl=TTL, max_entries=MAX_ENTRIES):
+        self._table = table
+        self._version = f"{PREFIX}{validator or 'local'}"
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = {"memory": 0, "dynamodb": 0}
+        self.misses = 0
+
+    def get(self, template):
+        """
+        Returns the stored validation result of a template.
+
+        Args:
+            template (str): The CloudFormation template.
+
+        Returns:
+            tuple: (is_valid, error, tier) with tier "memory" or "dynamodb", or None if no live result is stored.
+        """
+        digest = template_hash(template)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None and entry[2] > now:
+                self._entries.move_to_end(digest)
+                self.hits["memory"] += 1
+                return entry[0], entry[1], "memory"
+
+        try:
+            item = self._table.get_item(
+                Key={"sessionId": PREFIX + digest, "version": self._version}
+            ).get("Item")
+        except Exception as ex:
+            print(f"Error at ValidationCache.get {ex}")
+            item = None
+
+        if item is None or int(item["ttl"]) <= now:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        self._remember(digest, bool(item["is_valid"]), item.get("error", ""), int(item["ttl"]))
+        with self._lock:
+            self.hits["dynamodb"] += 1
+        return bool(item["is_valid"]), item.get("error", ""), "dynamodb"
+
+    def put(self, template, is_valid, error):
+        """
+        Stores the validation result of a template in memory and in DynamoDB.
+
+        Args:
+            template (str): The CloudFormation template.
+            is_valid (bool): Whether the template is valid.
+            error (str): The validation errors, empty if the template is valid.
+
+        Returns:
+            bool: True if the result was stored in DynamoDB, False otherwise.
+        """
+        digest = template_hash(template)
+        ttl = int((datetime.datetime.now() + datetime.timedelta(seconds=self._ttl)).timestamp())
+        self._remember(digest, is_valid, error, ttl)
+        try:
+            self._table.put_item(
+                Item={
+                    "sessionId": PREFIX + digest,
+                    "version": self._version,
+                    "is_valid": is_valid,
+                    "error": error,
+                    "ttl": ttl,
+                }
+            )
+        except Exception as ex:
+            print(f"Error at ValidationCache.put {ex}")
+            return False
+        return True
+
+    def _remember(self, digest, is_valid, error, ttl):
+        with self._lock:
+            self._entries[digest] = (is_valid, error, ttl)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+
+def normalize(template):
+    """
+    Returns the template without the whitespace that does not change its validation result.
+    """
+    lines = (line.rstrip() for line in template.replace("\r\n", "\n").replace("\r", "\n").split("\n"))
+    return "\n".join(line for line in lines if line)
+
+
+def template_hash(template):
+    return hashlib.sha256(normalize(template).encode("utf-8")).hexdigest()
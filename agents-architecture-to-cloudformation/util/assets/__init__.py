@@ -1,2 +1,4 @@
 from util.assets.streamlit_download_button import download_button
-from util.assets.kb_util import read_image, download_cfn
+from util.assets.kb_util import read_image, read_thumbnails, download_cfn, thumbnail_stats
+from util.assets.image_util import preprocess_upload
+from util.assets.chat_history import render_history
@@ -0,0 +1,146 @@
+import streamlit as st
+from code_editor import code_editor
+
+from util.invoke.trace import render_trace
+
+HISTORY_TURNS = 3  # Latest assistant turns rendered in full, older turns are collapsed into summaries
+
+COPY_BUTTON = {
+    "name": "Copy",
+    "feather": "Copy",
+    "hasText": True,
+    "alwaysOn": True,
+    "commands": [
+        "copyAll",
+        [
+            "infoMessage",
+            {
+                "text": "Copied to clipboard!",
+                "timeout": 2500,
+                "classToggle": "show",
+            },
+        ],
+    ],
+}
+SUBMIT_BUTTON = {
+    "name": "Submit",
+    "feather": "Play",
+    "primary": True,
+    "hasText": True,
+    "showWithIcon": True,
+    "commands": ["submit"],
+    "style": {"bottom": "0.44rem", "right": "0.4rem"},
+}
+
+
+def template_summary(template):
+    """
+    Returns the size and the number of resources of a template, without parsing its YAML.
+
+    Args:
+        template (str): The CloudFormation template.
+
+    Returns:
+        dict: {"kb": float, "lines": int, "resources": int}
+    """
+    resources, indent, in_resources = 0, None, False
+    for line in template.splitlines():
+        stripped = line.strip()
+        if not stripped or stripped.startswith("#"):
+            continue
+        if not line[0].isspace():
+            # A top-level section, only the keys of Resources are counted.
+            in_resources = stripped.startswith("Resources:")
+            continue
+        if in_resources:
+            depth = len(line) - len(line.lstrip())
+            if indent is None:
+                indent = depth
+            if depth == indent and stripped.endswith(":"):
+                resources += 1
+    return {"kb": round(len(template.encode("utf-8")) / 1024, 1), "lines": template.count("\n") + 1, "resources": resources}
+
+
+def render_history(chat_history, on_submit, turns=HISTORY_TURNS):
+    """
+    Renders the chat history of the session. The latest assistant turns are rendered in full, with their traces and
+    a code editor. Older assistant turns are rendered as a one-line summary, their trace and editor are only
+    rendered while their summary toggle is on, so the rerun time and the page size do not grow with the session.
+
+    Args:
+        chat_history (list): The {"role", "prompt", "trace", "is_valid"} turns of the session.
+        on_submit (function): Called with the template when the latest template is edited and submitted.
+        turns (int): The number of assistant turns rendered in full, None to render every turn in full.
+    """
+    assistant = [index for index, chat in enumerate(chat_history) if chat["role"] == "assistant"]
+    if turns is None:
+        recent = set(assistant)
+    else:
+        recent = set(assistant[-turns:]) if turns > 0 else set()
+    latest = len(chat_history) - 1
+
+    for index, chat in enumerate(chat_history):
+        with st.chat_message(chat["role"]):
+            if chat["role"] != "assistant":
+                st.markdown(chat["prompt"])
+            elif index in recent:
+                _render_turn(chat_history, index, editable=index == latest, on_submit=on_submit)
+            elif _render_summary(chat, index):
+                _render_turn(chat_history, index, editable=False, on_submit=on_submit)
+
+
+def _render_summary(chat, index):
+    # The summary of a template is kept with its turn, so it is computed once instead of every rerun.
+    if "summary" not in chat:
+        chat["summary"] = template_summary(chat["prompt"].replace("```yaml", ""))
+    summary = chat["summary"]
+
+    if chat["is_valid"]:
+        badge = ":green[valid]"
+    elif chat["is_valid"] is False:
+        badge = ":red[not valid]"
+    else:
+        badge = ":orange[not validated]"
+    # The summary is the label of the toggle showing the turn, one element per collapsed turn.
+    return st.toggle(
+        f"{badge} · {summary['resources']} resources · {summary['lines']} lines · {summary['kb']} KB"
+        f" · {len(chat['trace'])} trace steps",
+        key=f"history-open-{index}",
+    )
+
+
+def _render_turn(chat_history, index, editable, on_submit):
+    chat = chat_history[index]
+    for number, record in enumerate(chat["trace"]):
+        # Keyed expanders only format and send the content of a record while it is open.
+        render_trace(record, key=f"history-trace-{index}-{number}")
+
+    # String keys: recent Streamlit versions reject integer widget keys.
+    if editable:
+        response_dict = code_editor(
+            chat["prompt"].replace("```yaml", ""),
+            theme="dark",
+            buttons=[dict(COPY_BUTTON, style={"top": "0.46rem", "right": "0.4rem"}), SUBMIT_BUTTON],
+            key=f"history-editor-{index}",
+            options={"wrap": False},
+        )
+        if response_dict["type"] == "submit" and response_dict["text"]:
+            chat_history[index]["prompt"] = "```yaml" + response_dict["text"]
+            chat_history[index]["is_valid"] = None
+            chat_history[index].pop("summary", None)
+            on_submit(response_dict["text"])
+    else:
+        code_editor(
+            chat["prompt"].replace("```yaml", ""),
+            theme="light",
+            buttons=[COPY_BUTTON],
+            key=f"history-editor-{index}",
+            options={"wrap": False},
+        )
+
+    if chat["is_valid"]:
+        st.success("CloudFormation template is valid!")
+    elif chat["is_valid"] is False:
+        st.error("CloudFormation template is not valid!")
+    else:
+        st.warning("Unable to determine if CloudFormation template is valid or not!")
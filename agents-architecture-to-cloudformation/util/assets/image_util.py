@@ -0,0 +1,126 @@
+from PIL import Image, ImageOps
+
+from collections import OrderedDict
+import hashlib
+import io
+import threading
+import time
+
+MAX_EDGE = 1568  # Longest edge in pixels, larger diagrams are downscaled before the vision call
+JPEG_QUALITY = 90  # JPEG quality, high enough to keep diagram labels readable
+MAX_ENTRIES = 32  # Preprocessed uploads memoized per process
+
+
+def preprocess_image(image_bytes, max_edge=MAX_EDGE):
+    """
+    Downscales an image to max_edge, strips its metadata and re-encodes it to the smaller of PNG and JPEG.
+    An upload that needs no downscaling and carries no EXIF metadata is kept as is when it is already smaller.
+
+    Args:
+        image_bytes (bytes): The image as uploaded.
+        max_edge (int): Longest edge in pixels of the output image.
+
+    Returns:
+        tuple: The preprocessed image bytes, its format ("png" or "jpeg") and a stats dict
+            {"before_bytes", "after_bytes", "seconds"}.
+    """
+    start = time.perf_counter()
+
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        original_format = (image.format or "").lower()
+        keep_original = (
+            original_format in ("png", "jpeg")
+            and max(image.size) <= max_edge
+            and "exif" not in image.info
+        )
+
+        # Let the JPEG decoder downscale by a power of two while decoding, it is much cheaper than resampling.
+        image.draft("RGB", (max_edge, max_edge))
+        # Apply the EXIF orientation before the metadata is dropped by re-encoding.
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS, reducing_gap=3.0)
+
+        if image.mode not in ("RGB", "RGBA", "L", "LA", "P"):
+            image = image.convert("RGBA")
+
+        png = io.BytesIO()
+        image.save(png, format="PNG")
+
+        # JPEG has no alpha channel, flatten transparent diagrams on a white background.
+        rgba = image.convert("RGBA")
+        rgb = Image.new("RGB", rgba.size, (255, 255, 255))
+        rgb.paste(rgba, mask=rgba.getchannel("A"))
+        jpeg = io.BytesIO()
+        rgb.save(jpeg, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+
+    candidates = [("png", png.getvalue()), ("jpeg", jpeg.getvalue())]
+    if keep_original:
+        candidates.append((original_format, image_bytes))
+    image_format, output = min(candidates, key=lambda candidate: len(candidate[1]))
+    stats = {
+        "before_bytes": len(image_bytes),
+        "after_bytes": len(output),
+        "seconds": time.perf_counter() - start,
+    }
+    return output, image_format, stats
+
+
+class ImagePreprocessor:
+    """ImagePreprocessor class memoizing preprocessed uploads.
+
+    Streamlit re-runs app.py for every interaction, the upload is preprocessed once and the result is served
+    from a process-wide LRU afterwards. Uploads are keyed by their Streamlit file_id when present, so reruns do
+    not even hash the image bytes.
+
+    Usage:
+
+    # Returns the preprocessed image bytes and format of an uploaded file.
+    image_bytes, image_format = preprocess_upload(uploaded_file)
+    """
+
+    def __init__(self, max_edge=MAX_EDGE, max_entries=MAX_ENTRIES):
+        self._max_edge = max_edge
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def preprocess(self, uploaded_file):
+        """
+        Returns the preprocessed image of an uploaded file.
+
+        Args:
+            uploaded_file (UploadedFile): The file returned by st.file_uploader.
+
+        Returns:
+            tuple: The preprocessed image bytes and its format ("png" or "jpeg").
+        """
+        key = getattr(uploaded_file, "file_id", None)
+        if key is None:
+            key = hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+
+        image_bytes, image_format, stats = preprocess_image(
+            uploaded_file.getvalue(), max_edge=self._max_edge
+        )
+        print(
+            f"Preprocessed image {stats['before_bytes']} -> {stats['after_bytes']} bytes "
+            f"({image_format}) in {stats['seconds'] * 1000:.1f} ms"
+        )
+
+        with self._lock:
+            self._entries[key] = (image_bytes, image_format)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+        return image_bytes, image_format
+
+
+_preprocessor = ImagePreprocessor()
+
+
+def preprocess_upload(uploaded_file):
+    return _preprocessor.preprocess(uploaded_file)
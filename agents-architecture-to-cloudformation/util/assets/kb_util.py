@@ -1,17 +1,24 @@
-from boto3.session import Session
+from util.assets.image_util import preprocess_image
+from util.invoke.clients import get_client
 
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+THUMBNAIL_EDGE = 600  # Longest edge in pixels of the sidebar thumbnails, twice their displayed width
+THUMBNAIL_CACHE_BYTES = 16 * 1024 * 1024  # Thumbnails kept per process, least recently used evicted first
+MAX_WORKERS = 4  # Concurrent downloads of the thumbnails of a retrieval
 
-def read_image(s3_path):
-    s3 = Session().client("s3")
 
-    # Split the path by the '/' character
-    parts = s3_path.replace("s3://", "")
-    parts = parts.split("/")
-    # The bucket name is the second part (index 1)
-    bucket_name = parts[0]
+def _split_uri(s3_path):
+    # "s3://bucket/key/parts" -> ("bucket", "key/parts")
+    parts = s3_path.replace("s3://", "").split("/")
+    return parts[0], "/".join(parts[1:])
 
-    # The key name is the remaining parts joined back together
-    key_name = "/".join(parts[1:])
+
+def read_image(s3_path):
+    s3 = get_client("s3")
+    bucket_name, key_name = _split_uri(s3_path)
 
     try:
         response = s3.get_object(Bucket=bucket_name, Key=key_name)
@@ -23,21 +30,112 @@ def read_image(s3_path):
 
 
 def download_cfn(s3_path):
-    s3 = Session().client("s3")
-
-    # Split the path by the '/' character
-    parts = s3_path.replace("s3://", "")
-    parts = parts.split("/")
-    # The bucket name is the second part (index 1)
-    bucket_name = parts[0]
-
-    # The key name is the remaining parts joined back together
-    key_name = "/".join(parts[1:])
+    s3 = get_client("s3")
+    bucket_name, key_name = _split_uri(s3_path)
 
     try:
         response = s3.get_object(Bucket=bucket_name, Key=key_name)
         cfn_data = response["Body"].read()
     except Exception as e:
-        print(f"Error downloading image: {e}")
+        print(f"Error downloading template: {e}")
         cfn_data = None
     return cfn_data
+
+
+class ThumbnailCache:
+    """ThumbnailCache class serving downscaled knowledge base diagrams from memory.
+
+    A diagram is downloaded and downscaled once per process, then served to every session and rerun. The cache is
+    bounded by the bytes of the thumbnails it holds, the least recently shown are evicted first. Diagrams that
+    cannot be downloaded are not cached and are retried by the next rerun.
+
+    Usage:
+
+    thumbnails = ThumbnailCache()
+
+    # Returns the thumbnails of the S3 URIs, None for the diagrams that cannot be read.
+    images = thumbnails.get_many(uris)
+
+    # Returns hits, misses, evictions, entries and bytes.
+    stats = thumbnails.stats()
+    """
+
+    def __init__(self, max_bytes=THUMBNAIL_CACHE_BYTES, max_edge=THUMBNAIL_EDGE):
+        self._max_bytes = max_bytes
+        self._max_edge = max_edge
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+
+    def get_many(self, uris):
+        """
+        Returns the thumbnails of the diagrams stored at the S3 URIs, downloading the missing ones concurrently.
+
+        Args:
+            uris (list): The S3 URIs of the diagrams, "s3://bucket/key".
+
+        Returns:
+            list: The thumbnail bytes in the order of the URIs, None for the diagrams that cannot be read.
+        """
+        return list(self._executor.map(self.get, uris))
+
+    def get(self, uri):
+        """
+        Returns the thumbnail of the diagram stored at an S3 URI.
+
+        Args:
+            uri (str): The S3 URI of the diagram, "s3://bucket/key".
+
+        Returns:
+            bytes: The thumbnail, or None if the diagram cannot be read.
+        """
+        with self._lock:
+            if uri in self._entries:
+                self._entries.move_to_end(uri)
+                self._hits += 1
+                return self._entries[uri]
+            self._misses += 1
+
+        image = read_image(uri)
+        if image is None:
+            return None
+        try:
+            thumbnail, _, _ = preprocess_image(image, max_edge=self._max_edge)
+        except Exception as e:
+            print(f"Error downscaling image {uri}: {e}")
+            return None
+
+        with self._lock:
+            if uri not in self._entries:
+                self._entries[uri] = thumbnail
+                self._bytes += len(thumbnail)
+            while self._bytes > self._max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self._evictions += 1
+        return thumbnail
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+
+_thumbnails = ThumbnailCache()
+
+
+def read_thumbnails(s3_paths):
+    return _thumbnails.get_many(s3_paths)
+
+
+def thumbnail_stats():
+    return _thumbnails.stats()
@@ -1,3 +1,6 @@
 from util.invoke.agent import BedrockAgent
 from util.invoke.bedrock import Bedrock
 from util.invoke.knowledgebase import KnowledgeBase
+from util.invoke.pipeline import DirectPipeline
+from util.invoke.clients import client_stats
+from util.invoke.parameters import parameter_stats, refresh_parameters
@@ -1,11 +1,11 @@
-from botocore.config import Config
-from boto3.session import Session
-
 import streamlit as st
 
+from util.invoke.clients import get_client
+from util.invoke.parameters import get_parameter
+from util.invoke.trace import TraceParser, render_trace
+
 
 import uuid
-import json
 
 
 class BedrockAgent:
@@ -27,34 +27,16 @@ class BedrockAgent:
     agent.new_session()
 
     The class initializes session state on first run. It reuses the session for subsequent calls for continuity.
+    The bedrock-agent-runtime client is shared by all sessions through the process-wide client registry, the agent
+    IDs are served by the process-wide SSM parameter store.
     """
 
     def __init__(self, environmentName) -> None:
-        if "AGENT_RUNTIME_CLIENT" not in st.session_state:
-
-            st.session_state["AGENT_RUNTIME_CLIENT"] = Session().client(
-                "bedrock-agent-runtime",
-                config=Config(read_timeout=600, connect_timeout=600),
-            )
-
         if "SESSION_ID" not in st.session_state:
             st.session_state["SESSION_ID"] = str(uuid.uuid1())
 
-        self.agent_id = (
-            Session()
-            .client("ssm")
-            .get_parameter(
-                Name=f"/streamlitapp/{environmentName}/AGENT_ID", WithDecryption=False
-            )["Parameter"]["Value"]
-        )
-        self.agent_alias_id = (
-            Session()
-            .client("ssm")
-            .get_parameter(
-                Name=f"/streamlitapp/{environmentName}/AGENT_ALIAS_ID",
-                WithDecryption=False,
-            )["Parameter"]["Value"]
-        )
+        self.agent_id = get_parameter(environmentName, "AGENT_ID")
+        self.agent_alias_id = get_parameter(environmentName, "AGENT_ALIAS_ID")
         if "INVOCATION_ID" not in st.session_state:
             st.session_state["INVOCATION_ID"] = None
 
@@ -63,7 +45,7 @@ class BedrockAgent:
         Resets the session.
         """
         if st.session_state["INVOCATION_ID"]:
-            st.session_state["AGENT_RUNTIME_CLIENT"].invoke_agent(
+            get_client("bedrock-agent-runtime").invoke_agent(
                 agentId=self.agent_id,
                 agentAliasId=self.agent_alias_id,
                 sessionId=st.session_state["SESSION_ID"],
@@ -75,7 +57,6 @@ class BedrockAgent:
             )
             del st.session_state["INVOCATION_ID"]
         st.session_state["SESSION_ID"] = str(uuid.uuid1())
-        del st.session_state["AGENT_RUNTIME_CLIENT"]
 
     def get_session_id(self):
         """
@@ -93,7 +74,7 @@ class BedrockAgent:
             instruction (str): The instruction to send to the agent. Can be one of ("validate", "generate", "update")
 
         Returns:
-            tuple: The response text and trace information.
+            tuple: The response text and the TraceRecords of the invocation.
         """
         if instruction not in ("validate", "generate", "update"):
             raise ValueError("Instructions should be validate, generate, or update")
@@ -137,10 +118,9 @@ class BedrockAgent:
             """
 
         response_text = str()
-        trace_text = list()
-        step = 0
+        parser = TraceParser()
 
-        response = st.session_state["AGENT_RUNTIME_CLIENT"].invoke_agent(
+        response = get_client("bedrock-agent-runtime").invoke_agent(
             inputText=inputText,
             agentId=self.agent_id,
             agentAliasId=self.agent_alias_id,
@@ -156,9 +136,7 @@ class BedrockAgent:
                     "returnControl" in event
                     and "invocationId" in event["returnControl"]
                 ):
-                    st.session_state["INVOCATION_ID"] = response["completion"][
-                        "returnControl"
-                    ]["invocationId"]
+                    st.session_state["INVOCATION_ID"] = event["returnControl"]["invocationId"]
 
                 if "chunk" in event:
 
@@ -166,88 +144,15 @@ class BedrockAgent:
                     response_text = data.decode("utf8")
 
                 elif "trace" in event:
-
-                    trace_obj = event["trace"]["trace"]
-
-                    if "orchestrationTrace" in trace_obj:
-
-                        trace_dump = json.dumps(
-                            trace_obj["orchestrationTrace"], indent=3
-                        )
-
-                        if "rationale" in trace_obj["orchestrationTrace"]:
-
-                            trace_text.append(
-                                {
-                                    "heading": "Rationale",
-                                    "category": "rationale",
-                                    "content": trace_obj["orchestrationTrace"][
-                                        "rationale"
-                                    ]["text"],
-                                }
-                            )
-                            if trace:
-                                with trace:
-                                    with st.expander(f"Rationale"):
-                                        st.write(
-                                            trace_obj["orchestrationTrace"][
-                                                "rationale"
-                                            ]["text"]
-                                        )
-
-                        elif (
-                            "modelInvocationInput"
-                            not in trace_obj["orchestrationTrace"]
-                        ):
-
-                            tools = json.loads(trace_dump)
-                            if "invocationInput" in tools:
-                                tool_used = tools["invocationInput"][
-                                    "actionGroupInvocationInput"
-                                ]["apiPath"]
-                                trace_text.append(
-                                    {
-                                        "heading": f"Tool call {tool_used}",
-                                        "category": "invocationInput",
-                                        "content": trace_dump,
-                                    }
-                                )
-                                if trace:
-                                    with trace:
-                                        with st.expander(f"Tool call {tool_used}"):
-                                            st.code(trace_dump)
-
-                            if "observation" in tools:
-                                tool_used = trace_text[-1]["heading"].split()[-1]
-                                trace_text.append(
-                                    {
-                                        "heading": f"Tool output {tool_used}",
-                                        "category": "observation",
-                                        "content": trace_dump,
-                                    }
-                                )
-                                if trace:
-                                    with trace:
-                                        with st.expander(f"Tool output {tool_used}"):
-                                            st.code(trace_dump)
-
-                    elif "failureTrace" in trace_obj:
-                        trace_text.append(
-                            {
-                                "heading": "Failure",
-                                "category": "failureTrace",
-                                "content": trace_dump,
-                            }
-                        )
+                    for record in parser.feed(event):
                         if trace:
                             with trace:
-                                with st.expander(f"Failure"):
-                                    st.write(trace_dump)
+                                render_trace(record)
 
         except Exception as e:
-            trace_text += str(e)
+            parser.add("error", str(e))
             if trace:
                 trace.markdown(str(e))
             raise Exception("unexpected event.", e)
 
-        return response_text, trace_text
+        return response_text, parser.records
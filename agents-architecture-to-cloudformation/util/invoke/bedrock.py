@@ -1,39 +1,42 @@
-from botocore.exceptions import EventStreamError
-from boto3.session import Session
-from botocore.config import Config
-
 import streamlit as st
 
+from util.assets.image_util import preprocess_upload
+from util.agent.resilience import RetryError, get_resilience
+from util.invoke.clients import get_client
+from util.invoke.explain_cache import get_explain_cache
+from util.invoke.routing import get_model_router
+from util.invoke.streaming import StreamRenderer
 from util.prompt_templates.explainPrompt import EXPLAIN_PROMPT
 from util.prompt_templates.sys_explainPrompt import SYS_EXPLAIN_PROMPT
 
-import time
-import random
-import uuid
 
 
-def invoke_model(modelId, inference_params, messages, system_prompt, data_placeholder):
+def invoke_model(modelId, inference_config, inference_params, messages, system_prompt, data_placeholder, router=None):
     """
     Invokes Amazon Bedrock Foundational model.
 
     Args:
-        model(langchain_community.chat_models.bedrock.BedrockChat): Langchain bedrock chat instance.
-        messages (list): List of Langchain SystemMessage and HumanMessage objects.
+        modelId (str): The ID or name of the foundational model to be invoked.
+        inference_config (dict): The inferenceConfig of the explain route, the sidebar parameters take precedence.
+        inference_params (dict): The temperature, top_p and top_k chosen in the sidebar.
+        messages (list): A list of Converse messages.
+        system_prompt (str): The system prompt.
         data_placeholder (instanceof st.empty): Placeholder to stream the output.
+        router (ModelRouter): The router the token usage is recorded to, None to skip it.
     Returns:
         str: The response or output generated by the model.
     """
-    bedrock = Session().client("bedrock-runtime", config=Config(read_timeout=600))
-    result = str()
+    bedrock = get_client("bedrock-runtime")
+    renderer = StreamRenderer(render=_placeholder_writer(data_placeholder))
     response = bedrock.converse_stream(
         modelId=modelId,
         messages=messages,
         system=[{"text": system_prompt}],
-        inferenceConfig={
-            "maxTokens": 4000,
-            "temperature": inference_params["temperature"],
-            "topP": inference_params["top_p"],
-        },
+        inferenceConfig=dict(
+            inference_config,
+            temperature=inference_params["temperature"],
+            topP=inference_params["top_p"],
+        ),
         additionalModelRequestFields={"top_k": inference_params["top_k"]},
     )
 
@@ -42,54 +45,32 @@ def invoke_model(modelId, inference_params, messages, system_prompt, data_placeh
         for event in stream:
 
             if "contentBlockDelta" in event:
-                result += event["contentBlockDelta"]["delta"]["text"]
-                with data_placeholder.container():
-                    st.text_area(
-                        label="Step-by-step explain",
-                        value=result,
-                        height=500,
-                        key=uuid.uuid4(),
-                    )
+                renderer.write(event["contentBlockDelta"]["delta"]["text"])
+            elif "metadata" in event and router is not None:
+                router.record_usage(event["metadata"].get("usage"))
 
+    result = renderer.close()
+    print(f"Streamed {renderer.deltas} deltas in {renderer.flushes} redraws")
     return result
 
 
-def backoff_mechanism(
-    func, modelId, inference_params, messages, system_prompt, data_placeholder
-):
+def _placeholder_writer(data_placeholder):
     """
-    Implements a backoff mechanism to handle throttling exceptions.
+    Returns a render function redrawing the explain text in the placeholder.
 
     Args:
-        func (function): The function to be called with backoff.
-        model (langchain_community.chat_models.bedrock.BedrockChat): Langchain bedrock chat instance.
-        messages (list): List of Langchain SystemMessage and HumanMessage objects.
         data_placeholder (instanceof st.empty): Placeholder to stream the output.
 
     Returns:
-        str: The response or output generated by the model.
+        function: Render function called by StreamRenderer once per frame.
     """
-    MAX_RETRIES = 5  # Maximum number of retries
-    INITIAL_DELAY = 1  # Initial delay in seconds
-    MAX_DELAY = 60  # Maximum delay in second
-
-    delay = INITIAL_DELAY
-    retries = 0
-
-    while retries < MAX_RETRIES:
-        try:
-            return func(
-                modelId=modelId,
-                inference_params=inference_params,
-                messages=messages,
-                system_prompt=system_prompt,
-                data_placeholder=data_placeholder,
-            )
-        except EventStreamError as e:
-            print(f"Retry {retries + 1}/{MAX_RETRIES}: {e}")
-            time.sleep(delay + random.uniform(0, 1))  # Add a random jitter
-            delay = min(delay * 2, MAX_DELAY)
-            retries += 1
+
+    def render(text):
+        # Replaces the element of the placeholder in place. A widget would need a new key per frame, leaving one
+        # orphan widget per redraw; the editable text area is rendered by app.py once the stream completes.
+        data_placeholder.markdown(text)
+
+    return render
 
 
 class Bedrock:
@@ -98,7 +79,7 @@ class Bedrock:
 
     Usage:
 
-    bedrock = Bedrock(inference_params=inference_params)
+    bedrock = Bedrock(inference_params=inference_params, environmentName=environmentName)
 
     # Generates the explaination of architecture diagram and streams the output to streamlit app.
     explain= bedrock.invoke_explain_model(image,image_type,explain_placeholder,)
@@ -109,15 +90,16 @@ class Bedrock:
     The class initializes session state on first run. It reuses the session for subsequent calls for continuity.
     """
 
-    def __init__(self, inference_params):
+    def __init__(self, inference_params, environmentName):
 
         self._inference_params = inference_params
+        self.router = get_model_router(environmentName)
 
-    def get_explain_messages(self, image, image_type):
+    def get_explain_messages(self, image_bytes, image_type):
         """
         Returns the messages for the explain model.
         Args:
-            image (BytesIO): The image to explain.
+            image_bytes (bytes): The preprocessed image to explain.
             image_type (str): The type of the image.
         Returns:
             list: The list of messages.
@@ -135,7 +117,7 @@ class Bedrock:
                         "image": {
                             "format": image_type,
                             "source": {
-                                "bytes": image.getvalue(),
+                                "bytes": image_bytes,
                             },
                         },
                     },
@@ -149,21 +131,59 @@ class Bedrock:
         """
         Invokes the explain model.
         Args:
-            image (BytesIO): The image to explain.
-            image_type (str): The type of the image.
+            image (UploadedFile): The image to explain, it is downscaled and re-encoded before the call.
+            image_type (str): The type of the uploaded image, superseded by the format of the preprocessed image.
             data_placeholder (instanceof st.empty): Placeholder to stream the output.
         Returns:
             str: The response or output generated by the model.
         """
+        # The explain route needs a model with vision, the BedrockModelId of the deployment by default.
+        modelIds = self.router.chain("explain")
+        image_bytes, image_type = preprocess_upload(image)
+
+        # The same diagram is explained once per model and inference parameters, then served from the cache.
+        explain_cache = get_explain_cache()
+        key = explain_cache.key(
+            image_bytes,
+            image_type,
+            ",".join(modelIds),
+            self._inference_params,
+            (SYS_EXPLAIN_PROMPT, EXPLAIN_PROMPT),
+        )
+        explain = explain_cache.get(key)
+
+        if explain is not None:
+            _placeholder_writer(data_placeholder)(explain)
+        else:
+            system_prompt, messages = self.get_explain_messages(image_bytes, image_type)
+
+            try:
+                explain = self.router.call(
+                    "explain",
+                    self._invoke_explain,
+                    messages=messages,
+                    system_prompt=system_prompt,
+                    data_placeholder=data_placeholder,
+                )
+            except RetryError as ex:
+                st.error(f"The architecture could not be explained: {ex}")
+                explain = None
+            print(f"Explain route {self.router.stats().get('explain')}")
+            if explain:
+                explain_cache.put(key, explain)
+
+        print(f"Explain cache {explain_cache.stats()}")
+        return explain
 
-        system_prompt, messages = self.get_explain_messages(image, image_type)
-
-        explain = backoff_mechanism(
-            func=invoke_model,
-            modelId="anthropic.claude-3-sonnet-20240229-v1:0",
+    def _invoke_explain(self, modelId, inference_config, messages, system_prompt, data_placeholder):
+        # Each model of the route has its own rate limit, retries and circuit breaker.
+        return get_resilience(f"bedrock:{modelId}").call(
+            invoke_model,
+            modelId=modelId,
+            inference_config=inference_config,
             inference_params=self._inference_params,
             messages=messages,
             system_prompt=system_prompt,
             data_placeholder=data_placeholder,
+            router=self.router,
         )
-        return explain
@@ -0,0 +1,148 @@
+from boto3.session import Session
+from botocore.config import Config
+
+import threading
+
+MAX_POOL_CONNECTIONS = 50  # Connections kept alive per client
+CONNECT_TIMEOUT = 60  # Connect timeout in seconds
+READ_TIMEOUT = 600  # Read timeout in seconds, long enough for agent invocations
+
+
+class ClientRegistry:
+    """ClientRegistry class holding process-wide pooled AWS clients.
+
+    Streamlit re-runs app.py for every interaction, but imported modules live for the whole process.
+    The registry therefore shares one boto3 Session, one client and one connection pool per service across all
+    user sessions and reruns, instead of one client per st.session_state.
+
+    Usage:
+
+    # Returns the pooled client, creating it on first use.
+    bedrock = get_client("bedrock-runtime")
+
+    # Returns the pooled DynamoDB table.
+    table = get_table("templatestorage-atc-dev")
+
+    # Returns pool hits/misses and connection reuse per client.
+    stats = client_stats()
+    """
+
+    def __init__(self, max_pool_connections=MAX_POOL_CONNECTIONS):
+        self._lock = threading.Lock()
+        self._session = None
+        self._clients = dict()
+        self._resources = dict()
+        self._config = Config(
+            max_pool_connections=max_pool_connections,
+            tcp_keepalive=True,
+            connect_timeout=CONNECT_TIMEOUT,
+            read_timeout=READ_TIMEOUT,
+        )
+        self._hits = 0
+        self._misses = 0
+
+    def _get_session(self):
+        if self._session is None:
+            self._session = Session()
+        return self._session
+
+    def client(self, service_name):
+        """
+        Returns the pooled client of a service.
+
+        Args:
+            service_name (str): The AWS service name, for example "bedrock-runtime".
+
+        Returns:
+            botocore.client.BaseClient: The pooled client.
+        """
+        with self._lock:
+            client = self._clients.get(service_name)
+            if client is not None:
+                self._hits += 1
+                return client
+
+            self._misses += 1
+            client = self._get_session().client(service_name, config=self._config)
+            self._clients[service_name] = client
+            return client
+
+    def resource(self, service_name):
+        """
+        Returns the pooled resource of a service.
+
+        Args:
+            service_name (str): The AWS service name, for example "dynamodb".
+
+        Returns:
+            boto3.resources.base.ServiceResource: The pooled resource.
+        """
+        with self._lock:
+            resource = self._resources.get(service_name)
+            if resource is not None:
+                self._hits += 1
+                return resource
+
+            self._misses += 1
+            resource = self._get_session().resource(service_name, config=self._config)
+            self._resources[service_name] = resource
+            return resource
+
+    def stats(self):
+        """
+        Returns pool hits/misses and the connection reuse observed by each client's urllib3 pools.
+
+        Returns:
+            dict: {"hits": int, "misses": int, "clients": {service_name: {"requests", "connections", "reused"}}}
+        """
+        with self._lock:
+            clients = dict(self._clients)
+            clients.update(
+                {
+                    f"{service_name} (resource)": resource.meta.client
+                    for service_name, resource in self._resources.items()
+                }
+            )
+            stats = {"hits": self._hits, "misses": self._misses, "clients": dict()}
+
+        for service_name, client in clients.items():
+            requests, connections = _connection_counts(client)
+            stats["clients"][service_name] = {
+                "requests": requests,
+                "connections": connections,
+                "reused": max(requests - connections, 0),
+            }
+        return stats
+
+
+def _connection_counts(client):
+    # botocore does not expose connection metrics, read them from the urllib3 pools behind the client.
+    http_session = getattr(client._endpoint, "http_session", None)
+    managers = [getattr(http_session, "_manager", None)]
+    managers += list(getattr(http_session, "_proxy_managers", dict()).values())
+
+    requests, connections = 0, 0
+    for manager in managers:
+        if manager is None:
+            continue
+        for key in manager.pools.keys():
+            pool = manager.pools.get(key)
+            if pool is not None:
+                requests += pool.num_requests
+                connections += pool.num_connections
+    return requests, connections
+
+
+_registry = ClientRegistry()
+
+
+def get_client(service_name):
+    return _registry.client(service_name)
+
+
+def get_table(table_name):
+    return _registry.resource("dynamodb").Table(table_name)
+
+
+def client_stats():
+    return _registry.stats()
@@ -0,0 +1,155 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+CACHE_DIR = os.path.join(tempfile.gettempdir(), "atc-explain-cache")
+MAX_ENTRIES = 512  # Explanations kept on disk before the least recently used are evicted
+TTL = 7 * 24 * 3600  # Seconds an explanation is served from the cache
+
+
+class ExplainCache:
+    """ExplainCache class storing architecture explanations on local disk, keyed by content.
+
+    The key hashes the image bytes together with the model ID, the inference parameters and the prompts, so the
+    same diagram uploaded again by any user of the container is explained from disk. The file mtime is the last
+    access time: entries older than the TTL are dropped on read, and the least recently used entries are evicted
+    once the cache holds more than MAX_ENTRIES files.
+
+    Usage:
+
+    cache = ExplainCache()
+
+    key = cache.key(image_bytes, image_type, modelId, inference_params, prompts)
+
+    # Returns the cached explanation, or None on a miss.
+    explain = cache.get(key)
+
+    # Stores the explanation.
+    cache.put(key, explain)
+
+    # Returns hits, misses and the hit ratio.
+    stats = cache.stats()
+    """
+
+    def __init__(self, directory=CACHE_DIR, max_entries=MAX_ENTRIES, ttl=TTL):
+        self._directory = directory
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def key(self, image_bytes, image_type, modelId, inference_params, prompts):
+        """
+        Returns the content address of an explanation.
+
+        Args:
+            image_bytes (bytes): The architecture diagram.
+            image_type (str): The type of the image.
+            modelId (str): The ID of the vision model.
+            inference_params (dict): The inference parameters of the call.
+            prompts (tuple): The system prompt and prompt sent with the image.
+
+        Returns:
+            str: The hex digest identifying the explanation.
+        """
+        digest = hashlib.sha256(image_bytes)
+        digest.update(
+            json.dumps(
+                {
+                    "image_type": image_type,
+                    "modelId": modelId,
+                    "inference_params": inference_params,
+                    "prompts": prompts,
+                },
+                sort_keys=True,
+            ).encode("utf-8")
+        )
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        Returns the cached explanation.
+
+        Args:
+            key (str): The content address returned by key().
+
+        Returns:
+            str: The explanation, or None on a miss.
+        """
+        path = self._path(key)
+        try:
+            if time.time() - os.stat(path).st_mtime > self._ttl:
+                os.remove(path)
+                raise FileNotFoundError(path)
+            with open(path, "r") as cache_file:
+                explain = json.load(cache_file)["explain"]
+            os.utime(path)
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self._misses += 1
+            return None
+
+        with self._lock:
+            self._hits += 1
+        return explain
+
+    def put(self, key, explain):
+        """
+        Stores an explanation and evicts the least recently used entries above MAX_ENTRIES.
+
+        Args:
+            key (str): The content address returned by key().
+            explain (str): The explanation generated by the model.
+        """
+        try:
+            os.makedirs(self._directory, exist_ok=True)
+            # Write to a temporary file first so concurrent readers never see a partial entry.
+            fd, tmp_path = tempfile.mkstemp(dir=self._directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as cache_file:
+                json.dump({"explain": explain}, cache_file)
+            os.replace(tmp_path, self._path(key))
+            self._evict()
+        except OSError as ex:
+            print(f"Error at ExplainCache.put {ex}")
+
+    def stats(self):
+        """
+        Returns hits, misses and the hit ratio since the process started.
+        """
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "ratio": self._hits / lookups if lookups else 0.0,
+            }
+
+    def _path(self, key):
+        return os.path.join(self._directory, f"{key}.json")
+
+    def _evict(self):
+        entries = [
+            entry
+            for entry in os.scandir(self._directory)
+            if entry.name.endswith(".json")
+        ]
+        if len(entries) <= self._max_entries:
+            return
+
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[: len(entries) - self._max_entries]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+
+_cache = ExplainCache()
+
+
+def get_explain_cache():
+    return _cache
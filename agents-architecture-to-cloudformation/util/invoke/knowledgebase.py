@@ -1,13 +1,18 @@
-from boto3.session import Session
 from botocore.exceptions import ClientError
-from botocore.config import Config
 
 import streamlit as st
 
-import datetime
+from util.agent.cfn_actions import validation_cache
+from util.agent.template_store import TemplateStore
+from util.invoke.clients import get_client, get_table
+from util.invoke.parameters import get_parameter
+
 import json
-import random
-import time
+
+# Template stores are shared by every session, so the latest version of a session is remembered across reruns.
+_template_stores = dict()
+# Validation results are shared by every session like the template stores.
+_validation_caches = dict()
 
 
 def invoke_model(modelId, system_prompt, messages):
@@ -23,7 +28,7 @@ def invoke_model(modelId, system_prompt, messages):
         str: The response or output generated by the model.
     """
 
-    response = st.session_state["BEDROCK_RUNTIME_CLIENT"].invoke_model(
+    response = get_client("bedrock-runtime").invoke_model(
         modelId=modelId,
         body=json.dumps(
             {
@@ -40,40 +45,6 @@ def invoke_model(modelId, system_prompt, messages):
     return response
 
 
-def backoff_mechanism(func, modelId, system_prompt, messages):
-    """
-    Implements a backoff mechanism to handle throttling exceptions.
-
-    Args:
-        func (function): The function to be called with backoff.
-        modelId (str): The ID or name of the foundational model to be invoked.
-        system_prompt (str): The prompt or instruction to be provided to the model, setting the context or guiding the model's behavior.
-        messages (list): A list of messages or input data to be processed by the model.
-
-    Returns:
-        str: The response or output generated by the model.
-    """
-    MAX_RETRIES = 5  # Maximum number of retries
-    INITIAL_DELAY = 1  # Initial delay in seconds
-    MAX_DELAY = 60  # Maximum delay in second
-
-    delay = INITIAL_DELAY
-    retries = 0
-
-    while retries < MAX_RETRIES:
-        try:
-            return func(modelId=modelId, system_prompt=system_prompt, messages=messages)
-        except st.session_state[
-            "BEDROCK_RUNTIME_CLIENT"
-        ].exceptions.ThrottlingException as e:
-            print(f"Retry {retries + 1}/{MAX_RETRIES}: {e}")
-            time.sleep(delay + random.uniform(0, 1))  # Add a random jitter
-            delay = min(delay * 2, MAX_DELAY)
-            retries += 1
-
-    return False
-
-
 class KnowledgeBase:
     """KnowledgeBase class for invoking an Amazon Bedrock knowledgebase instance.
 
@@ -97,29 +68,16 @@ class KnowledgeBase:
 
     def __init__(self, environmentName):
         self.environmentName = environmentName
+        self.table = get_table(f"templatestorage-atc-{environmentName}")
 
-        if "AGENT_RUNTIME_CLIENT" not in st.session_state:
-
-            st.session_state["AGENT_RUNTIME_CLIENT"] = Session().client(
-                "bedrock-agent-runtime", config=Config(read_timeout=600)
-            )
-
-        if "TEMPLATE_TABLE" not in st.session_state:
-
-            st.session_state["TEMPLATE_TABLE"] = (
-                Session()
-                .resource("dynamodb")
-                .Table(f"templatestorage-atc-{environmentName}")
-            )
+        if self.table.name not in _template_stores:
+            _template_stores[self.table.name] = TemplateStore(self.table)
+        self.template_store = _template_stores[self.table.name]
+        if self.table.name not in _validation_caches:
+            _validation_caches[self.table.name] = validation_cache(self.table)
+        self.validation_cache = _validation_caches[self.table.name]
 
-        self.KnowledgeBaseId = (
-            Session()
-            .client("ssm")
-            .get_parameter(
-                Name=f"/streamlitapp/{environmentName}/KNOWLEDGEBASEID",
-                WithDecryption=False,
-            )["Parameter"]["Value"]
-        )
+        self.KnowledgeBaseId = get_parameter(environmentName, "KNOWLEDGEBASEID")
 
     def get_kb_yaml(self, sessionId, version="METADATA"):
         """
@@ -132,7 +90,7 @@ class KnowledgeBase:
         Returns:
             dict: The YAML metadata.
         """
-        return st.session_state["TEMPLATE_TABLE"].get_item(
+        return self.table.get_item(
             Key={"sessionId": sessionId, "version": version}
         )
 
@@ -147,9 +105,7 @@ class KnowledgeBase:
         Returns:
             str: The generated CloudFormation template.
         """
-        return st.session_state["TEMPLATE_TABLE"].get_item(
-            Key={"sessionId": sessionId, "version": version}
-        )["Item"][key]
+        return self.template_store.get(sessionId=sessionId, version=version, key=key)
 
     def put_generated_cloudformation(self, sessionId, template):
         """
@@ -163,52 +119,7 @@ class KnowledgeBase:
             bool: True if the template is stored successfully, False otherwise.
         """
         try:
-            creationDate = str(
-                int(datetime.datetime.now(tz=datetime.timezone.utc).timestamp())
-            )
-            ttl = str(
-                int(
-                    (
-                        datetime.datetime.now() + datetime.timedelta(seconds=900)
-                    ).timestamp()
-                )
-            )
-
-            response = st.session_state["TEMPLATE_TABLE"].update_item(
-                Key={"sessionId": sessionId, "version": "v0"},
-                # Atomic counter is used to increment the latest version
-                UpdateExpression="SET Latest = if_not_exists(Latest, :defaultval) + :incrval, #creationDate = :creationDate, #template = :template, #ttl = :ttl, #is_valud = :is_valid",
-                ExpressionAttributeNames={
-                    "#creationDate": "creationDate",
-                    "#template": "template",
-                    "#ttl": "ttl",
-                    "#is_valud": "is_valid",
-                },
-                ExpressionAttributeValues={
-                    ":creationDate": creationDate,
-                    ":template": template,
-                    ":ttl": ttl,
-                    ":defaultval": 0,
-                    ":incrval": 1,
-                    ":is_valid": None,
-                },
-                # return the affected attribute after the update
-                ReturnValues="UPDATED_NEW",
-            )
-
-            # Get the updated version
-            latest_version = response["Attributes"]["Latest"]
-
-            # Add the new item with the latest version
-            st.session_state["TEMPLATE_TABLE"].put_item(
-                Item={
-                    "sessionId": sessionId,
-                    "version": "v" + str(latest_version),
-                    "creationDate": creationDate,
-                    "template": template,
-                    "ttl": ttl,
-                }
-            )
+            self.template_store.put(sessionId=sessionId, template=template)
         except Exception as ex:
             print(f"Error at put_generated_cloudformation {ex}")
             return False
@@ -244,6 +155,5 @@ class KnowledgeBase:
 
     def new_session(self):
         """
-        Resets the session.
+        Resets the session. The pooled DynamoDB table is shared by all sessions and is kept.
         """
-        del st.session_state["TEMPLATE_TABLE"]
@@ -0,0 +1,177 @@
+from util.invoke.clients import get_client
+
+import threading
+import time
+
+PARAMETER_TTL = 300  # Seconds the parameters of an environment are served before they are read again
+PAGE_SIZE = 10  # Maximum number of parameters per GetParametersByPath page
+
+_MISSING = object()
+
+
+class ParameterStore:
+    """ParameterStore class serving the /streamlitapp/{environmentName}/ SSM parameters from memory.
+
+    Streamlit re-runs app.py for every interaction and the app's classes read their configuration in __init__.
+    The store reads every parameter of an environment with one paginated GetParametersByPath call, then serves
+    them to all sessions and reruns until the TTL expires. If a reload fails, the previous values are served
+    for another TTL. Refresh hooks are called with the names of the parameters whose value changed on a reload.
+
+    Usage:
+
+    # Returns a parameter, loading the environment on first use. Raises KeyError if it does not exist.
+    agent_id = get_parameter(environmentName, "AGENT_ID")
+
+    # Returns the default if the parameter does not exist.
+    routes = get_parameter(environmentName, "MODEL_ROUTES", default="")
+
+    # Reloads the parameters now, for example after the stack was updated.
+    refresh_parameters(environmentName)
+
+    # Calls hook(environmentName, changed_names) when a reload changed parameters.
+    add_refresh_hook(hook)
+
+    # Returns loads, hits and the load time, age and size of each environment.
+    stats = parameter_stats()
+    """
+
+    def __init__(self, ttl=PARAMETER_TTL):
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._environments = dict()
+        self._hooks = list()
+        self._loads = 0
+        self._hits = 0
+
+    def get(self, environmentName, name, default=_MISSING):
+        """
+        Returns a parameter of an environment.
+
+        Args:
+            environmentName (str): The name of the environment.
+            name (str): The name of the parameter below /streamlitapp/{environmentName}/, for example "AGENT_ID".
+            default: Returned if the parameter does not exist, KeyError is raised without it.
+
+        Returns:
+            str: The value of the parameter.
+        """
+        changed = None
+        with self._lock:
+            environment = self._environments.get(environmentName)
+            if environment is None or time.monotonic() - environment["loaded"] > self._ttl:
+                changed = self._load(environmentName)
+                environment = self._environments[environmentName]
+            else:
+                self._hits += 1
+            value = environment["values"].get(name, default)
+        self._notify(environmentName, changed)
+
+        if value is _MISSING:
+            raise KeyError(f"SSM parameter {_path(environmentName)}{name} does not exist")
+        return value
+
+    def refresh(self, environmentName=None):
+        """
+        Reloads the parameters of an environment, or of every loaded environment.
+
+        Args:
+            environmentName (str): The name of the environment, None for every loaded environment.
+        """
+        with self._lock:
+            names = list(self._environments) if environmentName is None else [environmentName]
+            changes = {name: self._load(name) for name in names}
+        for name, changed in changes.items():
+            self._notify(name, changed)
+
+    def add_refresh_hook(self, hook):
+        """
+        Registers a function called with (environmentName, changed_names) when a reload changed parameters.
+        """
+        with self._lock:
+            self._hooks.append(hook)
+
+    def stats(self):
+        with self._lock:
+            now = time.monotonic()
+            return {
+                "loads": self._loads,
+                "hits": self._hits,
+                "environments": {
+                    environmentName: {
+                        "parameters": len(environment["values"]),
+                        "load_ms": environment["load_ms"],
+                        "age_s": int(now - environment["loaded"]),
+                    }
+                    for environmentName, environment in self._environments.items()
+                },
+            }
+
+    def _load(self, environmentName):
+        # Called with the lock held, so concurrent reruns wait for one load instead of all calling SSM.
+        previous = self._environments.get(environmentName)
+        start = time.perf_counter()
+        try:
+            values = _read_path(environmentName)
+        except Exception as e:
+            if previous is None:
+                raise
+            print(f"Error reloading SSM parameters of {environmentName}, serving the previous values: {e}")
+            previous["loaded"] = time.monotonic()
+            return None
+
+        self._loads += 1
+        self._environments[environmentName] = {
+            "values": values,
+            "loaded": time.monotonic(),
+            "load_ms": round((time.perf_counter() - start) * 1000, 1),
+        }
+        if previous is None:
+            return None
+        old = previous["values"]
+        return {name for name in set(old) | set(values) if old.get(name) != values.get(name)}
+
+    def _notify(self, environmentName, changed):
+        if not changed:
+            return
+        print(f"SSM parameters of {environmentName} changed: {', '.join(sorted(changed))}")
+        with self._lock:
+            hooks = list(self._hooks)
+        for hook in hooks:
+            hook(environmentName, changed)
+
+
+def _path(environmentName):
+    return f"/streamlitapp/{environmentName}/"
+
+
+def _read_path(environmentName):
+    ssm = get_client("ssm")
+    path = _path(environmentName)
+    values = dict()
+    kwargs = {"Path": path, "Recursive": False, "WithDecryption": False, "MaxResults": PAGE_SIZE}
+    while True:
+        response = ssm.get_parameters_by_path(**kwargs)
+        for parameter in response.get("Parameters", []):
+            values[parameter["Name"][len(path):]] = parameter["Value"]
+        if not response.get("NextToken"):
+            return values
+        kwargs["NextToken"] = response["NextToken"]
+
+
+_store = ParameterStore()
+
+
+def get_parameter(environmentName, name, default=_MISSING):
+    return _store.get(environmentName, name, default)
+
+
+def refresh_parameters(environmentName=None):
+    _store.refresh(environmentName)
+
+
+def add_refresh_hook(hook):
+    _store.add_refresh_hook(hook)
+
+
+def parameter_stats():
+    return _store.stats()
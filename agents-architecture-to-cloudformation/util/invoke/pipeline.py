@@ -0,0 +1,333 @@
+import streamlit as st
+
+from util.agent.code_fence import read_code_block
+from util.agent.cfn_actions import RETRIEVAL_CONFIGURATION, check_template, example_uris, generate_request, metadata_item, reiterate_request, resolve_request, summary_request, update_request
+from util.agent.example_cache import ExampleCache
+from util.agent.resilience import RetryError, get_resilience
+from util.agent.service_extractor import MAX_QUERY_CHARACTERS, get_retrieval_query
+from util.invoke.clients import get_client
+from util.invoke.routing import get_model_router
+from util.invoke.trace import TraceParser, render_trace
+
+import json
+import uuid
+
+PLANS = {
+    "generate": "Direct pipeline: generateCloudFormation, reiterateCloudFormation, validateCloudFormation, then resolveCloudFormation and validateCloudFormation if the template is invalid.",
+    "update": "Direct pipeline: updateCloudFormation, reiterateCloudFormation, validateCloudFormation, then resolveCloudFormation and validateCloudFormation if the template is invalid.",
+    "validate": "Direct pipeline: validateCloudFormation, then resolveCloudFormation and validateCloudFormation if the template is invalid.",
+}
+
+# Example templates downloaded from S3, shared by every session of the process.
+_example_cache = ExampleCache()
+
+
+def converse(modelId, inference_config, system_prompt, messages, router=None):
+    """
+    Invokes Amazon Bedrock Foundational model with the inference configuration of its route.
+
+    Args:
+        modelId (str): The ID or name of the foundational model to be invoked.
+        inference_config (dict): The inferenceConfig of the route.
+        system_prompt (str): The prompt or instruction to be provided to the model, setting the context or guiding the model's behavior.
+        messages (list): A list of Converse messages.
+        router (ModelRouter): The router the token usage is recorded to, None to skip it.
+
+    Returns:
+        str: The response or output generated by the model.
+    """
+    response = get_client("bedrock-runtime").converse(
+        modelId=modelId,
+        messages=messages,
+        system=[{"text": system_prompt}],
+        inferenceConfig=inference_config,
+    )
+    if router is not None:
+        router.record_usage(response.get("usage"))
+    return response["output"]["message"]["content"][0]["text"]
+
+
+def converse_template(modelId, inference_config, system_prompt, messages, router=None):
+    """
+    Invokes Amazon Bedrock Foundational model with a streamed response and returns the CloudFormation template of
+    its YAML code block, closing the stream as soon as the code block ends.
+
+    Args:
+        modelId (str): The ID or name of the foundational model to be invoked.
+        inference_config (dict): The inferenceConfig of the route.
+        system_prompt (str): The prompt or instruction to be provided to the model, setting the context or guiding the model's behavior.
+        messages (list): A list of Converse messages.
+        router (ModelRouter): The router the token usage is recorded to, None to skip it.
+
+    Returns:
+        str: The CloudFormation template.
+    """
+    response = get_client("bedrock-runtime").converse_stream(
+        modelId=modelId,
+        messages=messages,
+        system=[{"text": system_prompt}],
+        inferenceConfig=inference_config,
+    )
+    extractor, stats = read_code_block(response["stream"])
+    if router is not None:
+        # A stream closed early has no usage, its output tokens are estimated.
+        router.record_usage(stats["usage"] or {"outputTokens": stats["output_tokens"]})
+    print(
+        f"Bedrock stream {modelId}: {stats['output_tokens']} output tokens in {stats['wall_ms']:.0f} ms, "
+        f"stopped at the end of the code block: {stats['stopped_early']}"
+    )
+    return extractor.template()
+
+
+def call_model(router, action, func, system_prompt, messages):
+    """
+    Calls a model function along the route of an action, each model through its own rate limit, retries and
+    circuit breaker.
+
+    Args:
+        router (ModelRouter): The model router of the environment.
+        action (str): The action of the call, a route of model_routes.ROUTES.
+        func (function): The model function, converse or converse_template.
+        system_prompt (str): The prompt or instruction to be provided to the model, setting the context or guiding the model's behavior.
+        messages (list): A list of Converse messages.
+
+    Returns:
+        str: The response or output generated by the model. Raises RetryError if no model of the route succeeded.
+    """
+
+    def invoke(modelId, inference_config):
+        return get_resilience(f"bedrock:{modelId}").call(
+            func,
+            modelId=modelId,
+            inference_config=inference_config,
+            system_prompt=system_prompt,
+            messages=messages,
+            router=router,
+        )
+
+    return router.call(action, invoke)
+
+
+class DirectPipeline:
+    """DirectPipeline class running the agent actions in-process, without Bedrock Agent orchestration.
+
+    The steps the agent is instructed to follow are run deterministically with the same prompts and validation as
+    the action group Lambda (util/agent/cfn_actions.py). The template is kept in memory between steps and
+    persisted once at the end, together with the retrieved documents, in a single DynamoDB transaction. The trace
+    has the same structure as the one of BedrockAgent.invoke_agent so the app renders both the same way.
+
+    Usage:
+
+    agent = DirectPipeline(environmentName=environmentName, knowledgebase=knowledgebase)
+
+    # Runs the steps of the instruction and returns the response text and trace information.
+    response_text, trace_text = agent.invoke_agent(text, trace, instruction)
+
+    # Get the current session id.
+    session_id = agent.get_session_id()
+
+    # Reset the session.
+    agent.new_session()
+    """
+
+    def __init__(self, environmentName, knowledgebase) -> None:
+        if "SESSION_ID" not in st.session_state:
+            st.session_state["SESSION_ID"] = str(uuid.uuid1())
+
+        self.knowledgebase = knowledgebase
+        self.router = get_model_router(environmentName)
+
+    def new_session(self):
+        """
+        Resets the session.
+        """
+        st.session_state["SESSION_ID"] = str(uuid.uuid1())
+
+    def get_session_id(self):
+        """
+        Returns the session id.
+        """
+        return st.session_state["SESSION_ID"]
+
+    def invoke_agent(self, text, trace, instruction):
+        """
+        Runs the steps of an instruction and returns the response text and trace information.
+
+        Args:
+            text (str): The input text.
+            trace  (instanceof st.empty): Placeholder to stream the trace.
+            instruction (str): The instruction to run. Can be one of ("validate", "generate", "update")
+
+        Returns:
+            tuple: The response text and trace information.
+        """
+        if instruction not in ("validate", "generate", "update"):
+            raise ValueError("Instructions should be validate, generate, or update")
+
+        return self.run(
+            sessionId=self.get_session_id(), text=text, trace=trace, instruction=instruction
+        )
+
+    def run(self, sessionId, text, trace, instruction):
+        """
+        Runs the steps of an instruction for a session.
+
+        Args:
+            sessionId (str): The ID of the session.
+            text (str): The architecture explanation or the update instruction.
+            trace  (instanceof st.empty): Placeholder to stream the trace, None to skip rendering.
+            instruction (str): The instruction to run. Can be one of ("validate", "generate", "update")
+
+        Returns:
+            tuple: The response text and the TraceRecords of the run.
+        """
+        trace_log = TraceParser()
+        self._trace(trace, trace_log, "rationale", PLANS[instruction])
+
+        metadata = None
+        if instruction == "generate":
+            metadata = self._retrieve(sessionId=sessionId, explain=text)
+            relevant_documents, template = metadata, None
+        else:
+            relevant_documents = self.knowledgebase.get_kb_yaml(sessionId=sessionId).get("Item", dict())
+            template = self.knowledgebase.get_generated_cloudformation(sessionId=sessionId)
+        documents = _example_cache.get_many(get_client("s3"), example_uris(relevant_documents))
+
+        if instruction == "generate":
+            template = self._action(
+                trace,
+                trace_log,
+                "/generateCloudFormation",
+                {"architectureExplanation": text},
+                generate_request(architectureExplanation=text, documents=documents),
+                {"CloudformationTemplate": True},
+            )
+        elif instruction == "update":
+            template = self._action(
+                trace,
+                trace_log,
+                "/updateCloudFormation",
+                {"updateInstruction": text},
+                update_request(cloudformationTemplate=template, updateInstruction=text, documents=documents),
+                {"updatedCloudformationTemplate": True},
+            )
+        if template and instruction != "validate":
+            template = self._action(
+                trace,
+                trace_log,
+                "/reiterateCloudFormation",
+                dict(),
+                reiterate_request(cloudformationTemplate=template, documents=documents),
+                {"reiteratedCloudformationTemplate": True},
+            ) or template
+
+        if not template:
+            return "The CloudFormation template could not be generated.", trace_log.records
+
+        is_valid, validation_errors = self._validate(trace, trace_log, template)
+        if not is_valid:
+            resolved = self._action(
+                trace,
+                trace_log,
+                "/resolveCloudFormation",
+                {"cloudformationInstruction": validation_errors},
+                resolve_request(
+                    cloudformationTemplate=template,
+                    cloudformationInstruction=validation_errors,
+                    documents=documents,
+                ),
+                {"updatedCloudformationTemplate": True},
+            )
+            if resolved:
+                template = resolved
+                is_valid, validation_errors = self._validate(trace, trace_log, template)
+
+        # The template of the turn and the retrieved documents are written with a single request.
+        self.knowledgebase.template_store.put(
+            sessionId=sessionId,
+            template=template,
+            is_valid=is_valid,
+            items=[metadata] if metadata else (),
+        )
+
+        if is_valid:
+            return "The CloudFormation template is valid.", trace_log.records
+        return f"The CloudFormation template is not valid: {validation_errors}", trace_log.records
+
+    def _retrieve(self, sessionId, explain):
+        query = get_retrieval_query(explain)
+        if query is None:
+            system_prompt, messages = summary_request(explain)
+            try:
+                query = call_model(self.router, "summary", converse, system_prompt, messages)
+            except RetryError as ex:
+                # The explanation itself is the query when the model cannot summarise it.
+                print(f"Summary unsuccessful, querying with the explanation: {ex}")
+                query = explain[:MAX_QUERY_CHARACTERS]
+        relevant_documents = get_client("bedrock-agent-runtime").retrieve(
+            retrievalQuery={"text": query},
+            knowledgeBaseId=self.knowledgebase.KnowledgeBaseId,
+            retrievalConfiguration=RETRIEVAL_CONFIGURATION,
+        )
+        return metadata_item(sessionId, relevant_documents["retrievalResults"])
+
+    def _action(self, trace, trace_log, api_path, parameters, request, result):
+        self._tool_call(trace, trace_log, api_path, parameters)
+        system_prompt, messages = request
+        # "/generateCloudFormation" runs on the "generate" route.
+        action = api_path[1:].replace("CloudFormation", "")
+        try:
+            template = call_model(self.router, action, converse_template, system_prompt, messages)
+            error = "Bedrock call was unsuccessful"
+        except RetryError as ex:
+            template, error = None, f"Bedrock call was unsuccessful: {ex}"
+        if not template:
+            result = {"error_message": f"Api path DirectPipeline::{api_path} returned an error: {error}"}
+        self._tool_output(trace, trace_log, api_path, result)
+        return template
+
+    def _validate(self, trace, trace_log, template):
+        api_path = "/validateCloudFormation"
+        self._tool_call(trace, trace_log, api_path, dict())
+        is_valid, validation_errors, source = check_template(
+            template, get_client("cloudformation"), cache=self.knowledgebase.validation_cache
+        )
+        self._tool_output(
+            trace,
+            trace_log,
+            api_path,
+            {"isValid": is_valid, "error": str(validation_errors), "cached": source in ("memory", "dynamodb")},
+        )
+        return is_valid, validation_errors
+
+    def _tool_call(self, trace, trace_log, api_path, parameters):
+        payload = {
+            "invocationInput": {
+                "actionGroupInvocationInput": {
+                    "actionGroupName": "DirectPipeline",
+                    "apiPath": api_path,
+                    "verb": "post",
+                    "parameters": [
+                        {"name": name, "type": "string", "value": value}
+                        for name, value in parameters.items()
+                    ],
+                },
+                "invocationType": "ACTION_GROUP",
+            }
+        }
+        self._trace(trace, trace_log, "invocationInput", payload, tool=api_path)
+
+    def _tool_output(self, trace, trace_log, api_path, result):
+        payload = {
+            "observation": {
+                "actionGroupInvocationOutput": {"text": json.dumps(result)},
+                "type": "ACTION_GROUP",
+            }
+        }
+        self._trace(trace, trace_log, "observation", payload, tool=api_path)
+
+    def _trace(self, trace, trace_log, category, payload, tool=None):
+        record = trace_log.add(category, payload, tool=tool)
+        if trace:
+            with trace:
+                render_trace(record)
@@ -0,0 +1,42 @@
+from util.agent.model_routes import ModelRouter, parse_routes
+from util.invoke.parameters import add_refresh_hook, get_parameter
+
+import threading
+
+# Routers are shared by every session, so the statistics of a route cover the whole process.
+_routers = dict()
+_routers_lock = threading.Lock()
+# Parameters the routers are configured from, a change rebuilds the router of the environment.
+ROUTE_PARAMETERS = {"BEDROCK_MODEL_ID", "MODEL_ROUTES"}
+
+
+def get_model_router(environmentName):
+    """
+    Returns the model router of an environment, configured from its SSM parameters on first use.
+
+    Args:
+        environmentName (str): The name of the environment.
+
+    Returns:
+        ModelRouter: The router shared by every session of the process.
+    """
+    with _routers_lock:
+        if environmentName in _routers:
+            return _routers[environmentName]
+
+    # Read outside the lock: a reload of the parameters may call _on_refresh.
+    default_model_id = get_parameter(environmentName, "BEDROCK_MODEL_ID")
+    # Stacks deployed before the routes were configurable use the default routes.
+    routes = get_parameter(environmentName, "MODEL_ROUTES", default="")
+    router = ModelRouter(default_model_id=default_model_id, routes=parse_routes(routes))
+    with _routers_lock:
+        return _routers.setdefault(environmentName, router)
+
+
+def _on_refresh(environmentName, changed):
+    if changed & ROUTE_PARAMETERS:
+        with _routers_lock:
+            _routers.pop(environmentName, None)
+
+
+add_refresh_hook(_on_refresh)
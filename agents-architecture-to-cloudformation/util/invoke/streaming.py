@@ -0,0 +1,91 @@
+import time
+
+FRAME_INTERVAL = 0.1  # Minimum seconds between two redraws of the placeholder
+FRAME_CHARS = 400  # Buffered characters that force a redraw before the interval elapses
+
+
+class StreamRenderer:
+    """StreamRenderer class buffering converse_stream deltas for a Streamlit placeholder.
+
+    Deltas are appended to a list instead of concatenated to a string, and the placeholder is redrawn at most
+    once per frame: when the frame interval elapsed or enough characters are buffered. close() always flushes
+    the tail so the placeholder ends up with the complete output.
+
+    Usage:
+
+    renderer = StreamRenderer(render=render, frame_interval=0.1, frame_chars=400)
+
+    # Buffers a delta and redraws the placeholder when the frame budget is spent.
+    renderer.write(delta)
+
+    # Flushes the remaining deltas and returns the complete output.
+    result = renderer.close()
+
+    # Returns the number of deltas received and redraws issued.
+    stats = renderer.stats()
+    """
+
+    def __init__(self, render=None, frame_interval=FRAME_INTERVAL, frame_chars=FRAME_CHARS):
+        self._render = render
+        self._frame_interval = frame_interval
+        self._frame_chars = frame_chars
+        self._chunks = list()
+        self._pending = 0
+        self._last_flush = time.monotonic()
+        self.deltas = 0
+        self.flushes = 0
+
+    def write(self, delta):
+        """
+        Buffers a delta and redraws the placeholder when the frame budget is spent.
+
+        Args:
+            delta (str): Text of a contentBlockDelta event.
+        """
+        self._chunks.append(delta)
+        self._pending += len(delta)
+        self.deltas += 1
+
+        now = time.monotonic()
+        if (
+            self._pending >= self._frame_chars
+            or now - self._last_flush >= self._frame_interval
+        ):
+            self.flush(now)
+
+    def flush(self, now=None):
+        """
+        Redraws the placeholder if deltas were received since the last redraw.
+        """
+        if not self._pending:
+            return
+
+        text = self.getvalue()
+        self._pending = 0
+        self._last_flush = now or time.monotonic()
+
+        if self._render is not None:
+            self._render(text)
+            self.flushes += 1
+
+    def getvalue(self):
+        """
+        Returns the output received so far.
+        """
+        # A redraw needs the whole output, so it is joined once per frame rather than once per delta.
+        text = "".join(self._chunks)
+        self._chunks = [text]
+        return text
+
+    def close(self):
+        """
+        Flushes the remaining deltas and returns the complete output.
+        """
+        self.flush()
+        return self.getvalue()
+
+    def stats(self):
+        """
+        Returns the number of deltas received and redraws issued.
+        """
+        return {"deltas": self.deltas, "flushes": self.flushes}
@@ -0,0 +1,174 @@
+import streamlit as st
+
+import json
+import time
+
+HEADINGS = {
+    "rationale": "Rationale",
+    "invocationInput": "Tool call",
+    "observation": "Tool output",
+    "failureTrace": "Failure",
+    "error": "Error",
+}
+# Records written as text, the others are JSON payloads shown as code.
+TEXT_CATEGORIES = ("rationale", "failureTrace", "error")
+
+
+class TraceRecord:
+    """TraceRecord class holding one record of an agent trace.
+
+    A record keeps a reference to the payload of its trace event instead of a pretty-printed copy. The JSON is only
+    formatted when the record is shown.
+
+    Attributes:
+        step (int): The orchestration step, a rationale and the tool call and output following it.
+        category (str): "rationale", "invocationInput", "observation", "failureTrace" or "error".
+        tool (str): The API path of the tool called or observed, None for the other records.
+        elapsed_ms (int): Milliseconds since the invocation started.
+        duration_ms (int): Milliseconds since the tool call, for tool outputs.
+        payload: The text of the record, or the dict of its trace event.
+    """
+
+    __slots__ = ("step", "category", "tool", "elapsed_ms", "duration_ms", "payload")
+
+    def __init__(self, step, category, payload, tool=None, elapsed_ms=0, duration_ms=None):
+        self.step = step
+        self.category = category
+        self.payload = payload
+        self.tool = tool
+        self.elapsed_ms = elapsed_ms
+        self.duration_ms = duration_ms
+
+    @property
+    def heading(self):
+        heading = HEADINGS[self.category]
+        if self.tool:
+            heading = f"{heading} {self.tool}"
+        if self.duration_ms is not None:
+            heading = f"{heading} ({self.duration_ms / 1000:.1f} s)"
+        return heading
+
+    @property
+    def content(self):
+        """
+        Returns the text of the record, formatting JSON payloads on every call.
+        """
+        if isinstance(self.payload, str):
+            return self.payload
+        return json.dumps(self.payload, indent=3, default=str)
+
+
+class TraceParser:
+    """TraceParser class building the trace records of an agent invocation incrementally.
+
+    Usage:
+
+    parser = TraceParser()
+
+    # Returns the records of a streamed invoke_agent event, an empty list for events that are not traced.
+    records = parser.feed(event)
+
+    # Adds a record that is not an agent trace event, for example an error or a step of the direct pipeline.
+    record = parser.add("error", str(e))
+
+    # Every record of the invocation.
+    trace_text = parser.records
+    """
+
+    def __init__(self):
+        self.records = list()
+        self._start = time.perf_counter()
+        self._step = 0
+        self._step_done = True
+        self._tool = None
+        self._tool_started = None
+
+    def feed(self, event):
+        """
+        Parses an event of the invoke_agent completion stream.
+
+        Args:
+            event (dict): The event, records are only built for "trace" events.
+
+        Returns:
+            list: The TraceRecords of the event.
+        """
+        trace = event.get("trace", dict()).get("trace", dict())
+        if "failureTrace" in trace:
+            return [self.add("failureTrace", trace["failureTrace"].get("failureReason") or trace["failureTrace"])]
+
+        orchestration = trace.get("orchestrationTrace")
+        if not orchestration:
+            return list()
+        records = list()
+        if "rationale" in orchestration:
+            records.append(self.add("rationale", orchestration["rationale"].get("text", "")))
+        if "invocationInput" in orchestration:
+            invocation = orchestration["invocationInput"]
+            tool = (
+                invocation.get("actionGroupInvocationInput", dict()).get("apiPath")
+                or invocation.get("invocationType", "tool")
+            )
+            records.append(self.add("invocationInput", orchestration, tool=tool))
+        if "observation" in orchestration:
+            records.append(self.add("observation", orchestration, tool=self._tool))
+        return records
+
+    def add(self, category, payload, tool=None):
+        """
+        Adds a record to the trace.
+
+        Args:
+            category (str): The category of the record, a key of HEADINGS.
+            payload: The text of the record, or the dict of its trace event.
+            tool (str): The API path of the tool called or observed.
+
+        Returns:
+            TraceRecord: The record.
+        """
+        now = time.perf_counter()
+        duration_ms = None
+        if category in ("rationale", "invocationInput") and self._step_done:
+            self._step += 1
+            self._step_done = False
+        if category == "invocationInput":
+            self._tool, self._tool_started = tool, now
+        elif category == "observation":
+            self._step_done = True
+            if self._tool_started is not None:
+                duration_ms = int((now - self._tool_started) * 1000)
+                self._tool_started = None
+
+        record = TraceRecord(
+            step=self._step,
+            category=category,
+            payload=payload,
+            tool=tool,
+            elapsed_ms=int((now - self._start) * 1000),
+            duration_ms=duration_ms,
+        )
+        self.records.append(record)
+        return record
+
+
+def render_trace(record, key=None):
+    """
+    Renders a trace record as an expander.
+
+    Args:
+        record (TraceRecord): The record.
+        key (str): The widget key of the expander. With a key, the content is only formatted and sent to the browser
+            while the expander is open, which reruns the app when it is opened. Without a key the content is
+            rendered at once, for the records streamed while the agent runs.
+    """
+    if key is None:
+        expander = st.expander(record.heading)
+    else:
+        expander = st.expander(record.heading, key=key, on_change="rerun")
+        if not expander.open:
+            return
+    with expander:
+        if record.category in TEXT_CATEGORIES:
+            st.write(record.content)
+        else:
+            st.code(record.content, language="json")
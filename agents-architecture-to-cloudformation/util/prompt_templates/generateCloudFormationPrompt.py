@@ -10,5 +10,5 @@ Create CLoudFormation code only for AWS Servies present in <explain></explain>
 - Use structure of example templates.
 - Add into description "This template is not production ready and should only be used for inspiration"
 
-Do not return examples or explaination, only return the generated CloudFormation YAML template without ```yaml ```. Skip the preamble. Think step-by-step.
+Do not return examples or explaination, only return the generated CloudFormation YAML template encapsulated between triple backticks (```yaml ```). Skip the preamble. Think step-by-step.
 """
\ No newline at end of file
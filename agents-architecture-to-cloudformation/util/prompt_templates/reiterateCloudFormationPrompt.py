@@ -4,5 +4,5 @@ Reiterate the CloudFormation template. Also make sure description consists "This
     {{cloudformationTemplate}}
 </cloudformation>
 
-Do not return examples or explaination, only return the generated CloudFormation YAML template without ```yaml ```. Skip the preamble. Think step-by-step. 
+Do not return examples or explaination, only return the generated CloudFormation YAML template encapsulated between triple backticks (```yaml ```). Skip the preamble. Think step-by-step. 
 """
\ No newline at end of file
@@ -11,5 +11,5 @@ I need your assistance in troubleshooting an issue with an AWS CloudFormation te
 
 Also make sure description consists "This template is not production ready and should only be used for inspiration".
 
-Once you have completed the updates, you will output only the revised CloudFormation YAML template without ```yaml ```. Skip the preamble. Think step-by-step. 
+Once you have completed the updates, you will output only the revised CloudFormation YAML template encapsulated between triple backticks (```yaml ```). Skip the preamble. Think step-by-step. 
 """
\ No newline at end of file
@@ -5,6 +5,8 @@ from argparse import ArgumentParser
 
 parser = ArgumentParser()
 parser.add_argument("--modelId", type=str, default=None)
+parser.add_argument("--promptCache", action="store_true")
+parser.add_argument("--memoryTokenBudget", type=int, default=util.TOKEN_BUDGET)
 
 args = parser.parse_args()
 st.set_page_config(
@@ -26,9 +28,18 @@ Temperature = st.sidebar.slider(
 Top_P = st.sidebar.slider("Top P", min_value=0.0, max_value=1.0, step=0.001, value=1.0)
 Top_K = st.sidebar.slider("Top K", min_value=0, max_value=500, step=1, value=250)
 
+with st.sidebar.expander("AWS client pool"):
+    st.json(util.client_stats())
+
+if args.promptCache:
+    with st.sidebar.expander("Prompt cache"):
+        st.json(util.prompt_cache_stats())
+
 bedrock = util.Model(
     modelId=modelId,
     inference_params={"temperature": Temperature, "top_p": Top_P, "top_k": Top_K},
+    prompt_cache=args.promptCache,
+    memory_token_budget=args.memoryTokenBudget,
 )
 
 if st.button("Clear", type="secondary"):
@@ -48,7 +59,7 @@ if uploaded_file is not None:
     image, explain = st.columns((5, 5))
 
     with image:
-        st.image(uploaded_file.getvalue())
+        st.image(util.preprocess_upload(uploaded_file)[0])
 
     with explain:
 
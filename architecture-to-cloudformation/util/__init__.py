@@ -1,6 +1,10 @@
 from util.model import Model
+from util.image_util import preprocess_upload
+from util.memory import TOKEN_BUDGET
 from util.prompt_templates.code_prompt import CODE_PROMPT
 from util.prompt_templates.explain_prompt import EXPLAIN_PROMPT
 from util.prompt_templates.sys_code_prompt import SYS_CODE_PROMPT
 from util.prompt_templates.sys_explain_prompt import SYS_EXPLAIN_PROMPT
-from util.prompt_templates.sys_update_prompt import SYS_UPDATE_PROMPT
\ No newline at end of file
+from util.prompt_templates.sys_update_prompt import SYS_UPDATE_PROMPT
+from util.clients import client_stats
+from util.prompt_cache import prompt_cache_stats
@@ -0,0 +1,91 @@
+from boto3.session import Session
+from botocore.config import Config
+
+import threading
+
+MAX_POOL_CONNECTIONS = 50  # Connections kept alive per client
+CONNECT_TIMEOUT = 60  # Connect timeout in seconds
+READ_TIMEOUT = 600  # Read timeout in seconds, long enough for 4000-token streams
+
+
+class ClientRegistry:
+    """
+    Process-wide registry of pooled AWS clients.
+
+    Streamlit re-runs app.py for every interaction, but imported modules live for the whole process,
+    so every session and every rerun shares the same boto3 Session, client and connection pool.
+    botocore clients are thread-safe, client creation is guarded by a lock.
+    """
+
+    def __init__(self, max_pool_connections=MAX_POOL_CONNECTIONS):
+        self._lock = threading.Lock()
+        self._session = None
+        self._clients = dict()
+        self._config = Config(
+            max_pool_connections=max_pool_connections,
+            tcp_keepalive=True,
+            connect_timeout=CONNECT_TIMEOUT,
+            read_timeout=READ_TIMEOUT,
+        )
+        self._hits = 0
+        self._misses = 0
+
+    def client(self, service_name):
+        with self._lock:
+            client = self._clients.get(service_name)
+            if client is not None:
+                self._hits += 1
+                return client
+
+            self._misses += 1
+            if self._session is None:
+                self._session = Session()
+            client = self._session.client(service_name, config=self._config)
+            self._clients[service_name] = client
+            return client
+
+    def stats(self):
+        """
+        Returns pool hits/misses and the connection reuse observed by each client's urllib3 pools.
+        """
+        with self._lock:
+            clients = dict(self._clients)
+            stats = {"hits": self._hits, "misses": self._misses, "clients": dict()}
+
+        for service_name, client in clients.items():
+            requests, connections = _connection_counts(client)
+            stats["clients"][service_name] = {
+                "requests": requests,
+                "connections": connections,
+                "reused": max(requests - connections, 0),
+            }
+        return stats
+
+
+def _connection_counts(client):
+    # botocore does not expose connection metrics, read them from the urllib3 pools behind the client.
+    http_session = getattr(client._endpoint, "http_session", None)
+    managers = [getattr(http_session, "_manager", None)]
+    managers += list(getattr(http_session, "_proxy_managers", dict()).values())
+
+    requests, connections = 0, 0
+    for manager in managers:
+        if manager is None:
+            continue
+        for key in manager.pools.keys():
+            pool = manager.pools.get(key)
+            if pool is not None:
+                requests += pool.num_requests
+                connections += pool.num_connections
+    return requests, connections
+
+
+_registry = ClientRegistry()
+
+
+def get_client(service_name):
+    return _registry.client(service_name)
+
+
+def client_stats():
+    return _registry.stats()
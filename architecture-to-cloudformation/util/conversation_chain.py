@@ -1,11 +1,17 @@
 import streamlit as st
 
-from botocore.exceptions import EventStreamError
-from boto3.session import Session
-
-import time
-import random
-
+from util.clients import get_client
+from util.code_fence import read_code_block
+from util.examples import code_example_blocks, update_example_blocks
+from util.prompt_cache import (
+    CACHE_POINT,
+    has_cache_points,
+    mark_prompt_cache_unsupported,
+    record_prompt_cache_usage,
+    strip_cache_points,
+    supports_prompt_cache,
+)
+from util.streaming import StreamRenderer
 from util.prompt_templates.code_prompt import CODE_PROMPT
 from util.prompt_templates.explain_prompt import EXPLAIN_PROMPT
 from util.prompt_templates.sys_code_prompt import SYS_CODE_PROMPT
@@ -13,13 +19,15 @@ from util.prompt_templates.sys_explain_prompt import SYS_EXPLAIN_PROMPT
 from util.prompt_templates.sys_update_prompt import SYS_UPDATE_PROMPT
 
 def invoke_model(
-    modelId, inference_params, messages, system_prompt, data_placeholder=None
+    modelId, inference_params, messages, system_prompt, data_placeholder=None, extract_code=False
 ):
-    bedrock = Session().client(
-        service_name="bedrock-runtime",
-    )
-    result = str()
-    response = bedrock.converse_stream(
+    bedrock = get_client("bedrock-runtime")
+    renderer = StreamRenderer(render=_placeholder_writer(data_placeholder))
+
+    if has_cache_points(messages) and not supports_prompt_cache(modelId):
+        messages = strip_cache_points(messages)
+
+    request = dict(
         modelId=modelId,
         messages=messages,
         system=[{"text": system_prompt}],
@@ -30,48 +38,69 @@ def invoke_model(
         },
         additionalModelRequestFields={"top_k": inference_params["top_k"]},
     )
-
+    try:
+        response = bedrock.converse_stream(**request)
+    except bedrock.exceptions.ValidationException:
+        if not has_cache_points(messages):
+            raise
+        # The model does not support prompt caching, send the same prompt without checkpoints.
+        request["messages"] = strip_cache_points(messages)
+        response = bedrock.converse_stream(**request)
+        mark_prompt_cache_unsupported(modelId)
+
+    usage = dict()
+    extractor = None
     stream = response.get("stream")
-    if stream:
+    if stream and extract_code:
+        # The stream is closed once the YAML code block ends, the prose after it is never waited for.
+        extractor, stats = read_code_block(stream, on_delta=renderer.write)
+        usage = stats["usage"]
+        print(
+            f"Code block of {stats['output_tokens']} output tokens in {stats['wall_ms']:.0f} ms, "
+            f"stopped at the end of the code block: {stats['stopped_early']}"
+        )
+    elif stream:
         for event in stream:
 
             if "contentBlockDelta" in event:
-                result += event["contentBlockDelta"]["delta"]["text"]
-                with data_placeholder.container():
-                    st.write(result)
-
+                renderer.write(event["contentBlockDelta"]["delta"]["text"])
+            elif "metadata" in event:
+                usage = event["metadata"].get("usage", dict())
+
+    result = renderer.close()
+    if extractor is not None:
+        # Only the template is kept, the preamble streamed before it is dropped from the placeholder.
+        template = "```yaml\n" + extractor.template() + "\n```"
+        if template != result and data_placeholder is not None:
+            _placeholder_writer(data_placeholder)(template)
+        result = template
+
+    record_prompt_cache_usage(modelId, usage)
+    print(
+        f"Streamed {renderer.deltas} deltas in {renderer.flushes} redraws, "
+        f"cache read {usage.get('cacheReadInputTokens', 0)} / write {usage.get('cacheWriteInputTokens', 0)} tokens"
+    )
     return result
 
 
-def backoff_mechanism(
-    func, modelId, inference_params, messages, system_prompt, data_placeholder=None
-):
-    MAX_RETRIES = 5  # Maximum number of retries
-    INITIAL_DELAY = 1  # Initial delay in seconds
-    MAX_DELAY = 60  # Maximum delay in second
-
-    delay = INITIAL_DELAY
-    retries = 0
-
-    while retries < MAX_RETRIES:
-        try:
-            return func(
-                modelId=modelId,
-                inference_params=inference_params,
-                messages=messages,
-                system_prompt=system_prompt,
-                data_placeholder=data_placeholder,
-            )
-        except EventStreamError as e:
-            print(f"Retry {retries + 1}/{MAX_RETRIES}: {e}")
-            time.sleep(delay + random.uniform(0, 1))  # Add a random jitter
-            delay = min(delay * 2, MAX_DELAY)
-            retries += 1
+def _placeholder_writer(data_placeholder):
+    if data_placeholder is None:
+        return None
+
+    def render(text):
+        with data_placeholder.container():
+            st.write(text)
+
+    return render
 
 
 class ConvoChain:
 
-    def get_explain_messages(self, image, image_type):
+    def __init__(self, prompt_cache=False):
+        # Appends a cachePoint after the static few-shot prefix when prompt caching is enabled.
+        self._cache_point = (CACHE_POINT,) if prompt_cache else tuple()
+
+    def get_explain_messages(self, image_bytes, image_type):
         messages = list()
 
         messages.append(
@@ -83,7 +112,7 @@ class ConvoChain:
                         "image": {
                             "format": image_type,
                             "source": {
-                                "bytes": image.getvalue(),
+                                "bytes": image_bytes,
                             },
                         }
                     },
@@ -93,10 +122,6 @@ class ConvoChain:
 
         return SYS_EXPLAIN_PROMPT, messages
 
-    def read_examples(self, file_path):
-        with open(file_path, "r") as template_file:
-            return template_file.read()
-
     def get_code_messages(self, explain):
         messages = list()
 
@@ -104,30 +129,8 @@ class ConvoChain:
             {
                 "role": "user",
                 "content": [
-                    {
-                        "text": f"""
-                    Take this example CloudFormation YAML code as reference:
-                        <example1>
-                            {self.read_examples("data/examples/example1.yaml")}
-                        </example1>      
-                    """,
-                    },
-                    {
-                        "text": f"""
-                    Take this example CloudFormation YAML code as reference:
-                        <example2>
-                            {self.read_examples("data/examples/example2.yaml")}
-                        </example2>
-                    """,
-                    },
-                    {
-                        "text": f"""
-                    Take this example CloudFormation YAML code as reference:
-                        <example3>
-                            {self.read_examples("data/examples/example3.yaml")}
-                        </example3>
-                    """,
-                    },
+                    *code_example_blocks(),
+                    *self._cache_point,
                     {"text": CODE_PROMPT.replace("{{ explain }}", explain)},
                 ],
             }
@@ -142,30 +145,8 @@ class ConvoChain:
             {
                 "role": "user",
                 "content": [
-                    {
-                        "text": f"""
-                    Take this example CloudFormation YAML code as a refernce <example1></example1>:
-                        <example1>
-                            {self.read_examples("data/examples/example1.yaml")}
-                        </example1>      
-                    """,
-                    },
-                    {
-                        "text": f"""
-                    Take this example CloudFormation YAML code as a refernce <example2></example2>:
-                        <example2>
-                            {self.read_examples("data/examples/example2.yaml")}
-                        </example2>
-                    """,
-                    },
-                    {
-                        "text": f"""
-                    Take this example CloudFormation YAML code as a refernce <example3></example3>:
-                        <example3>
-                            {self.read_examples("data/examples/example3.yaml")}
-                        </example3>
-                    """,
-                    },
+                    *update_example_blocks(),
+                    *self._cache_point,
                     {
                         "text": f"Step-by-step explaination of Architecture Diagram \n <explain> {explain} </explain>",
                     },
@@ -0,0 +1,83 @@
+import os
+import textwrap
+import threading
+import time
+
+EXAMPLES_DIR = "data/examples"
+EXAMPLE_FILES = ("example1.yaml", "example2.yaml", "example3.yaml")
+CHECK_INTERVAL = 30  # Minimum seconds between two mtime checks of the example files
+
+
+class ExampleStore:
+    """
+    Process-wide store of the few-shot example templates.
+
+    The example YAMLs are read and normalised once, and the Converse content blocks for the code and update
+    prompts are prebuilt as tuples. Callers share the same block dicts and must not mutate them.
+    The files are re-read only when their mtime changes, checked at most once every CHECK_INTERVAL seconds.
+    """
+
+    def __init__(self, directory=EXAMPLES_DIR, files=EXAMPLE_FILES, check_interval=CHECK_INTERVAL):
+        self._lock = threading.Lock()
+        self._paths = tuple(os.path.join(directory, file) for file in files)
+        self._check_interval = check_interval
+        self._checked = None
+        self._mtimes = None
+        self._code_blocks = tuple()
+        self._update_blocks = tuple()
+
+    def code_blocks(self):
+        self._refresh()
+        return self._code_blocks
+
+    def update_blocks(self):
+        self._refresh()
+        return self._update_blocks
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._checked is not None and now - self._checked < self._check_interval:
+            return
+
+        with self._lock:
+            if self._checked is not None and now - self._checked < self._check_interval:
+                return
+
+            mtimes = tuple(os.stat(path).st_mtime_ns for path in self._paths)
+            if mtimes != self._mtimes:
+                examples = [_read_example(path) for path in self._paths]
+                self._code_blocks = tuple(
+                    {
+                        "text": f"Take this example CloudFormation YAML code as reference:\n"
+                        f"<example{idx}>\n{example}\n</example{idx}>"
+                    }
+                    for idx, example in enumerate(examples, start=1)
+                )
+                self._update_blocks = tuple(
+                    {
+                        "text": f"Take this example CloudFormation YAML code as a refernce <example{idx}></example{idx}>:\n"
+                        f"<example{idx}>\n{example}\n</example{idx}>"
+                    }
+                    for idx, example in enumerate(examples, start=1)
+                )
+                self._mtimes = mtimes
+            self._checked = now
+
+
+def _read_example(path):
+    with open(path, "r") as template_file:
+        template = template_file.read()
+
+    lines = [line.rstrip() for line in textwrap.dedent(template).splitlines()]
+    return "\n".join(lines).strip()
+
+
+_store = ExampleStore()
+
+
+def code_example_blocks():
+    return _store.code_blocks()
+
+
+def update_example_blocks():
+    return _store.update_blocks()
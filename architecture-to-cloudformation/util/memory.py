@@ -0,0 +1,69 @@
+TOKEN_BUDGET = 24000  # Input tokens available to the conversation, excluding the system prompt
+CHARS_PER_TOKEN = 4  # Rough character to token ratio used to estimate message sizes
+SUMMARY_CHARS = 300  # Characters kept per collapsed update instruction
+
+
+class ConversationMemory:
+    """
+    Token-budgeted sliding window over the update conversation.
+
+    The stored history is [explain, initial template, instruction, template, ...]. The prompt always keeps
+    the first user message (examples and explanation) and the latest template, then adds the most recent
+    (template, instruction) turns while they fit in the budget. Older turns are collapsed into a compact list
+    of the instructions already applied. Stored messages are referenced, never copied or mutated.
+    """
+
+    def __init__(self, token_budget=TOKEN_BUDGET):
+        self._token_budget = token_budget
+
+    def window(self, messages, update_instructions):
+        explain_message, templates = messages[0], messages[1::2]
+        instructions = messages[2::2]
+
+        new_message = {"role": "user", "content": [{"text": update_instructions}]}
+        budget = (
+            self._token_budget
+            - _estimate_tokens(explain_message)
+            - _estimate_tokens(new_message)
+            - _estimate_tokens(templates[-1])
+        )
+
+        # templates[first:] and instructions[first:] stay verbatim, instructions[:first] are collapsed.
+        first = len(templates) - 1
+        while first > 0:
+            cost = _estimate_tokens(templates[first - 1]) + _estimate_tokens(instructions[first - 1])
+            if cost > budget:
+                break
+            budget -= cost
+            first -= 1
+
+        if first:
+            explain_message = {
+                "role": explain_message["role"],
+                "content": [
+                    *explain_message["content"],
+                    {"text": _summarise(instructions[:first])},
+                ],
+            }
+
+        window = [explain_message, templates[first]]
+        for instruction, template in zip(instructions[first:], templates[first + 1 :]):
+            window += [instruction, template]
+        window.append(new_message)
+
+        return window
+
+
+def _estimate_tokens(message):
+    return sum(len(block.get("text", "")) for block in message["content"]) // CHARS_PER_TOKEN
+
+
+def _summarise(instructions):
+    lines = list()
+    for idx, message in enumerate(instructions, start=1):
+        text = " ".join(message["content"][0]["text"].split())
+        if len(text) > SUMMARY_CHARS:
+            text = text[:SUMMARY_CHARS] + "..."
+        lines.append(f"{idx}. {text}")
+
+    return "Update instructions already applied to the CloudFormation template:\n" + "\n".join(lines)
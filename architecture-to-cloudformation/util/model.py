@@ -1,31 +1,58 @@
 import streamlit as st
 
-from util.conversation_chain import ConvoChain, backoff_mechanism, invoke_model
-
-import copy
+from util.conversation_chain import ConvoChain, invoke_model
+from util.explain_cache import get_explain_cache
+from util.image_util import preprocess_upload
+from util.memory import TOKEN_BUDGET, ConversationMemory
+from util.resilience import RetryError, get_resilience
+from util.prompt_templates.explain_prompt import EXPLAIN_PROMPT
+from util.prompt_templates.sys_explain_prompt import SYS_EXPLAIN_PROMPT
 
 class Model:
-    def __init__(self, inference_params, modelId) -> None:
-        self._chain = ConvoChain()
+    def __init__(
+        self, inference_params, modelId, prompt_cache=False, memory_token_budget=TOKEN_BUDGET
+    ) -> None:
+        self._chain = ConvoChain(prompt_cache=prompt_cache)
+        self._memory = ConversationMemory(token_budget=memory_token_budget)
         self._inference_params = inference_params
         self._modelId = modelId
 
     def invoke_explain_model(self, image, image_type, data_placeholder):
+        # The upload is downscaled and re-encoded once, its format supersedes image_type.
+        image_bytes, image_type = preprocess_upload(image)
+
+        # The same diagram is explained once per model and inference parameters, then served from the cache.
+        explain_cache = get_explain_cache()
+        key = explain_cache.key(
+            image_bytes,
+            image_type,
+            self._modelId,
+            self._inference_params,
+            (SYS_EXPLAIN_PROMPT, EXPLAIN_PROMPT),
+        )
+        explain = explain_cache.get(key)
 
-        system_prompt, messages = self._chain.get_explain_messages(image, image_type)
-
-        # print("###### Explain ######")
-        # print(messages)
-        # print("###### Explain ######")
+        if explain is not None:
+            with data_placeholder.container():
+                st.write(explain)
+        else:
+            system_prompt, messages = self._chain.get_explain_messages(image_bytes, image_type)
+
+            # print("###### Explain ######")
+            # print(messages)
+            # print("###### Explain ######")
+
+            explain = self._call_model(
+                modelId=self._modelId,
+                inference_params=self._inference_params,
+                messages=messages,
+                system_prompt=system_prompt,
+                data_placeholder=data_placeholder,
+            )
+            if explain:
+                explain_cache.put(key, explain)
 
-        explain = backoff_mechanism(
-            func=invoke_model,
-            modelId=self._modelId,
-            inference_params=self._inference_params,
-            messages=messages,
-            system_prompt=system_prompt,
-            data_placeholder=data_placeholder,
-        )
+        print(f"Explain cache {explain_cache.stats()}")
 
         if "explain" in st.session_state:
             del st.session_state["explain"]
@@ -41,14 +68,16 @@ class Model:
             st.session_state["explain"]
         )
 
-        initial_cfn_code = backoff_mechanism(
-            func=invoke_model,
+        initial_cfn_code = self._call_model(
             modelId=self._modelId,
             inference_params=self._inference_params,
             messages=messages,
             system_prompt=system_prompt,
             data_placeholder=data_placeholder,
+            extract_code=True,
         )
+        if initial_cfn_code is None:
+            return
 
         if not self.check_memory():
             st.session_state["system_prompt"], st.session_state["messages"] = (
@@ -61,10 +90,9 @@ class Model:
 
         # model = self._chain.get_llm()
 
-        messages = copy.deepcopy(st.session_state["messages"])
-        
-        messages.append(
-            {"role": "user", "content": [{"text": update_instructions + "\n\n" + "Do not return examples or explaination, only return the generated CloudFormation YAML template encapsulated between triple backticks (``` ```). Skip the preamble. Think step-by-step."}]}
+        messages = self._memory.window(
+            st.session_state["messages"],
+            update_instructions + "\n\n" + "Do not return examples or explaination, only return the generated CloudFormation YAML template encapsulated between triple backticks (``` ```). Skip the preamble. Think step-by-step.",
         )
         st.session_state["messages"].append(
             {"role": "user", "content": [{"text": update_instructions}]}
@@ -74,19 +102,34 @@ class Model:
         # print( st.session_state["memory"])
         # print("###### update ######")
 
-        cfn_code = backoff_mechanism(
-            func=invoke_model,
+        cfn_code = self._call_model(
             modelId=self._modelId,
             inference_params=self._inference_params,
             messages=messages,
             system_prompt=st.session_state["system_prompt"],
             data_placeholder=data_placeholder,
+            extract_code=True,
         )
+        if cfn_code is None:
+            # Drop the instruction so the conversation memory keeps alternating user and assistant turns.
+            st.session_state["messages"].pop()
+            return
 
         st.session_state["messages"].append(
             {"role": "assistant", "content": [{"text": cfn_code}]}
         )
 
+    def _call_model(self, **kwargs):
+        # Rate limit, retries and circuit breaker are shared by every session of the app process.
+        bedrock = get_resilience("bedrock")
+        try:
+            return bedrock.call(invoke_model, **kwargs)
+        except RetryError as ex:
+            st.error(f"Amazon Bedrock call was unsuccessful: {ex}")
+            return None
+        finally:
+            print(f"Bedrock call {bedrock.last_call()}")
+
     def clear_memory(self):
         if self.check_memory():
             del st.session_state["messages"]
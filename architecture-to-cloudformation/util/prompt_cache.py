@@ -0,0 +1,74 @@
+import threading
+
+CACHE_POINT = {"cachePoint": {"type": "default"}}
+
+
+class PromptCacheUsage:
+    """
+    Process-wide record of Bedrock prompt caching.
+
+    Tracks the models that rejected cachePoint blocks, so later requests to them are sent without checkpoints,
+    and sums the cache read/write tokens reported in the converse_stream metadata usage.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._unsupported = set()
+        self._usage = dict()
+
+    def supports(self, modelId):
+        return modelId not in self._unsupported
+
+    def mark_unsupported(self, modelId):
+        with self._lock:
+            self._unsupported.add(modelId)
+
+    def record(self, modelId, usage):
+        with self._lock:
+            totals = self._usage.setdefault(
+                modelId,
+                {"calls": 0, "inputTokens": 0, "cacheReadInputTokens": 0, "cacheWriteInputTokens": 0},
+            )
+            totals["calls"] += 1
+            for key in ("inputTokens", "cacheReadInputTokens", "cacheWriteInputTokens"):
+                totals[key] += usage.get(key, 0)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "unsupported": sorted(self._unsupported),
+                "usage": {modelId: dict(totals) for modelId, totals in self._usage.items()},
+            }
+
+
+def has_cache_points(messages):
+    return any("cachePoint" in block for message in messages for block in message["content"])
+
+
+def strip_cache_points(messages):
+    return [
+        {
+            "role": message["role"],
+            "content": [block for block in message["content"] if "cachePoint" not in block],
+        }
+        for message in messages
+    ]
+
+
+_usage = PromptCacheUsage()
+
+
+def supports_prompt_cache(modelId):
+    return _usage.supports(modelId)
+
+
+def mark_prompt_cache_unsupported(modelId):
+    _usage.mark_unsupported(modelId)
+
+
+def record_prompt_cache_usage(modelId, usage):
+    _usage.record(modelId, usage)
+
+
+def prompt_cache_stats():
+    return _usage.stats()